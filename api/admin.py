@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Track, Genre, PlayHistory, Notification
+from django.db.models import Q
+from . import search
+from .models import User, Track, Genre, PlayHistory, Notification, IsrcAssignment
 
 
 @admin.register(User)
@@ -37,6 +39,7 @@ class TrackAdmin(admin.ModelAdmin):
     list_display = ('title', 'artist', 'genre', 'status', 'lyrics_status', 'isrc', 'play_count', 'created_at')
     list_filter = ('status', 'lyrics_status', 'genre', 'created_at')
     search_fields = ('title', 'artist__email', 'artist__display_name', 'isrc')
+    list_select_related = ('artist', 'genre')
     ordering = ('-created_at',)
     readonly_fields = ('id', 'created_at', 'updated_at', 'play_count')
     
@@ -47,6 +50,14 @@ class TrackAdmin(admin.ModelAdmin):
         ('Status & Metadata', {'fields': ('status', 'isrc', 'play_count', 'admin_notes')}),
         ('Timestamps', {'fields': ('created_at', 'updated_at')}),
     )
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of LIKE '%...%' scans over the text
+        # fields; artist emails are not indexed, so they keep a partial match
+        if not search_term.strip() or not search.enabled():
+            return super().get_search_results(request, queryset, search_term)
+        matches = Q(id__in=search.matching_ids(search_term)) | Q(artist__email__icontains=search_term.strip())
+        return queryset.filter(matches), False
 
 
 @admin.register(PlayHistory)
@@ -54,6 +65,7 @@ class PlayHistoryAdmin(admin.ModelAdmin):
     list_display = ('track', 'listener', 'played_at', 'ip_address')
     list_filter = ('played_at',)
     search_fields = ('track__title', 'listener__email')
+    list_select_related = ('track__artist', 'listener')
     ordering = ('-played_at',)
     readonly_fields = ('played_at',)
 
@@ -63,5 +75,16 @@ class NotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'notification_type', 'title', 'is_read', 'created_at')
     list_filter = ('notification_type', 'is_read', 'created_at')
     search_fields = ('user__email', 'title', 'message')
+    list_select_related = ('user',)
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+
+
+@admin.register(IsrcAssignment)
+class IsrcAssignmentAdmin(admin.ModelAdmin):
+    list_display = ('isrc', 'track', 'assigned_by', 'assigned_at')
+    list_filter = ('assigned_at',)
+    search_fields = ('isrc', 'track__title')
+    list_select_related = ('track__artist', 'assigned_by')
+    ordering = ('-assigned_at',)
+    readonly_fields = ('isrc', 'track', 'assigned_by', 'assigned_at')
@@ -0,0 +1,252 @@
+"""
+Admission control and load shedding.
+
+``AdmissionControlMiddleware`` sorts requests into endpoint classes by URL
+name (``ROUTES``; anything unlisted is ``default``). Each class has its own
+concurrency ``LIMIT`` and a wait queue of at most ``QUEUE`` requests, so a
+spike of expensive requests (listing every track, uploads, password hashing
+at login) fills only its own class and cannot starve cheap ones such as
+``health_check`` or ``record_play``. A request that finds its queue full, or
+waits longer than ``TIMEOUT`` seconds, is turned away at once with ``503`` and
+``Retry-After`` instead of tying up a worker.
+
+Classes may also have a per-client token bucket (``RATE`` requests per second,
+bursts of ``BURST``), keyed by client address; a client over its rate gets
+``429``. Behind a reverse proxy listed in ``TRUSTED_PROXIES`` (addresses or
+networks) the client address is taken from the proxy's ``X-Real-IP`` or
+``X-Forwarded-For`` header; otherwise every client would share the proxy's
+bucket. Limits, queues, buckets and counters are per process. ``snapshot``
+reports them (``GET /api/admin/admission/``).
+
+Slots are held while the view runs; a streamed response body is sent after
+its slot is released.
+"""
+import ipaddress
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+DEFAULT_CLASS = 'default'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CLASSES': {
+        'critical': {'LIMIT': None},
+        'auth': {'LIMIT': 4, 'QUEUE': 16, 'TIMEOUT': 2.0, 'RATE': 0.2, 'BURST': 10},
+        'heavy': {'LIMIT': 4, 'QUEUE': 16, 'TIMEOUT': 5.0},
+        DEFAULT_CLASS: {'LIMIT': 32, 'QUEUE': 64, 'TIMEOUT': 5.0},
+    },
+    'ROUTES': {
+        'health_check': 'critical',
+        'record_play': 'critical',
+        'record_play_batch': 'critical',
+        'notification_stream': 'critical',
+        'user_login': 'auth',
+        'user_register': 'auth',
+        'forgot_password': 'auth',
+        'upload_music': 'heavy',
+        'upload_chunk': 'heavy',
+        'finalize_upload': 'heavy',
+        'get_all_tracks': 'heavy',
+        'get_pending_tracks': 'heavy',
+        'get_track_play_series': 'heavy',
+        'get_artist_play_series': 'heavy',
+        'get_genre_play_series': 'heavy',
+        'assign_isrcs': 'heavy',
+        'bulk_update_track_status': 'heavy',
+    },
+    'MAX_CLIENTS': 10000,
+    'TRUSTED_PROXIES': [],
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ADMISSION_CONTROL', {})}
+
+
+class Gate:
+    """At most ``limit`` holders at once, with at most ``queue`` callers waiting for a slot"""
+
+    def __init__(self, limit, queue=0, timeout=0):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """True once a slot is held; False if the queue is full or the wait timed out"""
+        with self._condition:
+            if self.limit is None or (self.active < self.limit and not self.waiting):
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                ready = self._condition.wait_for(lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if not ready:
+                self.timed_out += 1
+                return False
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'queue': self.queue,
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+class TokenBuckets:
+    """Per-client token buckets refilled at ``rate`` per second up to ``burst``, for the most recent clients"""
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, client):
+        """0 if the client may proceed, else seconds until it may"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[client] = (tokens - 1 if not wait else tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            if wait:
+                self.limited += 1
+            return wait
+
+    def snapshot(self):
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'clients': len(self._buckets), 'limited': self.limited}
+
+
+class Controller:
+    """The gates and buckets of every endpoint class, built from one configuration"""
+
+    def __init__(self, config):
+        self.config = config
+        self.routes = config['ROUTES']
+        self.proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in config['TRUSTED_PROXIES']]
+        self.gates = {}
+        self.buckets = {}
+        for name, options in config['CLASSES'].items():
+            self.gates[name] = Gate(options.get('LIMIT'), options.get('QUEUE', 0), options.get('TIMEOUT', 0))
+            if options.get('RATE'):
+                self.buckets[name] = TokenBuckets(options['RATE'], options.get('BURST', 1), config['MAX_CLIENTS'])
+
+    def classify(self, path):
+        try:
+            url_name = resolve(path).url_name
+        except Resolver404:
+            return DEFAULT_CLASS
+        name = self.routes.get(url_name, DEFAULT_CLASS)
+        return name if name in self.gates else DEFAULT_CLASS
+
+    def is_proxy(self, address):
+        try:
+            address = ipaddress.ip_address(address.strip())
+        except ValueError:
+            return False
+        return any(address in network for network in self.proxies)
+
+    def client_address(self, request):
+        """The client's address, as reported by a trusted proxy if the request came through one"""
+        address = request.META.get('REMOTE_ADDR', '')
+        if not self.is_proxy(address):
+            return address
+        real_ip = request.META.get('HTTP_X_REAL_IP', '').strip()
+        if real_ip:
+            return real_ip
+        # Nearest hop that is not one of our proxies; earlier entries are client-supplied
+        for hop in reversed(request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')):
+            if hop.strip() and not self.is_proxy(hop):
+                return hop.strip()
+        return address
+
+    def snapshot(self):
+        return {
+            name: {**gate.snapshot(), **({'rate_limit': self.buckets[name].snapshot()} if name in self.buckets else {})}
+            for name, gate in self.gates.items()
+        }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """The process's controller, rebuilt (with fresh counters) when the configuration changes"""
+    global _controller
+    config = get_config()
+    with _controller_lock:
+        if _controller is None or _controller.config != config:
+            _controller = Controller(config)
+        return _controller
+
+
+def snapshot():
+    return get_controller().snapshot()
+
+
+def _refuse(status, error, retry_after):
+    response = JsonResponse({'error': error}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        controller = get_controller()
+        if not controller.config['ENABLED']:
+            return self.get_response(request)
+
+        name = controller.classify(request.path_info)
+        buckets = controller.buckets.get(name)
+        if buckets is not None:
+            wait = buckets.take(controller.client_address(request))
+            if wait:
+                return _refuse(429, 'Too many requests, slow down', wait)
+
+        gate = controller.gates[name]
+        if not gate.acquire():
+            return _refuse(503, 'Server is busy, retry shortly', gate.timeout or 1)
+        try:
+            return self.get_response(request)
+        finally:
+            gate.release()
@@ -0,0 +1,158 @@
+"""
+Cold archival for PlayHistory.
+
+Plays older than ``PLAY_ARCHIVE['RETENTION_DAYS']`` are copied into gzip'd
+JSON-lines segment files under ``PLAY_ARCHIVE['DIR']/YYYY/MM/DD/`` and then
+deleted from the live table, one bounded batch at a time.
+
+A segment file is written under a temporary name and renamed into place, and
+only becomes part of the archive once a ``PlayArchiveSegment`` row for it is
+committed in the same transaction that deletes its plays. A crash at any point
+therefore leaves each play either live or archived, never both; files without
+a manifest row are orphans that ``remove_orphans`` cleans up.
+
+Only plays already folded into the rollups (at or below the rollup watermark)
+are archived, so archiving never changes analytics. Once recommendations have
+been built, plays must also be below their watermark.
+"""
+import gzip
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PlayArchiveSegment, PlayHistory, RollupWatermark
+from .recommendations import WATERMARK as RECOMMENDATIONS_WATERMARK
+from .rollups import WATERMARK
+
+DEFAULTS = {
+    'DIR': os.path.join(settings.BASE_DIR, 'var', 'play_archive'),
+    'RETENTION_DAYS': 90,
+    'BATCH_SIZE': 5000,
+}
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+FIELDS = ('id', 'track_id', 'listener_id', 'played_at', 'ip_address', 'user_agent')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PLAY_ARCHIVE', {})}
+
+
+def _write_segment(root, day, rows):
+    """Write ``rows`` to a new segment file for ``day``; returns its path relative to ``root``"""
+    relative = os.path.join(f'{day:%Y}', f'{day:%m}', f'{day:%d}', f'{uuid.uuid4().hex}{SEGMENT_SUFFIX}')
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    partial = f'{path}.partial'
+    with open(partial, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            for row in rows:
+                record = dict(row, track_id=str(row['track_id']), played_at=row['played_at'].isoformat())
+                archive.write((json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+    return relative
+
+
+def archive_batch(cutoff, batch_size, root):
+    """Archive up to ``batch_size`` plays older than ``cutoff``; returns the number archived"""
+    watermarks = dict(
+        RollupWatermark.objects.filter(name__in=[WATERMARK, RECOMMENDATIONS_WATERMARK])
+        .values_list('name', 'last_play_id')
+    )
+    rolled_up = min(watermarks.get(WATERMARK, 0), watermarks.get(RECOMMENDATIONS_WATERMARK, float('inf')))
+    rows = list(
+        PlayHistory.objects.filter(played_at__lt=cutoff, id__lte=rolled_up)
+        .order_by('id')
+        .values(*FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+
+    by_day = defaultdict(list)
+    for row in rows:
+        by_day[row['played_at'].date()].append(row)
+
+    segments = []
+    for day, day_rows in sorted(by_day.items()):
+        segments.append(PlayArchiveSegment(
+            day=day,
+            path=_write_segment(root, day, day_rows),
+            first_play_id=day_rows[0]['id'],
+            last_play_id=day_rows[-1]['id'],
+            play_count=len(day_rows),
+        ))
+
+    with transaction.atomic():
+        PlayArchiveSegment.objects.bulk_create(segments)
+        PlayHistory.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive(retention_days=None, batch_size=None, max_batches=None):
+    """Move plays older than the retention window into the archive; returns the number moved"""
+    config = get_config()
+    retention_days = config['RETENTION_DAYS'] if retention_days is None else retention_days
+    batch_size = batch_size or config['BATCH_SIZE']
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size, config['DIR'])
+        if not count:
+            break
+        moved += count
+        batches += 1
+    return moved
+
+
+def iter_segment(path):
+    """Yield the plays stored in one segment file as dicts"""
+    with gzip.open(os.path.join(get_config()['DIR'], path), 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            record = json.loads(line)
+            record['played_at'] = parse_datetime(record['played_at'])
+            yield record
+
+
+def iter_archived_plays(start=None, end=None):
+    """
+    Yield every archived play whose day falls in ``start``..``end`` (inclusive,
+    either may be None), ordered by day.
+    """
+    segments = PlayArchiveSegment.objects.order_by('day', 'first_play_id')
+    if start is not None:
+        segments = segments.filter(day__gte=start)
+    if end is not None:
+        segments = segments.filter(day__lte=end)
+    for path in segments.values_list('path', flat=True).iterator():
+        yield from iter_segment(path)
+
+
+def remove_orphans(grace=3600):
+    """Delete segment files with no manifest row (left by a crashed run); returns how many"""
+    root = get_config()['DIR']
+    if not os.path.isdir(root):
+        return 0
+
+    known = set(PlayArchiveSegment.objects.values_list('path', flat=True))
+    cutoff = time.time() - grace
+    removed = 0
+    for directory, _dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            if os.path.relpath(path, root) in known or os.path.getmtime(path) > cutoff:
+                continue
+            os.remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,120 @@
+"""
+JWT authentication that resolves users from an in-process cache.
+
+simplejwt's ``JWTAuthentication`` loads the ``User`` row on every request.
+``CachedJWTAuthentication`` keeps recently seen users in a bounded LRU cache
+for up to ``TTL`` seconds, keyed by user id and the user's version stamp, so
+a request with a valid token usually costs no authentication queries.
+
+The stamp lives in Django's cache (``CACHES``) and is replaced whenever the
+user row is saved or deleted (see ``api.signals``), except by saves that only
+touch ``last_login``. A profile edit, deactivation or password change
+therefore makes the next request reload the user, which rechecks
+``is_active``. With a shared cache backend (e.g. Redis) every process sees the
+new stamp at once; with the default per-process ``LocMemCache`` other
+processes pick the change up within ``TTL``. Code that changes users with
+``QuerySet.update()`` bypasses the signal and should call ``bump``.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+DEFAULTS = {
+    'TTL': 60,
+    'MAX_USERS': 10000,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+
+def stamp_key(user_id):
+    return f'auth-user-stamp:{user_id}'
+
+
+def stamp(user_id):
+    """The user's current version stamp"""
+    key = stamp_key(user_id)
+    value = cache.get(key)
+    if value is None:
+        # Never set or evicted: a fresh stamp invalidates whatever was cached under the old one
+        cache.add(key, uuid.uuid4().hex, None)
+        value = cache.get(key)
+    return value
+
+
+def bump(user_id):
+    """Make every process reload the user on its next authenticated request"""
+    cache.set(stamp_key(user_id), uuid.uuid4().hex, None)
+    user_cache.discard(user_id)
+
+
+class UserCache:
+    """Bounded LRU map from user id to ``(stamp, expires, user)``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id, current_stamp):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != current_stamp or entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, user_id, current_stamp, user, config=None):
+        config = config or get_config()
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = (current_stamp, time.monotonic() + config['TTL'], user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > config['MAX_USERS']:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that takes users from ``user_cache`` while their stamp is unchanged"""
+
+    def get_user(self, validated_token):
+        config = get_config()
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if not config['TTL'] or user_id is None:
+            # Disabled, or let simplejwt reject the token
+            return super().get_user(validated_token)
+
+        current_stamp = stamp(user_id)
+        user = user_cache.get(user_id, current_stamp)
+        if user is None:
+            # Raises for unknown and inactive users, which are therefore never cached
+            user = super().get_user(validated_token)
+            user_cache.put(user_id, current_stamp, user, config)
+        # A copy, so views that modify request.user do not touch the cached instance
+        return copy.copy(user)
@@ -0,0 +1,350 @@
+"""
+In-process prefix autocomplete for approved track titles, artist names and
+genres, ranked by play count.
+
+Each process holds an immutable ``PrefixIndex`` per kind: every word-start
+suffix of every normalized name ("blue moon" is found by "blu" and by "moo")
+is a key in a sorted fixed-width NumPy byte array, so a prefix is two ``searchsorted``
+calls and the best entries of the range come from ``argpartition`` over a
+parallel score array. The top entries for every one- and two-character
+prefix, whose ranges are huge, are precomputed.
+
+Edits reach the index without a rebuild: signal handlers in ``api.signals``
+append a ``CatalogChange`` row, and every ``REFRESH_SECONDS`` the process
+reloads only the entities changed since its watermark (the last change id it
+saw that is older than ``SETTLE_SECONDS``, so one committed late behind a
+higher id is not skipped) into a small overlay index that shadows the base. The overlay is folded
+into a new base, without touching the database, once it grows past
+``MERGE_THRESHOLD``. A full rebuild every ``REBUILD_SECONDS`` picks up play
+count drift and anything written with bulk updates.
+
+Merges and periodic rebuilds run in a background thread and swap the new base
+in when it is ready, so no request waits for them; requests keep using the
+previous base meanwhile. Only the very first request of a process builds the
+index itself, and requests arriving while it does get no suggestions rather
+than queueing behind it.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .models import CatalogChange, Genre, Track, User
+
+DEFAULTS = {
+    'REFRESH_SECONDS': 2,
+    'REBUILD_SECONDS': 15 * 60,
+    # Overlay size (per kind) at which it is folded into the base index
+    'MERGE_THRESHOLD': 2000,
+    'CHANGE_RETENTION_SECONDS': 2 * 3600,
+    # Changes younger than this are read again on the next refresh (see apply_changes)
+    'SETTLE_SECONDS': 60,
+    'MAX_LIMIT': 20,
+}
+
+KINDS = ('track', 'artist', 'genre')
+KEY_BYTES = 24
+PRECOMPUTED_PREFIX = 2
+PRECOMPUTED_TOP = 64
+MAX_WORD_KEYS = 6
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AUTOCOMPLETE', {})}
+
+
+def normalize(text):
+    """Case-folded, accent-free words joined by single spaces"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in stripped).split())
+
+
+def entry_keys(label):
+    """Encoded keys for each word start of ``label``"""
+    words = normalize(label).split(' ')
+    keys = []
+    for start in range(min(len(words), MAX_WORD_KEYS)):
+        key = ' '.join(words[start:]).encode('utf-8')[:KEY_BYTES]
+        if key:
+            keys.append(key)
+    return keys
+
+
+class PrefixIndex:
+    """Immutable sorted-array index over ``[(kind, id, label, score)]`` entries"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        keys, owners = [], []
+        for position, (_, _, label, _) in enumerate(entries):
+            for key in entry_keys(label):
+                keys.append(key)
+                owners.append(position)
+
+        scores = np.array([entry[3] for entry in entries], dtype=np.int64)
+        order = np.argsort(np.array(keys, dtype=f'S{KEY_BYTES}'), kind='stable') if keys else np.zeros(0, dtype=np.int64)
+        self.keys = np.array(keys, dtype=f'S{KEY_BYTES}')[order]
+        self.owners = np.array(owners, dtype=np.int32)[order]
+        self.key_scores = scores[self.owners] if len(entries) else np.zeros(0, dtype=np.int64)
+        self.top = self._precompute()
+
+    def _precompute(self):
+        top = {}
+        for length in range(1, PRECOMPUTED_PREFIX + 1):
+            # Truncating the sorted keys lists each distinct prefix without a Python loop over keys
+            for prefix in np.unique(self.keys.astype(f'S{length}')).tolist():
+                top[prefix] = self._scan(prefix, PRECOMPUTED_TOP)
+        return top
+
+    def _scan(self, prefix, count):
+        low = np.searchsorted(self.keys, prefix, side='left')
+        if len(prefix) >= KEY_BYTES:
+            high = np.searchsorted(self.keys, prefix, side='right')
+        else:
+            # 0xff never occurs in UTF-8, so this sorts after every key with the prefix
+            high = np.searchsorted(self.keys, prefix + b'\xff', side='left')
+        if high <= low:
+            return []
+        scores = self.key_scores[low:high]
+        # Over-fetch: an entry can own several keys in one range
+        fetch = min(len(scores), count * 2)
+        if fetch < len(scores):
+            best = np.argpartition(-scores, fetch - 1)[:fetch]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        seen = {}
+        for position in self.owners[low + best].tolist():
+            seen.setdefault(position, None)
+            if len(seen) == count:
+                break
+        return list(seen)
+
+    def search(self, prefix, count):
+        """Entry positions matching encoded ``prefix``, best first"""
+        if len(prefix) <= PRECOMPUTED_PREFIX and count <= PRECOMPUTED_TOP:
+            return self.top.get(prefix, [])[:count]
+        return self._scan(prefix[:KEY_BYTES], count)
+
+
+class Autocomplete:
+    """Per-kind base indexes plus an overlay of entities changed since they were built"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.base = None
+        self.overlay = {}
+        self.overlay_index = {}
+        self.watermark = 0
+        self.refreshed_at = 0.0
+        self.rebuilt_at = 0.0
+        self.worker = None
+
+    def load(self, kind, ids=None):
+        """``{id: (kind, id, label, score)}`` for the current entities of ``kind``"""
+        if kind == 'track':
+            rows = Track.objects.filter(status='approved').values_list('id', 'title', 'play_count')
+        elif kind == 'artist':
+            rows = (
+                User.objects.filter(user_type='artist').exclude(display_name='')
+                .annotate(plays=Sum('tracks__play_count', filter=Q(tracks__status='approved')))
+                .values_list('id', 'display_name', 'plays')
+            )
+        else:
+            rows = (
+                Genre.objects.annotate(plays=Sum('track__play_count', filter=Q(track__status='approved')))
+                .values_list('id', 'name', 'plays')
+            )
+        if ids is not None:
+            rows = rows.filter(id__in=ids)
+        return {str(pk): (kind, str(pk), label, score or 0) for pk, label, score in rows.iterator()}
+
+    def build(self):
+        """``(base, watermark)`` freshly loaded from the database"""
+        config = get_config()
+        watermark = CatalogChange.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=config['SETTLE_SECONDS'])
+        ).aggregate(last=Max('id'))['last'] or 0
+        base = {kind: PrefixIndex(list(self.load(kind).values())) for kind in KINDS}
+
+        retention = config['CHANGE_RETENTION_SECONDS']
+        CatalogChange.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention)).delete()
+        return base, watermark
+
+    def _install(self, base, watermark):
+        # Changes after the watermark are read again into a fresh overlay
+        self.base, self.overlay, self.overlay_index = base, {}, {}
+        self.watermark = watermark
+        self.rebuilt_at = self.refreshed_at = time.monotonic()
+
+    def rebuild(self):
+        """Reload everything from the database"""
+        base, watermark = self.build()
+        with self.lock:
+            self._install(base, watermark)
+
+    def merge(self, kinds):
+        """Fold the overlays of ``kinds`` into new base indexes"""
+        with self.lock:
+            base, overlay = self.base, self.overlay
+        merged = {}
+        for kind in kinds:
+            entries = {entry[1]: entry for entry in base[kind].entries}
+            for object_id, entry in overlay[kind].items():
+                if entry is None:
+                    entries.pop(object_id, None)
+                else:
+                    entries[object_id] = entry
+            merged[kind] = PrefixIndex(list(entries.values()))
+
+        with self.lock:
+            if self.base is not base:
+                # Rebuilt meanwhile, which covers everything merged here
+                return
+            new_base, new_overlay = dict(self.base), dict(self.overlay)
+            for kind, index in merged.items():
+                new_base[kind] = index
+                # Keep what changed again while merging
+                folded = overlay[kind]
+                new_overlay[kind] = {
+                    object_id: entry for object_id, entry in self.overlay[kind].items()
+                    if object_id not in folded or folded[object_id] is not entry
+                }
+            self.base, self.overlay, self.overlay_index = new_base, new_overlay, overlay_indexes(new_overlay)
+
+    def apply_changes(self):
+        """
+        Reload entities changed since the watermark into the overlay; returns
+        how many changes were read. Call with ``lock`` held.
+        """
+        changes = list(
+            CatalogChange.objects.filter(id__gt=self.watermark).order_by('id')
+            .values_list('id', 'kind', 'object_id', 'created_at')
+        )
+        self.refreshed_at = time.monotonic()
+        if not changes:
+            return 0
+
+        changed = {}
+        for _, kind, object_id, _ in changes:
+            changed.setdefault(kind, set()).add(object_id)
+        overlay = {kind: dict(entries) for kind, entries in self.overlay.items()}
+        for kind, ids in changed.items():
+            current = self.load(kind, ids)
+            entries = overlay.setdefault(kind, {})
+            for object_id in ids:
+                # None hides a base entry that was deleted or no longer qualifies
+                entries[object_id] = current.get(object_id)
+
+        self.overlay, self.overlay_index = overlay, overlay_indexes(overlay)
+        # Ids are taken at insert but visible at commit: only move past changes
+        # old enough that every lower id has committed, and re-read the rest
+        settled = timezone.now() - timedelta(seconds=get_config()['SETTLE_SECONDS'])
+        for change_id, _, _, created_at in changes:
+            if created_at >= settled:
+                break
+            self.watermark = change_id
+
+        threshold = get_config()['MERGE_THRESHOLD']
+        oversized = [kind for kind, entries in overlay.items() if len(entries) > threshold]
+        if oversized:
+            self.start(self.merge, oversized)
+        return len(changes)
+
+    def start(self, task, *args):
+        """Run ``task`` in the background unless a task already is; call with ``lock`` held"""
+        if self.worker is not None and self.worker.is_alive():
+            return False
+
+        def run():
+            try:
+                task(*args)
+            finally:
+                connections.close_all()
+
+        self.worker = threading.Thread(target=run, name='autocomplete', daemon=True)
+        self.worker.start()
+        return True
+
+    def wait(self):
+        """Wait for the background task, if any, to finish"""
+        worker = self.worker
+        if worker is not None:
+            worker.join()
+
+    def refresh(self, force=False):
+        """Bring the index up to date when due, without making other requests wait for it"""
+        config = get_config()
+        now = time.monotonic()
+        if self.base is not None and not force and now - self.refreshed_at < config['REFRESH_SECONDS']:
+            return
+        if not self.lock.acquire(blocking=force):
+            return
+        try:
+            if self.base is None or force:
+                # Nothing to serve from yet (or asked to): build here
+                self._install(*self.build())
+            elif now - self.rebuilt_at >= config['REBUILD_SECONDS'] and self.start(self.rebuild):
+                # Not due again while this one runs
+                self.rebuilt_at = now
+            else:
+                self.apply_changes()
+        finally:
+            self.lock.release()
+
+    def suggest(self, text, limit=10, kinds=KINDS):
+        """Best ``limit`` entries of ``kinds`` with a word starting with ``text``"""
+        self.refresh()
+        prefix = normalize(text).encode('utf-8')
+        if not prefix:
+            return []
+        # Local references: a concurrent refresh swaps these wholesale
+        base, overlay, overlay_index = self.base, self.overlay, self.overlay_index
+        if base is None:
+            # Another request is still building the first index
+            return []
+
+        candidates = []
+        for kind in kinds:
+            hidden = overlay.get(kind, {})
+            index = base[kind]
+            for position in index.search(prefix, limit + len(hidden)):
+                entry = index.entries[position]
+                if entry[1] not in hidden:
+                    candidates.append(entry)
+            if kind in overlay_index:
+                recent = overlay_index[kind]
+                candidates.extend(recent.entries[position] for position in recent.search(prefix, limit))
+
+        best = heapq.nlargest(limit, candidates, key=lambda entry: entry[3])
+        return [{'type': kind, 'id': object_id, 'label': label, 'score': score} for kind, object_id, label, score in best]
+
+
+def overlay_indexes(overlay):
+    return {
+        kind: PrefixIndex([entry for entry in entries.values() if entry is not None])
+        for kind, entries in overlay.items() if entries
+    }
+
+
+index = Autocomplete()
+
+
+def record_change(kind, object_id):
+    """Queue an entity for the next incremental refresh of every process's index"""
+    CatalogChange.objects.create(kind=kind, object_id=str(object_id))
+
+
+def record_changes(kind, object_ids):
+    """``record_change`` for many entities, for bulk writes that bypass signals"""
+    CatalogChange.objects.bulk_create(
+        [CatalogChange(kind=kind, object_id=str(object_id)) for object_id in object_ids], batch_size=1000,
+    )
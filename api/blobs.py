@@ -0,0 +1,131 @@
+"""
+Content-addressed storage for uploaded audio and cover art.
+
+Files are stored once per SHA-256 under ``<prefix>/<hash[:2]>/<hash><ext>``
+and described by a ``Blob`` row whose ``ref_count`` is the number of file
+fields pointing at it. Storing content that already exists only bumps the
+count: nothing is written. ``release`` (called from the post_save/post_delete
+handlers in ``api.signals``) drops a reference and deletes the file once the
+last one is gone. ``manage.py verify_blobs`` re-hashes stored files and
+recounts references.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Blob, Track
+
+BLOCK_SIZE = 256 * 1024
+
+# Track file fields stored through this module
+TRACK_FIELDS = ('audio_file', 'cover_art')
+
+
+def hash_file(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks(BLOCK_SIZE):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(prefix, sha256, filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return f'{prefix}/{sha256[:2]}/{sha256}{ext}'
+
+
+def store(file, prefix, sha256=None):
+    """
+    Store ``file`` by content and take a reference to it.
+
+    Returns ``(blob, created)``; ``created`` is False when identical content
+    was already stored, in which case nothing is written. ``sha256`` may be
+    passed when the caller has already hashed the file.
+    """
+    sha256 = sha256 or hash_file(file)
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is not None:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+            blob.ref_count += 1
+            return blob, False
+
+        name = blob_name(prefix, sha256, file.name)
+        # A file left behind by an interrupted store already holds this content
+        if not default_storage.exists(name):
+            name = default_storage.save(name, file)
+        try:
+            with transaction.atomic():
+                blob = Blob.objects.create(sha256=sha256, name=name, size=file.size, ref_count=1)
+        except IntegrityError:
+            # Lost a race with a concurrent store of the same content
+            if name != blob_name(prefix, sha256, file.name):
+                default_storage.delete(name)
+            return store(file, prefix, sha256)
+    return blob, True
+
+
+def release(name):
+    """Drop one reference to the blob stored as ``name``; no-op for files stored before blobs"""
+    if not name:
+        return
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+    transaction.on_commit(lambda: _delete_unreferenced(name))
+
+
+def _delete_unreferenced(name):
+    # Re-check: the same content may have been stored again since
+    if not Blob.objects.filter(name=name).exists():
+        default_storage.delete(name)
+
+
+def count_references():
+    """``{name: references}`` from the Track file fields"""
+    counts = {}
+    for field in TRACK_FIELDS:
+        for name in Track.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True):
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def verify(repair=False):
+    """
+    Re-hash every blob and recount references.
+
+    Yields ``(blob, problem)`` for each blob whose file is missing or does not
+    match its hash, or whose ``ref_count`` is wrong. With ``repair``, wrong
+    counts are fixed and unreferenced blobs removed; corrupt or missing files
+    are only reported.
+    """
+    references = count_references()
+    for blob in Blob.objects.order_by('sha256').iterator():
+        actual = references.get(blob.name, 0)
+        if actual != blob.ref_count:
+            yield blob, f'ref_count is {blob.ref_count}, {actual} references found'
+            if repair:
+                if actual:
+                    Blob.objects.filter(pk=blob.pk).update(ref_count=actual)
+                else:
+                    blob.delete()
+                    default_storage.delete(blob.name)
+                    continue
+
+        if not default_storage.exists(blob.name):
+            yield blob, 'file is missing'
+            continue
+        with default_storage.open(blob.name, 'rb') as stored:
+            if hash_file(stored) != blob.sha256:
+                yield blob, 'content does not match sha256'
+                continue
+        Blob.objects.filter(pk=blob.pk).update(verified_at=timezone.now())
@@ -0,0 +1,191 @@
+"""
+Push delivery of new notifications as Server-Sent Events.
+
+``Notification`` rows are published when their transaction commits (see
+``api.signals``) to the configured backend, which hands them to the ``Hub``
+of every process that has streams open. The hub fans each event out to the
+asyncio queues of that user's connected streams, so an open stream costs no
+queries until something happens.
+
+The backend is pluggable through ``NOTIFICATION_EVENTS['BACKEND']``: any class
+taking a ``deliver(user_id, event)`` callable and providing
+``publish(user_id, event)``. ``LocalBackend`` delivers within the publishing
+process, which is enough when the API runs as a single ASGI process; a
+cross-process backend (e.g. Redis pub/sub) publishes to its bus and calls
+``deliver`` from a listener thread.
+
+Event ids are notification ids. A client that reconnects with
+``Last-Event-ID`` first gets the notifications it missed from the database.
+A stream whose queue overflows is closed, so the client reconnects and
+catches up the same way.
+
+A stream is authorized once, when it opens, so it also ends when the access
+token it was opened with expires or the user's authentication stamp changes
+(deactivation, password change, profile edit; see ``api.authentication``),
+checked at every event and heartbeat. The client then reconnects with a
+fresh token and resumes from ``Last-Event-ID``.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import authentication
+from .models import Notification
+
+DEFAULTS = {
+    'BACKEND': 'api.events.LocalBackend',
+    'HEARTBEAT_SECONDS': 15,
+    'RETRY_MS': 3000,
+    'BACKLOG_LIMIT': 100,
+    'QUEUE_SIZE': 100,
+}
+
+# Queued in place of events a slow stream could not keep up with
+RESYNC = object()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'NOTIFICATION_EVENTS', {})}
+
+
+class Hub:
+    """In-process fan-out from user ids to the queues of their open streams"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        """A queue receiving the user's events; call from the stream's event loop"""
+        queue = asyncio.Queue(maxsize=get_config()['QUEUE_SIZE'])
+        with self._lock:
+            self._subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def connected(self, user_id):
+        with self._lock:
+            return len(self._subscribers.get(user_id, ()))
+
+    def deliver(self, user_id, event):
+        """Queue ``event`` for each of the user's streams; safe to call from any thread"""
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC)
+
+
+class LocalBackend:
+    """Delivers events to streams in the publishing process only"""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+
+hub = Hub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(get_config()['BACKEND'])(hub.deliver)
+        return _backend
+
+
+def serialize(notification):
+    return {
+        'id': notification.id,
+        'notification_type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'track': str(notification.track_id) if notification.track_id else None,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def publish(notification):
+    get_backend().publish(notification.user_id, serialize(notification))
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def _backlog(user_id, last_id, limit):
+    return [
+        serialize(notification)
+        for notification in Notification.objects.filter(user_id=user_id, id__gt=last_id).order_by('id')[:limit]
+    ]
+
+
+async def stream(user_id, last_id=None, expires_at=None, auth_stamp=None):
+    """
+    SSE lines for a user's notifications after ``last_id`` (if given), then live
+    ones, until ``expires_at`` (a Unix time) or until the user's
+    authentication stamp is no longer ``auth_stamp``
+    """
+    config = get_config()
+    # Subscribe before reading the backlog so nothing created in between is missed
+    queue = hub.subscribe(user_id)
+    try:
+        yield f"retry: {config['RETRY_MS']}\n\n"
+        if last_id is not None:
+            backlog = await sync_to_async(_backlog)(user_id, last_id, config['BACKLOG_LIMIT'])
+            for event in backlog:
+                yield format_event(event)
+                last_id = event['id']
+            if len(backlog) == config['BACKLOG_LIMIT']:
+                # More to catch up on: the client resumes from here on reconnect
+                return
+
+        while True:
+            timeout = config['HEARTBEAT_SECONDS']
+            if expires_at is not None:
+                timeout = max(0, min(timeout, expires_at - time.time()))
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                event = None
+            if expires_at is not None and time.time() >= expires_at:
+                return
+            if auth_stamp is not None and await sync_to_async(authentication.stamp)(user_id) != auth_stamp:
+                return
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            if event is RESYNC:
+                return
+            if last_id is not None and event['id'] <= last_id:
+                continue
+            last_id = event['id']
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(user_id, queue)
@@ -0,0 +1,252 @@
+"""
+Acoustic fingerprints for spotting re-encoded or trimmed copies of tracks.
+
+A fingerprint is a set of landmark hashes: the audio is resampled to 8 kHz,
+the strongest spectral peak in each of a few frequency bands is kept where it
+dominates its neighbourhood in time, and each peak is paired with the next
+few peaks after it. A pair's two frequencies and time gap pack into one
+integer hash that survives re-encoding, resampling and gain changes; the
+anchor's frame number is kept alongside it.
+
+The full fingerprint is stored packed in ``TrackFingerprint``. A deterministic
+sample of its hashes goes into the ``FingerprintHash`` inverted index, so
+finding similar tracks is a handful of indexed ``hash IN (...)`` lookups
+followed by offset-alignment voting in Python: a copy trimmed at either end
+still lines up at a single offset difference, while chance hash collisions
+scatter. Matches are computed when a track is fingerprinted and their ids and
+scores stored on ``Track.fingerprint_matches``; the admin review queue reads
+the matched tracks' details when it shows them (``resolve_matches``).
+"""
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import jobs
+from .models import FingerprintHash, Track, TrackFingerprint
+from .processing import decode_blocks
+
+DEFAULTS = {
+    # Index one hash in INDEX_SAMPLING (by value, so copies sample alike)
+    'INDEX_SAMPLING': 4,
+    'MIN_MATCHES': 8,
+    'TOP_K': 5,
+    'MAX_SECONDS': 20 * 60,
+    'QUERY_HASHES': 1000,
+}
+
+SAMPLE_RATE = 8000
+FRAME = 1024
+HOP = 512
+# Band edges in FFT bins (~8 Hz each at 8 kHz / 1024)
+BANDS = (5, 20, 40, 80, 160, 320, 512)
+PEAK_NEIGHBOURHOOD = 5
+FAN_OUT = 3
+MAX_DT = 63
+QUERY_CHUNK = 500
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FINGERPRINT', {})}
+
+
+def _resample(path, max_seconds):
+    """Mono float32 samples at exactly SAMPLE_RATE, first ``max_seconds`` only"""
+    parts = []
+    rate = None
+    remainder = np.zeros(0, dtype=np.float32)
+    total = 0
+    for rate, block in decode_blocks(path):
+        # Box-filter decimation to just above SAMPLE_RATE keeps memory small
+        step = max(1, int(rate // SAMPLE_RATE))
+        block = np.concatenate([remainder, block])
+        usable = len(block) - len(block) % step
+        remainder = block[usable:]
+        parts.append(block[:usable].reshape(-1, step).mean(axis=1))
+        total += usable
+        if total >= max_seconds * rate:
+            break
+    if not parts:
+        return np.zeros(0, dtype=np.float32)
+
+    decimated = np.concatenate(parts)
+    source_rate = rate / max(1, int(rate // SAMPLE_RATE))
+    duration = min(len(decimated) / source_rate, max_seconds)
+    times = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.interp(times, np.arange(len(decimated)) / source_rate, decimated).astype(np.float32)
+
+
+def _peaks(samples):
+    """``(frame, bin)`` pairs of spectral peaks, sorted by frame"""
+    if len(samples) < FRAME:
+        return np.zeros((0, 2), dtype=np.int64)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME)[::HOP]
+    spectrum = np.log1p(np.abs(np.fft.rfft(frames * np.hanning(FRAME).astype(np.float32), axis=1)))
+
+    # Strongest bin per band per frame
+    bins = np.stack([
+        spectrum[:, low:high].argmax(axis=1) + low for low, high in zip(BANDS, BANDS[1:])
+    ], axis=1)
+    values = np.take_along_axis(spectrum, bins, axis=1)
+
+    # Keep a band maximum only where it also dominates nearby frames and is
+    # above the frame's typical level
+    padded = np.pad(values, ((PEAK_NEIGHBOURHOOD, PEAK_NEIGHBOURHOOD), (0, 0)), constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_NEIGHBOURHOOD + 1, axis=0).max(axis=2)
+    keep = (values >= local_max) & (values > spectrum.mean(axis=1, keepdims=True))
+
+    frame_index, band_index = np.nonzero(keep)
+    return np.stack([frame_index, bins[frame_index, band_index]], axis=1)
+
+
+def _landmarks(peaks):
+    """``(hash, anchor frame)`` uint32 pairs from each peak and the next FAN_OUT peaks"""
+    pairs = []
+    count = len(peaks)
+    for fan in range(1, FAN_OUT + 1):
+        if count <= fan:
+            break
+        anchor, target = peaks[:-fan], peaks[fan:]
+        dt = target[:, 0] - anchor[:, 0]
+        valid = (dt > 0) & (dt <= MAX_DT)
+        hashes = (anchor[valid, 1] << 16) | (target[valid, 1] << 6) | dt[valid]
+        pairs.append(np.stack([hashes, anchor[valid, 0]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.uint32)
+    return np.unique(np.concatenate(pairs), axis=0).astype(np.uint32)
+
+
+def fingerprint_file(path, max_seconds=DEFAULTS['MAX_SECONDS']):
+    """Packed fingerprint (``(hash, frame)`` uint32 pairs) of an audio file"""
+    return _landmarks(_peaks(_resample(path, max_seconds))).tobytes()
+
+
+def unpack(data):
+    return np.frombuffer(bytes(data), dtype=np.uint32).reshape(-1, 2)
+
+
+def sampled(landmarks, sampling):
+    return landmarks[landmarks[:, 0] % sampling == 0]
+
+
+def store(track, data):
+    """Replace the track's fingerprint and its inverted-index postings"""
+    config = get_config()
+    index = sampled(unpack(data), config['INDEX_SAMPLING'])
+    with transaction.atomic():
+        TrackFingerprint.objects.update_or_create(track=track, defaults={'data': data, 'hash_count': len(data) // 8})
+        FingerprintHash.objects.filter(track=track).delete()
+        FingerprintHash.objects.bulk_create(
+            (FingerprintHash(hash=int(h), track=track, offset=int(o)) for h, o in index),
+            batch_size=1000,
+        )
+
+
+def similar(track_id, data, k=None, min_matches=None):
+    """
+    Top ``k`` tracks sharing time-aligned landmarks with fingerprint ``data``,
+    as ``[(track_id, matches, score)]`` where score is the fraction of the
+    query's indexed hashes that line up.
+    """
+    config = get_config()
+    k = k or config['TOP_K']
+    min_matches = config['MIN_MATCHES'] if min_matches is None else min_matches
+
+    query = sampled(unpack(data), config['INDEX_SAMPLING'])
+    offsets = defaultdict(list)
+    for h, o in query:
+        offsets[int(h)].append(int(o))
+    if not offsets:
+        return []
+    hashes = sorted(offsets)
+    if len(hashes) > config['QUERY_HASHES']:
+        hashes = hashes[::len(hashes) // config['QUERY_HASHES'] + 1]
+
+    votes = defaultdict(Counter)
+    for start in range(0, len(hashes), QUERY_CHUNK):
+        postings = (
+            FingerprintHash.objects.filter(hash__in=hashes[start:start + QUERY_CHUNK])
+            .exclude(track_id=track_id)
+            .values_list('track_id', 'hash', 'offset')
+        )
+        for other, h, offset in postings:
+            for own in offsets[h]:
+                votes[other][offset - own] += 1
+
+    queried = sum(len(offsets[h]) for h in hashes)
+    ranked = sorted(
+        ((other, counts.most_common(1)[0][1]) for other, counts in votes.items()),
+        key=lambda item: -item[1],
+    )
+    return [(other, matches, round(min(matches / queried, 1.0), 3)) for other, matches in ranked[:k] if matches >= min_matches]
+
+
+def find_matches(track, data):
+    """
+    Similar tracks as the JSON stored on ``Track.fingerprint_matches``: ids and
+    scores only, since the matched tracks belong to other artists and their
+    details change (see ``resolve_matches``)
+    """
+    return [
+        {'id': str(other), 'matches': matches, 'score': score}
+        for other, matches, score in similar(track.id, data)
+    ]
+
+
+def resolve_matches(tracks):
+    """
+    ``{track id: matches}`` for ``tracks``, each stored match completed with the
+    matched track's current title, artist name, status and ISRC, in one query.
+    Matches whose track has since been deleted are left out.
+    """
+    wanted = {match['id'] for track in tracks for match in track.fingerprint_matches or ()}
+    rows = Track.objects.filter(id__in=wanted).values_list('id', 'title', 'artist__display_name', 'status', 'isrc')
+    found = {
+        str(other): {'title': title, 'artist': artist, 'status': status, 'isrc': isrc}
+        for other, title, artist, status, isrc in (rows if wanted else ())
+    }
+    return {
+        track.id: [
+            {**match, **found[match['id']]} for match in track.fingerprint_matches or () if match['id'] in found
+        ]
+        for track in tracks
+    }
+
+
+def save_matches(track, data):
+    store(track, data)
+    Track.objects.filter(id=track.id).update(fingerprint_matches=find_matches(track, data))
+
+
+@jobs.register('fingerprint_track')
+class FingerprintTrack:
+    """Fingerprint a track, index it and record its likely duplicates"""
+
+    def prepare(self, job):
+        track = Track.objects.filter(id=job.payload['track_id']).only('audio_file', 'audio_sha256').first()
+        if track is None:
+            return None
+        # Identical audio already fingerprinted: reuse it instead of decoding again
+        if track.audio_sha256:
+            twin = (
+                TrackFingerprint.objects.filter(track__audio_sha256=track.audio_sha256)
+                .exclude(track_id=track.id)
+                .values_list('data', flat=True)
+                .first()
+            )
+            if twin is not None:
+                save_matches(track, bytes(twin))
+                return None
+        return track.audio_file.path, get_config()['MAX_SECONDS']
+
+    compute = staticmethod(fingerprint_file)
+
+    def finish(self, job, result):
+        track = Track.objects.filter(id=job.payload['track_id']).first()
+        if track is not None:
+            save_matches(track, result)
+
+
+def enqueue_track(track):
+    return jobs.enqueue('fingerprint_track', {'track_id': str(track.id)})
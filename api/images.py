@@ -0,0 +1,317 @@
+"""
+Resized cover art and profile pictures.
+
+After an image is uploaded, an ``image_derivatives`` job renders every size in
+``IMAGE_DERIVATIVES['SIZES']`` in every format in ``FORMATS`` from a single
+decode, in the worker's process pool, and records the SHA-256 of the original
+on the row. Derivatives are named ``<hash prefix>-<size>.<ext>``: the name
+changes whenever the image does, so they are served with a one-year
+``immutable`` Cache-Control, and identical uploads share files.
+
+Derivatives live in a disk cache capped at ``CACHE_MAX_BYTES``; the least
+recently used files are evicted first. A request for a derivative that is
+missing (never rendered, or evicted) renders just that one on demand.
+
+Enforcing the cap means scanning the whole cache, so each process keeps a
+running count of the cache's size and only scans once that count passes the
+cap, or ``SWEEP_SECONDS`` after its last scan to pick up what other
+processes wrote. The cache can therefore overshoot by what other processes
+write in between.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from . import jobs
+from .models import Track, User
+
+DEFAULTS = {
+    # Under MEDIA_ROOT so AUDIO_STREAM_OFFLOAD can hand derivatives to the front-end server
+    'DIR': None,
+    'SIZES': {'thumb': 96, 'small': 256, 'medium': 512, 'large': 1024},
+    'FORMATS': ('webp', 'jpg'),
+    'QUALITY': 82,
+    'CACHE_MAX_BYTES': 1024 * 1024 * 1024,
+    'SWEEP_SECONDS': 300,
+    'MAX_AGE': 365 * 24 * 3600,
+}
+
+# kind -> (model, image field, hash field)
+SOURCES = {
+    'tracks': (Track, 'cover_art', 'cover_art_hash'),
+    'users': (User, 'profile_picture', 'profile_picture_hash'),
+}
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+PREFIX_LENGTH = 16
+# Only refresh a cache hit's mtime (its LRU position) once it is this stale
+TOUCH_INTERVAL = 3600
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'IMAGE_DERIVATIVES', {})}
+    config['DIR'] = config['DIR'] or os.path.join(settings.MEDIA_ROOT, 'image_cache')
+    return config
+
+
+def variant_name(digest, size, fmt):
+    return f'{digest[:PREFIX_LENGTH]}-{size}.{fmt}'
+
+
+def parse_variant(name):
+    """``(prefix, size, fmt)`` for a valid derivative name, else None"""
+    config = get_config()
+    stem, _, fmt = name.rpartition('.')
+    prefix, _, size = stem.partition('-')
+    if fmt not in config['FORMATS'] or size not in config['SIZES'] or len(prefix) != PREFIX_LENGTH:
+        return None
+    return prefix, size, fmt
+
+
+def cache_path(name, cache_dir=None):
+    return os.path.join(cache_dir or get_config()['DIR'], name[:2], name)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(256 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save(image, path, fmt, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt == 'jpg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    partial = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        image.save(partial, PIL_FORMATS[fmt], quality=quality, optimize=fmt == 'jpg')
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return os.path.getsize(path)
+
+
+def render(source_path, variants, cache_dir, sizes, quality, digest=None):
+    """
+    Decode ``source_path`` once and write each ``(size name, format)`` in
+    ``variants`` that is not already cached, largest first so each
+    resize starts from the previous one.
+
+    Returns ``(digest, bytes written)``. A plain function so it can run in
+    the job worker's process pool.
+    """
+    digest = digest or file_sha256(source_path)
+    pending = [
+        (size, fmt) for size, fmt in variants
+        if not os.path.exists(cache_path(variant_name(digest, size, fmt), cache_dir))
+    ]
+    written = 0
+    if not pending:
+        return digest, written
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for size in sorted({size for size, _ in pending}, key=lambda s: -sizes[s]):
+            image.thumbnail((sizes[size], sizes[size]), Image.LANCZOS)
+            for fmt in (fmt for s, fmt in pending if s == size):
+                written += _save(image, cache_path(variant_name(digest, size, fmt), cache_dir), fmt, quality)
+    return digest, written
+
+
+def enforce_cache_limit(max_bytes=None, cache_dir=None, keep=None):
+    """
+    Delete least recently used derivatives (other than ``keep``, the one
+    about to be served) until the cache fits; returns bytes freed
+    """
+    config = get_config()
+    max_bytes = config['CACHE_MAX_BYTES'] if max_bytes is None else max_bytes
+    cache_dir = cache_dir or config['DIR']
+    freed, remaining = _sweep(max_bytes, cache_dir, keep)
+    usage.scanned(cache_dir, remaining)
+    return freed
+
+
+def _sweep(max_bytes, cache_dir, keep):
+    """``(bytes freed, bytes left)`` after evicting down to ``max_bytes``"""
+    if not os.path.isdir(cache_dir):
+        return 0, 0
+
+    entries = []
+    total = 0
+    for shard in os.scandir(cache_dir):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith('.tmp') or entry.path == keep:
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    freed = 0
+    if total > max_bytes:
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            freed += size
+            if total - freed <= max_bytes:
+                break
+    kept = os.path.getsize(keep) if keep and os.path.exists(keep) else 0
+    return freed, total - freed + kept
+
+
+class CacheUsage:
+    """Each cache directory's size as of its last scan plus what this process has written since"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # cache dir -> [bytes, monotonic time of the last scan]
+        self._dirs = {}
+
+    def scanned(self, cache_dir, size):
+        with self._lock:
+            self._dirs[cache_dir] = [size, time.monotonic()]
+
+    def add(self, written, keep=None):
+        """
+        Count ``written`` new bytes and enforce the limit if the cache may have
+        outgrown it; returns bytes freed
+        """
+        config = get_config()
+        now = time.monotonic()
+        with self._lock:
+            state = self._dirs.get(config['DIR'])
+            if state is not None:
+                state[0] += written
+                if state[0] <= config['CACHE_MAX_BYTES'] and now - state[1] < config['SWEEP_SECONDS']:
+                    return 0
+                # Claimed: other threads keep counting instead of scanning too
+                state[1] = now
+        return enforce_cache_limit(keep=keep)
+
+
+usage = CacheUsage()
+
+
+def touch(path):
+    if time.time() - os.stat(path).st_mtime > TOUCH_INTERVAL:
+        os.utime(path)
+
+
+def urls(request, kind, obj):
+    """``{size: {format: url}}`` for an object's image, or None before it has been processed"""
+    _, field, hash_field = SOURCES[kind]
+    digest = getattr(obj, hash_field)
+    if not digest or not getattr(obj, field):
+        return None
+    config = get_config()
+    base = reverse(f'image_derivative_{kind}', args=[obj.pk, '-'])[:-1]
+    if request is not None:
+        base = request.build_absolute_uri(base)
+    return {
+        size: {fmt: base + variant_name(digest, size, fmt) for fmt in config['FORMATS']}
+        for size in config['SIZES']
+    }
+
+
+def image_changed(kind, obj, hash_known=False):
+    """
+    Schedule derivatives for a new image. ``hash_known`` means the writer set
+    the hash along with the file, so derivatives already cached for identical
+    content are reused; otherwise the stale hash is cleared first.
+    """
+    model, field, hash_field = SOURCES[kind]
+    name = getattr(obj, field).name
+    digest = getattr(obj, hash_field)
+    if hash_known:
+        if is_rendered(digest):
+            return
+    elif digest:
+        setattr(obj, hash_field, '')
+        model.objects.filter(pk=obj.pk).update(**{hash_field: ''})
+    if name:
+        payload = {'kind': kind, 'id': str(obj.pk), 'name': name}
+        transaction.on_commit(lambda: jobs.enqueue('image_derivatives', payload))
+
+
+def is_rendered(digest):
+    config = get_config()
+    return all(
+        os.path.exists(cache_path(variant_name(digest, size, fmt), config['DIR']))
+        for size in config['SIZES'] for fmt in config['FORMATS']
+    )
+
+
+@jobs.register('image_derivatives')
+class ImageDerivatives:
+    """Render every configured size and format, then record the image hash"""
+
+    def prepare(self, job):
+        model, field, _ = SOURCES[job.payload['kind']]
+        obj = model.objects.filter(pk=job.payload['id']).only(field).first()
+        if obj is None or getattr(obj, field).name != job.payload['name']:
+            return None
+        config = get_config()
+        variants = [(size, fmt) for size in config['SIZES'] for fmt in config['FORMATS']]
+        return getattr(obj, field).path, variants, config['DIR'], config['SIZES'], config['QUALITY']
+
+    compute = staticmethod(render)
+
+    def finish(self, job, result):
+        digest, written = result
+        model, field, hash_field = SOURCES[job.payload['kind']]
+        # Skip the hash if the image was replaced again while rendering
+        model.objects.filter(pk=job.payload['id'], **{field: job.payload['name']}).update(**{hash_field: digest})
+        if written:
+            usage.add(written)
+
+
+class CachedFile:
+    """Just enough of a FieldFile for ``streaming.serve_file``"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.relpath(path, settings.MEDIA_ROOT)
+
+
+def derive_on_demand(kind, obj, name):
+    """
+    The cached derivative ``name`` of ``obj``'s image as a ``CachedFile``,
+    rendering it if needed; None if ``name`` is not a current derivative of
+    that image.
+    """
+    _, field, hash_field = SOURCES[kind]
+    digest = getattr(obj, hash_field)
+    parsed = parse_variant(name)
+    if not digest or not getattr(obj, field) or parsed is None or parsed[0] != digest[:PREFIX_LENGTH]:
+        return None
+
+    config = get_config()
+    path = cache_path(name)
+    if os.path.exists(path):
+        touch(path)
+        return CachedFile(path)
+
+    _, size, fmt = parsed
+    try:
+        _, written = render(
+            getattr(obj, field).path, [(size, fmt)], config['DIR'], config['SIZES'], config['QUALITY'], digest=digest,
+        )
+    except FileNotFoundError:
+        return None
+    usage.add(written, keep=path)
+    return CachedFile(path)
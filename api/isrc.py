@@ -0,0 +1,196 @@
+"""
+ISRC allocation.
+
+An ISRC is the registrant prefix (country and registrant code, e.g. ``USABC``),
+a two-digit year and a five-digit designation code. Designation codes come
+from one ``IsrcSequence`` row per prefix and year, but each process reserves
+a block of ``BLOCK_SIZE`` codes at a time and hands them out from memory, so
+concurrent approvals only touch the sequence row once per block. A request
+for more codes than the block holds reserves them all in one go.
+
+A block's unused codes are only kept for later once the transaction that
+reserved it commits; if it rolls back, so does the reservation. Codes left in
+a block when its process exits are never issued, so designation codes can
+have gaps, which ISRCs allow.
+
+Every issued code is recorded in ``IsrcAssignment``. Codes that an admin
+already typed in by hand are skipped.
+"""
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import notifications, response_cache, search
+from .models import IsrcAssignment, IsrcSequence, Notification, Track
+
+DEFAULTS = {
+    'REGISTRANT': '',
+    'BLOCK_SIZE': 100,
+    'ASSIGN_ON_APPROVAL': False,
+}
+
+MAX_DESIGNATION = 99999
+MAX_BATCH = 5000
+REGISTRANT_RE = re.compile(r'^[A-Z]{2}[A-Z0-9]{3}$')
+
+
+class AllocationError(Exception):
+    """No ISRC can be issued (registrant not configured or the year's codes used up)"""
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ISRC', {})}
+
+
+def current_prefix(config=None):
+    """Registrant prefix and year code that codes issued now start with"""
+    registrant = (config or get_config())['REGISTRANT'].upper()
+    if not REGISTRANT_RE.match(registrant):
+        raise AllocationError('ISRC registrant is not configured')
+    return f'{registrant}{timezone.now().year % 100:02d}'
+
+
+def reserve(prefix, count, minimum=None):
+    """Reserve up to ``count`` (at least ``minimum``) designation codes; returns the range ``(first, end)``"""
+    minimum = count if minimum is None else minimum
+    with transaction.atomic():
+        sequence, _ = IsrcSequence.objects.select_for_update().get_or_create(prefix=prefix)
+        available = MAX_DESIGNATION + 1 - sequence.next_designation
+        if available < minimum:
+            raise AllocationError(f'Only {available} ISRC designation codes left for {prefix}')
+        first = sequence.next_designation
+        sequence.next_designation += min(count, available)
+        sequence.save(update_fields=['next_designation'])
+    return first, sequence.next_designation
+
+
+class Allocator:
+    """Hands out codes from a process-local block, reserving a new block when it runs out"""
+
+    def __init__(self):
+        # Reentrant: on_commit runs the keep callback at once outside a transaction
+        self._lock = threading.RLock()
+        self._block = None
+
+    def take(self, count, config=None):
+        """``count`` new ISRCs, in order"""
+        config = config or get_config()
+        prefix = current_prefix(config)
+        with self._lock:
+            codes = []
+            if self._block is not None and self._block[0] == prefix:
+                _, first, end = self._block
+                taken = min(count, end - first)
+                codes.extend(range(first, first + taken))
+                self._block = (prefix, first + taken, end)
+            else:
+                # A new year starts a new sequence
+                self._block = None
+
+            needed = count - len(codes)
+            if needed:
+                first, end = reserve(prefix, max(needed, config['BLOCK_SIZE']), needed)
+                codes.extend(range(first, first + needed))
+                leftover = (prefix, first + needed, end)
+                transaction.on_commit(lambda: self._keep(leftover))
+        return [f'{prefix}{designation:05d}' for designation in codes]
+
+    def _keep(self, block):
+        with self._lock:
+            self._block = block
+
+    def reset(self):
+        with self._lock:
+            self._block = None
+
+
+allocator = Allocator()
+
+
+def issue(tracks, user=None, taken=()):
+    """
+    Give each of ``tracks`` (which must have no ISRC) a new code and record it.
+
+    Sets ``track.isrc`` without saving the tracks; call inside the transaction
+    that saves them. Codes in ``taken`` (e.g. about to be saved on other
+    tracks) are skipped like those already in use.
+    """
+    tracks = list(tracks)
+    codes = []
+    while len(codes) < len(tracks):
+        fresh = allocator.take(len(tracks) - len(codes))
+        in_use = set(Track.objects.filter(isrc__in=fresh).values_list('isrc', flat=True)) | set(taken)
+        codes.extend(code for code in fresh if code not in in_use)
+    for track, code in zip(tracks, codes):
+        track.isrc = code
+    IsrcAssignment.objects.bulk_create(
+        [IsrcAssignment(isrc=track.isrc, track=track, assigned_by=user) for track in tracks], batch_size=1000,
+    )
+
+
+def assignment_notification(track):
+    return Notification(
+        user_id=track.artist_id,
+        notification_type='isrc_assigned',
+        title='ISRC Assigned',
+        message=f'Your track "{track.title}" has been assigned ISRC {track.isrc}.',
+        track=track,
+    )
+
+
+def assign(tracks, user=None):
+    """Issue, save and announce codes for ``tracks`` that have no ISRC yet; returns those tracks"""
+    tracks = [track for track in tracks if not track.isrc]
+    if not tracks:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        issue(tracks, user)
+        for track in tracks:
+            track.updated_at = now
+        Track.objects.bulk_update(tracks, ['isrc', 'updated_at'], batch_size=500)
+        search.index_tracks([track.id for track in tracks])
+        response_cache.bump(*response_cache.track_stamps(tracks))
+        notifications.send([assignment_notification(track) for track in tracks])
+    return tracks
+
+
+def assign_batch(track_ids, user=None):
+    """
+    Assign codes to the tracks named in ``track_ids`` (as submitted), locking
+    them with one query. Returns ``(assigned, results)`` with one result dict
+    per item, in order.
+    """
+    results = []
+    wanted = {}
+    for index, value in enumerate(track_ids):
+        result = {'index': index, 'id': value, 'status': 'error'}
+        results.append(result)
+        try:
+            track_id = uuid.UUID(str(value))
+        except ValueError:
+            result['error'] = 'Invalid track id'
+            continue
+        if track_id in wanted:
+            result['error'] = 'Duplicate track in batch'
+            continue
+        wanted[track_id] = result
+
+    with transaction.atomic():
+        tracks = Track.objects.select_for_update().in_bulk(list(wanted))
+        for track_id, result in wanted.items():
+            track = tracks.get(track_id)
+            if track is None:
+                result['error'] = 'Track not found'
+            elif track.isrc:
+                result.update(error='Track already has an ISRC', isrc=track.isrc)
+        # In submitted order, so codes follow it
+        assigned = assign([tracks[track_id] for track_id in wanted if track_id in tracks], user)
+
+    for track in assigned:
+        wanted[track.id].update(status='assigned', isrc=track.isrc)
+    return len(assigned), results
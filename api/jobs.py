@@ -0,0 +1,229 @@
+"""
+Database-backed background jobs.
+
+Jobs are rows in ``Job``. A worker (``manage.py run_worker``) claims a queued
+job with a conditional ``UPDATE ... WHERE status = 'queued'``, so two workers
+can never both win the same row on any database backend. Each handler splits a
+job into three steps:
+
+- ``prepare(job)`` runs in the worker process and reads whatever it needs from
+  the database; it returns the arguments for ``compute`` (or None to finish the
+  job without doing anything).
+- ``compute(*args)`` is a plain module-level function run in a process pool, so
+  CPU-heavy work never holds the GIL of the process talking to the database.
+- ``finish(job, result)`` runs back in the worker process and saves the result.
+
+A failing job is retried with exponential backoff until ``max_attempts``, then
+marked failed and passed to the handler's ``give_up``. A worker renews the
+lease (``locked_at``) of the jobs it is running on every pass of its loop;
+jobs whose worker died stop being renewed and are re-queued once their lease
+expires. A job's outcome is only recorded while the attempt that reports it
+still holds the job, so a worker that lost its lease cannot overwrite the
+attempt that replaced it.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CONCURRENCY': os.cpu_count() or 1,
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 3,
+    'LEASE_SECONDS': 600,
+    'RETRY_BACKOFF': 30,
+}
+
+HANDLERS = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'JOB_WORKER', {})}
+
+
+def register(kind):
+    """Class decorator registering a job handler for ``kind``"""
+    def decorator(handler_class):
+        HANDLERS[kind] = handler_class()
+        return handler_class
+    return decorator
+
+
+def enqueue(kind, payload, max_attempts=None, delay=0):
+    return Job.objects.create(
+        kind=kind,
+        payload=payload,
+        max_attempts=max_attempts or get_config()['MAX_ATTEMPTS'],
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim(worker_id, kinds):
+    """Atomically take the oldest runnable job of one of ``kinds``, or return None"""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status='queued', run_after__lte=now, kind__in=kinds)
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        won = Job.objects.filter(id=job_id, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now,
+        )
+        if won:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def _held(job):
+    """The job's row, as long as the attempt ``job`` describes still holds it"""
+    return Job.objects.filter(id=job.id, status='running', locked_by=job.locked_by, attempts=job.attempts)
+
+
+def holds(job):
+    return _held(job).exists()
+
+
+def renew(jobs):
+    """Extend the leases of ``jobs`` that their attempts still hold"""
+    now = timezone.now()
+    for job in jobs:
+        _held(job).update(locked_at=now)
+
+
+def complete(job):
+    """Mark the job done; False if its attempt no longer holds it"""
+    if not _held(job).update(status='done', locked_by='', updated_at=timezone.now()):
+        return False
+    job.status = 'done'
+    job.locked_by = ''
+    return True
+
+
+def fail(job, error):
+    """Record a failed attempt; re-queue with backoff or give up for good"""
+    status, run_after = 'failed', job.run_after
+    if job.attempts < job.max_attempts:
+        status = 'queued'
+        run_after = timezone.now() + timedelta(seconds=get_config()['RETRY_BACKOFF'] * 2 ** (job.attempts - 1))
+    if not _held(job).update(
+        status=status, run_after=run_after, last_error=error, locked_by='', updated_at=timezone.now(),
+    ):
+        logger.warning('Job %s attempt %d lost its lease; not recording: %s', job, job.attempts, error)
+        return
+    job.status, job.run_after, job.last_error, job.locked_by = status, run_after, error, ''
+
+    if job.status == 'failed':
+        handler = HANDLERS.get(job.kind)
+        if handler is not None and hasattr(handler, 'give_up'):
+            handler.give_up(job, error)
+
+
+def requeue_expired(lease_seconds=None):
+    """Return jobs held by workers that stopped renewing them to the queue"""
+    lease_seconds = get_config()['LEASE_SECONDS'] if lease_seconds is None else lease_seconds
+    cutoff = timezone.now() - timedelta(seconds=lease_seconds)
+    expired = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    for job in expired:
+        fail(job, 'Lease expired; worker presumed dead')
+
+
+def _finish(job, result=None, error=None):
+    handler = HANDLERS[job.kind]
+    if not holds(job):
+        # Its lease expired and the job was re-queued (or taken by another attempt)
+        logger.warning('Job %s attempt %d lost its lease; discarding its result', job, job.attempts)
+        return
+    try:
+        if error is None:
+            handler.finish(job, result)
+            complete(job)
+            return
+    except Exception:
+        error = traceback.format_exc()
+    logger.warning('Job %s attempt %d failed: %s', job, job.attempts, error)
+    fail(job, error)
+
+
+def run_worker(concurrency=None, poll_interval=None, once=False, inline=False, worker_id=None):
+    """
+    Claim and run jobs until interrupted (or, with ``once``, until the queue
+    is empty). ``inline`` runs ``compute`` in this process instead of a pool.
+    Returns the number of jobs processed.
+    """
+    config = get_config()
+    concurrency = concurrency or config['CONCURRENCY']
+    poll_interval = config['POLL_INTERVAL'] if poll_interval is None else poll_interval
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    kinds = list(HANDLERS)
+
+    # Set up Django in pool processes too, so handlers' compute functions can
+    # be unpickled under the spawn/forkserver start methods
+    executor = None if inline else ProcessPoolExecutor(max_workers=concurrency, initializer=django.setup)
+    in_flight = {}
+    processed = 0
+    try:
+        while True:
+            close_old_connections()
+            renew(in_flight.values())
+            requeue_expired()
+
+            claimed = False
+            while len(in_flight) < concurrency:
+                job = claim(worker_id, kinds)
+                if job is None:
+                    break
+                claimed = True
+                handler = HANDLERS[job.kind]
+                try:
+                    args = handler.prepare(job)
+                except Exception:
+                    _finish(job, error=traceback.format_exc())
+                    processed += 1
+                    continue
+
+                if args is None:
+                    complete(job)
+                    processed += 1
+                elif executor is None:
+                    try:
+                        result = handler.compute(*args)
+                    except Exception:
+                        _finish(job, error=traceback.format_exc())
+                    else:
+                        _finish(job, result)
+                    processed += 1
+                else:
+                    in_flight[executor.submit(handler.compute, *args)] = job
+
+            if in_flight:
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        _finish(job, error=traceback.format_exc())
+                    else:
+                        _finish(job, result)
+                    processed += 1
+            elif not claimed:
+                if once:
+                    return processed
+                time.sleep(poll_interval)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
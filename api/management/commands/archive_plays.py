@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = 'Move plays older than the retention window from PlayHistory into compressed archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help="Retention window (defaults to PLAY_ARCHIVE['RETENTION_DAYS'])")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Plays moved per transaction')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches')
+        parser.add_argument('--remove-orphans', action='store_true',
+                            help='Also delete segment files left behind by interrupted runs')
+
+    def handle(self, *args, **options):
+        moved = archive.archive(
+            retention_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(f'Archived {moved} plays')
+
+        if options['remove_orphans']:
+            removed = archive.remove_orphans()
+            self.stdout.write(f'Removed {removed} orphaned segment files')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Count track co-occurrences in new plays and refresh "listeners also played" neighbours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Plays counted per transaction')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard all counts and recompute them from the live plays')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            recommendations.reset()
+        read = recommendations.run(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Counted co-occurrences in {read} plays')
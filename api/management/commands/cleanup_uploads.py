@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions (and their chunks) idle for longer than the session TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-hours', type=int, default=None,
+                            help="Idle time before a session is removed (defaults to CHUNKED_UPLOADS['SESSION_TTL_HOURS'])")
+
+    def handle(self, *args, **options):
+        removed = uploads.collect_garbage(ttl_hours=options['ttl_hours'])
+        self.stdout.write(f'Removed {removed} stale upload sessions')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api import notifications
+
+
+class Command(BaseCommand):
+    help = 'Mark long-unread notifications read, delete old read ones and optionally recount unread counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-days', type=int, default=None,
+                            help='Delete read notifications older than this (default NOTIFICATIONS READ_RETENTION_DAYS)')
+        parser.add_argument('--unread-days', type=int, default=None,
+                            help='Mark notifications unread for longer than this read (default UNREAD_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Notifications updated or deleted per transaction')
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Also recount every unread counter and report drift')
+
+    def handle(self, *args, **options):
+        marked, deleted = notifications.prune(
+            read_days=options['read_days'], unread_days=options['unread_days'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Marked {marked} stale notifications read, deleted {deleted} old ones')
+        if options['reconcile']:
+            drift = notifications.reconcile()
+            for user_id, (cached, actual) in sorted(drift.items()):
+                self.stdout.write(f'user {user_id}: cached={cached} actual={actual}')
+            self.stdout.write(f'Corrected drift in {len(drift)} counters')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text track search index from the Track table'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild()
+        self.stdout.write(f'Indexed {indexed} tracks')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending scores and charts from the live plays'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=trending.REBUILD_CHUNK,
+                            help='Plays read per query')
+
+    def handle(self, *args, **options):
+        read = trending.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Rebuilt trending charts from {read} plays')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin stats counters and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without correcting it')
+
+    def handle(self, *args, **options):
+        drift = stats.reconcile(dry_run=options['dry_run'])
+        if not drift:
+            self.stdout.write('Counters are consistent')
+            return
+
+        for name, (cached, actual) in sorted(drift.items()):
+            self.stdout.write(f'{name}: cached={cached} actual={actual}')
+        verb = 'Found' if options['dry_run'] else 'Corrected'
+        self.stdout.write(f'{verb} drift in {len(drift)} counters')
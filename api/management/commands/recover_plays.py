@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api import plays
+
+
+class Command(BaseCommand):
+    help = 'Replay play journal segments left behind by crashed workers and prune the ingest ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None,
+                            help='Only replay segments untouched for this many seconds')
+        parser.add_argument('--prune-days', type=int, default=7,
+                            help='Delete ledger entries older than this many days')
+
+    def handle(self, *args, **options):
+        segments, count = plays.recover_segments(grace=options['grace'])
+        self.stdout.write(f'Replayed {count} plays from {segments} journal segments')
+
+        pruned = plays.prune_ledger(days=options['prune_days'])
+        self.stdout.write(f'Pruned {pruned} ledger entries')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new PlayHistory rows into the hourly/daily analytics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=rollups.CHUNK_SIZE,
+                            help='Plays folded per transaction')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the rollups and recompute them from archived and live plays')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            folded = rollups.rebuild(chunk_size=options['chunk_size'])
+        else:
+            folded = rollups.run(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Folded {folded} plays into rollups')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (audio analysis of uploaded tracks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Analysis processes (defaults to JOB_WORKER['CONCURRENCY'])")
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--inline', action='store_true',
+                            help='Run jobs in this process instead of a process pool')
+
+    def handle(self, *args, **options):
+        processed = jobs.run_worker(
+            concurrency=options['concurrency'], once=options['once'], inline=options['inline'],
+        )
+        self.stdout.write(f'Processed {processed} jobs')
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api import routers
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over each SQLite replica (a local stand-in for replication)'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite')
+
+        replicas = [alias for alias in routers.get_config()['REPLICAS'] if connections[alias].vendor == 'sqlite']
+        if not replicas:
+            self.stdout.write('No SQLite replicas configured (set DB_REPLICAS and DB_<ALIAS>_NAME)')
+            return
+
+        primary.ensure_connection()
+        for alias in replicas:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'Copied {primary.settings_dict["NAME"]} to {alias}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api import blobs
+
+
+class Command(BaseCommand):
+    help = 'Re-hash content-addressed audio/cover files and check their reference counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Fix wrong reference counts and remove unreferenced blobs')
+
+    def handle(self, *args, **options):
+        problems = 0
+        for blob, problem in blobs.verify(repair=options['repair']):
+            problems += 1
+            self.stdout.write(f'{blob.name}: {problem}')
+        if problems:
+            self.stdout.write(self.style.WARNING(f'{problems} problems found'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All blobs verified'))
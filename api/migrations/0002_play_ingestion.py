@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayIngestBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(max_length=64, unique=True)),
+                ('play_count', models.PositiveIntegerField(default=0)),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='playhistory',
+            name='played_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_play_ingestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_play_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArtistDailyPlays',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('bucket', models.DateField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_plays', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('artist', 'bucket'), name='unique_artist_daily_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='GenreDailyPlays',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('bucket', models.DateField()),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_plays', to='api.genre')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('genre', 'bucket'), name='unique_genre_daily_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackDailyPlays',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('bucket', models.DateField()),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_plays', to='api.track')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('track', 'bucket'), name='unique_track_daily_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackHourlyPlays',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('bucket', models.DateTimeField()),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_plays', to='api.track')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('track', 'bucket'), name='unique_track_hourly_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_play_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('first_play_id', models.BigIntegerField()),
+                ('last_play_id', models.BigIntegerField()),
+                ('play_count', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='playhistory',
+            options={'verbose_name_plural': 'Play History'},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_media_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='cover_art_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of cover_art (see api.images)', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_picture_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of profile_picture (see api.images)', max_length=64),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackFingerprint',
+            fields=[
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='api.track')),
+                ('data', models.BinaryField()),
+                ('hash_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='fingerprint_matches',
+            field=models.JSONField(blank=True, help_text='Likely duplicates (see api.fingerprint)', null=True),
+        ),
+        migrations.CreateModel(
+            name='FingerprintHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.IntegerField()),
+                ('offset', models.PositiveIntegerField()),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.track')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hash', 'track', 'offset'], name='fingerprint_hash_idx')],
+            },
+        ),
+    ]
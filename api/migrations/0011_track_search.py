@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Full-text index for api.search; other backends use its icontains fallback
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE api_track_fts USING fts5("
+            "title, lyrics, artist, genre, isrc, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS api_track_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='api.track')),
+            ],
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
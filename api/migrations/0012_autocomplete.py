@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_track_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('track', 'Track'), ('artist', 'Artist'), ('genre', 'Genre')], max_length=10)),
+                ('object_id', models.CharField(max_length=36)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_autocomplete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('track_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.track')),
+                ('track_b', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.track')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('track_a', 'track_b'), name='unique_track_cooccurrence')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackNeighbor',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.track')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='api.track')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('track', 'rank'), name='unique_track_neighbor_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Seed the counters from the notifications already stored
+def count_unread(apps, schema_editor):
+    Notification = apps.get_model('api', 'Notification')
+    NotificationCounter = apps.get_model('api', 'NotificationCounter')
+    unread = Notification.objects.filter(is_read=False).values_list('user_id').annotate(n=Count('id')).order_by()
+    NotificationCounter.objects.bulk_create(
+        (NotificationCounter(user_id=user_id, unread=n) for user_id, n in unread), batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_notification_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IsrcSequence',
+            fields=[
+                ('prefix', models.CharField(help_text='Country, registrant and year code', max_length=7, primary_key=True, serialize=False)),
+                ('next_designation', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IsrcAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('isrc', models.CharField(max_length=12, unique=True)),
+                ('assigned_at', models.DateTimeField(auto_now_add=True)),
+                ('assigned_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('track', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='isrc_assignments', to='api.track')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+# Matches used to store copies of the matched tracks' details, including
+# their artists' email addresses; keep only what api.fingerprint stores now
+def strip_match_details(apps, schema_editor):
+    Track = apps.get_model('api', 'Track')
+    tracks = list(Track.objects.exclude(fingerprint_matches=None).only('id', 'fingerprint_matches'))
+    for track in tracks:
+        track.fingerprint_matches = [
+            {'id': match['id'], 'matches': match['matches'], 'score': match['score']}
+            for match in track.fingerprint_matches
+        ]
+    Track.objects.bulk_update(tracks, ['fingerprint_matches'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_isrc_allocator'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_match_details, migrations.RunPython.noop),
+    ]
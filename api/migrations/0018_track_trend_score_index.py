@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_fingerprint_match_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tracktrend',
+            index=models.Index(fields=['score'], name='track_trend_score_idx'),
+        ),
+    ]
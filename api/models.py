@@ -1,9 +1,19 @@
-from django.db import models
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 import uuid
 
 
+def counter_cache_atomic():
+    """Keep a save and its stats counter update (api.signals) in one transaction"""
+    if getattr(settings, 'STATS_COUNTER_CACHE', False):
+        return transaction.atomic()
+    return nullcontext()
+
+
 class User(AbstractUser):
     """Custom user model with artist/listener/admin roles"""
     USER_TYPE_CHOICES = [
@@ -17,6 +27,7 @@ class User(AbstractUser):
     display_name = models.CharField(max_length=100, blank=True)
     bio = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    profile_picture_hash = models.CharField(max_length=64, blank=True, help_text='SHA-256 of profile_picture (see api.images)')
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -25,13 +36,19 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'display_name']
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_type', 'created_at', 'id'], name='user_type_created_idx'),
+        ]
+    
     def __str__(self):
         return self.email
     
     def save(self, *args, **kwargs):
         if not self.username:
             self.username = self.email
-        super().save(*args, **kwargs)
+        with counter_cache_atomic():
+            super().save(*args, **kwargs)
 
 
 class Genre(models.Model):
@@ -69,12 +86,17 @@ class Track(models.Model):
     release_date = models.DateField()
     duration = models.DurationField(blank=True, null=True)
     audio_file = models.FileField(upload_to='audio_files/')
+    audio_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     cover_art = models.ImageField(upload_to='cover_art/', blank=True, null=True)
+    cover_art_hash = models.CharField(max_length=64, blank=True, help_text='SHA-256 of cover_art (see api.images)')
     lyrics = models.TextField(blank=True)
     lyrics_status = models.CharField(max_length=20, choices=LYRICS_STATUS_CHOICES, default='pending')
     isrc = models.CharField(max_length=12, blank=True, null=True, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     play_count = models.PositiveIntegerField(default=0)
+    loudness = models.FloatField(blank=True, null=True, help_text='RMS level in dBFS')
+    waveform_peaks = models.JSONField(blank=True, null=True)
+    fingerprint_matches = models.JSONField(blank=True, null=True, help_text='Likely duplicates (see api.fingerprint)')
     admin_notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -82,15 +104,175 @@ class Track(models.Model):
     def __str__(self):
         return f"{self.title} - {self.artist.display_name or self.artist.email}"
     
+    def save(self, *args, **kwargs):
+        with counter_cache_atomic():
+            super().save(*args, **kwargs)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='track_created_idx'),
+            models.Index(fields=['artist', 'created_at', 'id'], name='track_artist_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='track_status_created_idx'),
+        ]
+
+
+class IsrcSequence(models.Model):
+    """Next unreserved ISRC designation code for a registrant and year (see api.isrc)"""
+    prefix = models.CharField(max_length=7, primary_key=True, help_text='Country, registrant and year code')
+    next_designation = models.PositiveIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.prefix}: next {self.next_designation:05d}"
+
+
+class IsrcAssignment(models.Model):
+    """Audit record of an ISRC issued by the allocator"""
+    isrc = models.CharField(max_length=12, unique=True)
+    track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='isrc_assignments')
+    assigned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    assigned_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.isrc
+
+
+class TrackSearchDocument(models.Model):
+    """Gives each track the integer rowid of its full-text index entry (see api.search)"""
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, related_name='search_document')
+
+
+class CatalogChange(models.Model):
+    """Track, artist or genre edited since the autocomplete indexes were built (see api.autocomplete)"""
+    KIND_CHOICES = [
+        ('track', 'Track'),
+        ('artist', 'Artist'),
+        ('genre', 'Genre'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=36)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} #{self.pk}"
+
+
+class TrackFingerprint(models.Model):
+    """Packed (hash, frame) landmark pairs of a track's audio (see api.fingerprint)"""
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    data = models.BinaryField()
+    hash_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class FingerprintHash(models.Model):
+    """Inverted index posting: a sampled landmark hash occurring in a track"""
+    hash = models.IntegerField()
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    offset = models.PositiveIntegerField()
+    
+    class Meta:
+        indexes = [
+            # Covers the lookup so postings are read from the index alone
+            models.Index(fields=['hash', 'track', 'offset'], name='fingerprint_hash_idx'),
+        ]
+
+
+class Blob(models.Model):
+    """Content-addressed stored file shared by every field that references it (see api.blobs)"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    verified_at = models.DateTimeField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class Job(models.Model):
+    """Background job claimed and run by `manage.py run_worker` (see api.jobs)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """Resumable chunked audio upload (see api.uploads)"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    artist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def chunk_count(self):
+        return max(-(-self.total_size // self.chunk_size), 1)
+    
+    def expected_chunk_size(self, index):
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.chunk_count - 1)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+
+class UploadChunk(models.Model):
+    """One received chunk of an UploadSession"""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk'),
+        ]
 
 
 class PlayHistory(models.Model):
     """Track play history for analytics"""
     track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='play_history')
     listener = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    played_at = models.DateTimeField(auto_now_add=True)
+    played_at = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True)
     
@@ -98,8 +280,155 @@ class PlayHistory(models.Model):
         return f"{self.track.title} played at {self.played_at}"
     
     class Meta:
-        ordering = ['-played_at']
+        # No default ordering: an implicit ORDER BY played_at on this
+        # unbounded table forces a sort on every query that forgets to slice.
         verbose_name_plural = 'Play History'
+        indexes = [
+            models.Index(fields=['played_at', 'id'], name='playhistory_played_idx'),
+        ]
+
+
+class PlayIngestBatch(models.Model):
+    """Ledger of play journal segments already written to PlayHistory"""
+    segment = models.CharField(max_length=64, unique=True)
+    play_count = models.PositiveIntegerField(default=0)
+    applied_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.segment} ({self.play_count} plays)"
+
+
+class StatCounter(models.Model):
+    """Cached admin dashboard count (see api.stats)"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class PlayArchiveSegment(models.Model):
+    """Manifest entry for a compressed file of archived plays (see api.archive)"""
+    day = models.DateField(db_index=True)
+    path = models.CharField(max_length=255, unique=True)
+    first_play_id = models.BigIntegerField()
+    last_play_id = models.BigIntegerField()
+    play_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.path} ({self.play_count} plays)"
+
+
+class PlayRollup(models.Model):
+    """Play count for one key in one time bucket, maintained by api.rollups"""
+    plays = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        abstract = True
+
+
+class TrackHourlyPlays(PlayRollup):
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='hourly_plays')
+    bucket = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'bucket'], name='unique_track_hourly_bucket'),
+        ]
+
+
+class TrackDailyPlays(PlayRollup):
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='daily_plays')
+    bucket = models.DateField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'bucket'], name='unique_track_daily_bucket'),
+        ]
+
+
+class ArtistDailyPlays(PlayRollup):
+    artist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_plays')
+    bucket = models.DateField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['artist', 'bucket'], name='unique_artist_daily_bucket'),
+        ]
+
+
+class GenreDailyPlays(PlayRollup):
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='daily_plays')
+    bucket = models.DateField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['genre', 'bucket'], name='unique_genre_daily_bucket'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Highest PlayHistory id already folded into the rollup tables (or another named consumer)"""
+    name = models.CharField(max_length=50, unique=True)
+    last_play_id = models.BigIntegerField(default=0)
+    # Highest id noted at seen_at, and the last one noted long enough ago to read up to (see api.rollups)
+    seen_play_id = models.BigIntegerField(default=0)
+    seen_at = models.DateTimeField(blank=True, null=True)
+    settled_play_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_play_id}"
+
+
+class TrackCooccurrence(models.Model):
+    """Times a listener played both tracks in one session; a == b counts session plays (see api.recommendations)"""
+    id = models.BigAutoField(primary_key=True)
+    track_a = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    track_b = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+', db_index=False)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track_a', 'track_b'], name='unique_track_cooccurrence'),
+        ]
+
+
+class TrackNeighbor(models.Model):
+    """One of a track's top "listeners also played" tracks, rebuilt by api.recommendations"""
+    id = models.BigAutoField(primary_key=True)
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'rank'], name='unique_track_neighbor_rank'),
+        ]
+
+
+class TrackTrend(models.Model):
+    """Log-space time-decayed play score of a track (see api.trending)"""
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['score'], name='track_trend_score_idx'),
+        ]
+
+
+class TrendingChart(models.Model):
+    """Bounded top-N trending list, global or for one genre, kept by api.trending"""
+    name = models.CharField(max_length=50, unique=True)
+    entries = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} ({len(self.entries)} tracks)"
 
 
 class Notification(models.Model):
@@ -126,3 +455,15 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx'),
+        ]
+
+
+class NotificationCounter(models.Model):
+    """A user's unread notification count, maintained by api.notifications"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
@@ -0,0 +1,98 @@
+"""
+Track moderation decisions, one at a time or in bulk.
+
+``apply_decisions`` applies many admin decisions (status, ISRC, lyrics status,
+notes) in one transaction: the tracks are locked and loaded with one query,
+ISRC uniqueness is checked for the whole batch with one more, the changes are
+written with ``bulk_update`` and the artists' notifications with
+``bulk_create``. ``bulk_update`` and ``bulk_create`` skip model signals, so
+the work those handlers do for single saves (admin stats counters, search
+index, autocomplete change log, response cache, unread counters, pushed
+events) is done here explicitly, once per batch.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import autocomplete, isrc, notifications, response_cache, search, stats, trending
+from .models import Notification, Track
+
+MAX_ITEMS = 1000
+FIELDS = ('status', 'isrc', 'lyrics_status', 'admin_notes')
+
+
+def status_notification(track):
+    """The notification telling an artist about a moderation decision on ``track``"""
+    message = f'Your track "{track.title}" has been {track.status}.'
+    if track.isrc:
+        message += f' ISRC: {track.isrc}'
+    return Notification(
+        user_id=track.artist_id,
+        notification_type=f'track_{track.status}',
+        title=f'Track {track.status.title()}',
+        message=message,
+        track=track,
+    )
+
+
+def apply_decisions(decisions, user=None):
+    """
+    Apply ``[(result, decision)]`` pairs, where each decision is validated
+    ``TrackDecisionSerializer`` data and each result a dict updated in place
+    with ``status`` ``updated`` or ``error``. Returns the updated tracks.
+
+    With ``ISRC['ASSIGN_ON_APPROVAL']`` set, approved tracks left without an
+    ISRC are issued one (raises ``isrc.AllocationError`` if none can be).
+    """
+    with transaction.atomic():
+        tracks = Track.objects.select_for_update().in_bulk([decision['id'] for _, decision in decisions])
+        # An ISRC may only go to a track that holds no other track's ISRC
+        wanted = {decision['isrc'] for _, decision in decisions if decision.get('isrc')}
+        owners = dict(Track.objects.filter(isrc__in=wanted).values_list('isrc', 'id')) if wanted else {}
+
+        updated, status_deltas, reindex, relisted = [], Counter(), [], []
+        seen = set()
+        for result, decision in decisions:
+            track = tracks.get(decision['id'])
+            if track is None:
+                result['error'] = 'Track not found'
+                continue
+            if track.id in seen:
+                result['error'] = 'Duplicate track in batch'
+                continue
+            code = decision.get('isrc', track.isrc)
+            if code and owners.setdefault(code, track.id) != track.id:
+                result['error'] = 'ISRC already assigned to another track'
+                continue
+
+            seen.add(track.id)
+            if decision.get('status', track.status) != track.status:
+                status_deltas[stats.track_counter(track.status)] -= 1
+                status_deltas[stats.track_counter(decision['status'])] += 1
+                relisted.append(track.id)
+            if code != track.isrc:
+                reindex.append(track.id)
+            for field in FIELDS:
+                if field in decision:
+                    setattr(track, field, decision[field])
+            track.updated_at = timezone.now()
+            updated.append(track)
+            result['status'] = 'updated'
+
+        if isrc.get_config()['ASSIGN_ON_APPROVAL']:
+            unnumbered = [track for track in updated if track.status == 'approved' and not track.isrc]
+            isrc.issue(unnumbered, user, taken=owners)
+            reindex.extend(track.id for track in unnumbered)
+
+        Track.objects.bulk_update(updated, [*FIELDS, 'updated_at'], batch_size=500)
+        notifications.send([status_notification(track) for track in updated])
+
+        if stats.counter_cache_enabled():
+            stats.adjust(status_deltas)
+        search.index_tracks(reindex)
+        autocomplete.record_changes('track', relisted)
+        if relisted:
+            trending.schedule_refresh()
+        response_cache.bump(*response_cache.track_stamps(updated))
+    return updated
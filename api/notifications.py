@@ -0,0 +1,125 @@
+"""
+Notification read state.
+
+Each user's unread count is kept in ``NotificationCounter`` so a badge is one
+primary-key lookup. It is incremented when an unread notification is created
+and decremented when one is deleted (both from ``api.signals``) or marked
+read here; marking read is a single conditional ``UPDATE`` whose row count is
+subtracted from the counter in the same transaction. The counter lives in its
+own table rather than on ``User`` so that full ``user.save()`` calls cannot
+overwrite it with a stale value.
+
+``send`` creates many notifications with one bulk insert and does what the
+signal handlers would have done for each (counting and pushing them).
+
+``prune`` (``manage.py prune_notifications``) marks notifications unread for
+longer than ``UNREAD_RETENTION_DAYS`` as read and deletes read ones older
+than ``READ_RETENTION_DAYS``, one bounded batch at a time. ``reconcile``
+recounts every user after bulk operations that bypass signals.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import events
+from .models import Notification, NotificationCounter
+
+DEFAULTS = {
+    'READ_RETENTION_DAYS': 90,
+    'UNREAD_RETENTION_DAYS': 365,
+    'BATCH_SIZE': 1000,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'NOTIFICATIONS', {})}
+
+
+def adjust_unread(user_id, delta):
+    if not delta:
+        return
+    if NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + delta) or delta < 0:
+        # Nothing to decrement without a row (e.g. the user is being deleted)
+        return
+    try:
+        with transaction.atomic():
+            NotificationCounter.objects.create(user_id=user_id, unread=max(delta, 0))
+    except IntegrityError:
+        # Created concurrently
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + delta)
+
+
+def unread_count(user_id):
+    return NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+
+def send(batch):
+    """Bulk-create the ``Notification`` instances in ``batch``; returns them"""
+    created = Notification.objects.bulk_create(batch, batch_size=500)
+    for user_id, count in Counter(notification.user_id for notification in created if not notification.is_read).items():
+        adjust_unread(user_id, count)
+    transaction.on_commit(lambda: [events.publish(notification) for notification in created])
+    return created
+
+
+def mark_read(user_id, notifications):
+    """Mark the user's unread ``notifications`` (a queryset) read; returns how many changed"""
+    with transaction.atomic():
+        marked = notifications.filter(user_id=user_id, is_read=False).update(is_read=True)
+        adjust_unread(user_id, -marked)
+    return marked
+
+
+def _batches(queryset, batch_size):
+    """Primary keys of ``queryset`` in batches, re-querying after each so updated rows drop out"""
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+
+
+def prune(read_days=None, unread_days=None, batch_size=None):
+    """Apply the retention policy; returns ``(marked read, deleted)``"""
+    config = get_config()
+    read_days = config['READ_RETENTION_DAYS'] if read_days is None else read_days
+    unread_days = config['UNREAD_RETENTION_DAYS'] if unread_days is None else unread_days
+    batch_size = batch_size or config['BATCH_SIZE']
+    now = timezone.now()
+
+    marked = 0
+    stale = Notification.objects.filter(is_read=False, created_at__lt=now - timedelta(days=unread_days))
+    for ids in _batches(stale, batch_size):
+        with transaction.atomic():
+            batch = Notification.objects.filter(id__in=ids, is_read=False)
+            per_user = dict(batch.values_list('user_id').annotate(n=Count('id')).order_by())
+            marked += batch.update(is_read=True)
+            for user_id, n in per_user.items():
+                adjust_unread(user_id, -n)
+
+    deleted = 0
+    expired = Notification.objects.filter(is_read=True, created_at__lt=now - timedelta(days=read_days))
+    for ids in _batches(expired, batch_size):
+        deleted += Notification.objects.filter(id__in=ids).delete()[0]
+    return marked, deleted
+
+
+def reconcile():
+    """Recount every user's unread notifications; returns ``{user_id: (cached, actual)}`` for those that drifted"""
+    actual = dict(
+        Notification.objects.filter(is_read=False).values_list('user_id').annotate(n=Count('id')).order_by()
+    )
+    cached = dict(NotificationCounter.objects.values_list('user_id', 'unread'))
+    drift = {
+        user_id: (cached.get(user_id, 0), actual.get(user_id, 0))
+        for user_id in set(actual) | set(cached)
+        if cached.get(user_id, 0) != actual.get(user_id, 0)
+    }
+    with transaction.atomic():
+        for user_id, (_, count) in drift.items():
+            NotificationCounter.objects.update_or_create(user_id=user_id, defaults={'unread': count})
+    return drift
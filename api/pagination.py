@@ -0,0 +1,124 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Cursor pagination over a unique composite sort key.
+
+    The ordering must end in a unique column (normally ``id``) so every row has
+    a distinct position. Each page is fetched with a single
+    ``WHERE (a, b) < (x, y) ORDER BY a, b LIMIT n + 1`` style query, so the cost
+    of a page does not depend on how deep into the table it is, and no
+    ``COUNT(*)`` is ever issued.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=('-created_at', '-id')):
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, instance):
+        values = []
+        for name in self.fields:
+            value = getattr(instance, name)
+            values.append(value if isinstance(value, (int, float, str)) else str(value))
+        payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor, model):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+
+        try:
+            return [self.to_python(model, name, value) for name, value in zip(self.fields, values)]
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # A numeric annotation such as a search rank
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            raise DjangoValidationError(self.invalid_cursor_message)
+        return field.to_python(value)
+
+    def build_filter(self, values):
+        """Lexicographic "comes after" predicate for the given key values"""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = self.fields[index]
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            for prior, value in zip(self.fields[:index], values[:index]):
+                term &= Q(**{prior: value})
+            condition |= term
+        return condition
+
+    def filter_after(self, queryset, values):
+        return queryset.filter(self.build_filter(values))
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(cursor, queryset.model)
+            queryset = self.filter_after(queryset, values)
+
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+
+def paginated_response(request, queryset, serializer_class, ordering=('-created_at', '-id'), **kwargs):
+    """Paginate ``queryset`` with keyset cursors and serialize the current page"""
+    paginator = KeysetPagination(ordering)
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, **kwargs)
+    return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,312 @@
+"""
+Buffered play ingestion.
+
+``record_play`` used to do a lookup, an insert and a full-row ``save()`` per
+play. Plays are now appended to an in-process buffer and written in batches:
+one ``bulk_create`` for the ``PlayHistory`` rows and one ``F()`` increment per
+distinct play-count delta. The same transaction updates the trending charts
+(``api.trending``).
+
+Every buffered play is first appended to a journal segment on local disk. A
+segment is deleted only after the transaction that applied it commits, and the
+same transaction records the segment name in ``PlayIngestBatch``, so replaying
+a segment left behind by a crashed worker (``manage.py recover_plays``) applies
+each play exactly once.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import trending
+from .models import PlayHistory, PlayIngestBatch, Track, User
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_SIZE': 500,
+    'FLUSH_INTERVAL': 5.0,
+    'JOURNAL_DIR': os.path.join(settings.BASE_DIR, 'var', 'play_journal'),
+    'FSYNC': False,
+    'RECOVERY_GRACE': 60,
+    'MAX_BATCH_ITEMS': 5000,
+    'MAX_CLOCK_SKEW': 300,
+}
+
+SEGMENT_SUFFIX = '.jsonl'
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PLAY_BUFFER', {})}
+
+
+def encode_play(track_id, listener_id=None, ip_address=None, user_agent='', played_at=None):
+    return {
+        'track': str(track_id),
+        'listener': listener_id,
+        'ip': ip_address,
+        'ua': user_agent or '',
+        'at': (played_at or timezone.now()).isoformat(),
+    }
+
+
+def existing_track_ids(track_ids):
+    """The subset of ``track_ids`` that exist, as strings, in one IN query"""
+    return {str(pk) for pk in Track.objects.filter(id__in=track_ids).values_list('id', flat=True)}
+
+
+def apply_plays(plays, segment=None, live_tracks=None):
+    """
+    Write ``plays`` (as produced by ``encode_play``) in one transaction.
+
+    Plays for tracks that no longer exist are dropped; callers that already
+    looked the tracks up can pass their ids as ``live_tracks``. When
+    ``segment`` is given it is recorded in the ingest ledger; returns False
+    without writing anything if that segment was already applied.
+    """
+    if not plays:
+        return True
+
+    track_ids = {play['track'] for play in plays}
+    listener_ids = {play['listener'] for play in plays if play['listener'] is not None}
+
+    with transaction.atomic():
+        if segment is not None:
+            try:
+                with transaction.atomic():
+                    PlayIngestBatch.objects.create(segment=segment, play_count=len(plays))
+            except IntegrityError:
+                return False
+
+        if live_tracks is None:
+            live_tracks = existing_track_ids(track_ids)
+        live_listeners = set(User.objects.filter(id__in=listener_ids).values_list('id', flat=True)) if listener_ids else set()
+
+        rows = []
+        deltas = defaultdict(int)
+        for play in plays:
+            if play['track'] not in live_tracks:
+                continue
+            rows.append(PlayHistory(
+                track_id=play['track'],
+                listener_id=play['listener'] if play['listener'] in live_listeners else None,
+                ip_address=play['ip'],
+                user_agent=play['ua'],
+                played_at=parse_datetime(play['at']),
+            ))
+            deltas[play['track']] += 1
+
+        PlayHistory.objects.bulk_create(rows, batch_size=500)
+
+        # Tracks that gained the same number of plays share one UPDATE
+        by_delta = defaultdict(list)
+        for track_id, delta in deltas.items():
+            by_delta[delta].append(track_id)
+        for delta, ids in by_delta.items():
+            Track.objects.filter(id__in=ids).update(play_count=F('play_count') + delta)
+        
+        trending.record([(str(row.track_id), row.played_at) for row in rows])
+
+    return True
+
+
+class PlayBuffer:
+    """Process-local play buffer flushed on size, on a timer and at exit"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._plays = []
+        self._segment = None
+        self._journal = None
+        self._timer = None
+        self._atexit_registered = False
+
+    def __len__(self):
+        return len(self._plays)
+
+    def add(self, play):
+        config = get_config()
+        with self._lock:
+            self._ensure_started(config)
+            if self._journal is None:
+                self._open_segment(config)
+            self._journal.write(json.dumps(play) + '\n')
+            self._journal.flush()
+            if config['FSYNC']:
+                os.fsync(self._journal.fileno())
+            self._plays.append(play)
+            full = len(self._plays) >= config['MAX_SIZE']
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of plays flushed"""
+        with self._flush_lock:
+            with self._lock:
+                plays, segment, journal = self._plays, self._segment, self._journal
+                self._plays, self._segment, self._journal = [], None, None
+            if journal is None:
+                return 0
+            journal.close()
+
+            path = os.path.join(get_config()['JOURNAL_DIR'], segment)
+            try:
+                apply_plays(plays, segment=segment)
+            except Exception:
+                # The segment stays on disk for recover_plays to pick up
+                logger.exception('Failed to flush %d buffered plays from %s', len(plays), segment)
+                return 0
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return len(plays)
+
+    def _open_segment(self, config):
+        os.makedirs(config['JOURNAL_DIR'], exist_ok=True)
+        self._segment = f'{uuid.uuid4().hex}{SEGMENT_SUFFIX}'
+        self._journal = open(os.path.join(config['JOURNAL_DIR'], self._segment), 'a', encoding='utf-8')
+
+    def _ensure_started(self, config):
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+        if config['FLUSH_INTERVAL'] > 0 and (self._timer is None or not self._timer.is_alive()):
+            self._timer = threading.Thread(
+                target=self._run, args=(config['FLUSH_INTERVAL'],), name='play-buffer-flush', daemon=True
+            )
+            self._timer.start()
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            if not self._plays:
+                continue
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def recover_segments(journal_dir=None, grace=None):
+    """
+    Replay journal segments abandoned by dead workers.
+
+    Only segments untouched for ``grace`` seconds are considered, so segments a
+    live buffer is still writing are left alone. Returns ``(segments, plays)``
+    replayed.
+    """
+    config = get_config()
+    journal_dir = journal_dir or config['JOURNAL_DIR']
+    grace = config['RECOVERY_GRACE'] if grace is None else grace
+    if not os.path.isdir(journal_dir):
+        return 0, 0
+
+    cutoff = time.time() - grace
+    replayed_segments = replayed_plays = 0
+    for name in sorted(os.listdir(journal_dir)):
+        path = os.path.join(journal_dir, name)
+        if not name.endswith(SEGMENT_SUFFIX) or os.path.getmtime(path) > cutoff:
+            continue
+
+        plays = []
+        with open(path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    plays.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    logger.warning('Skipping unreadable line in play journal %s', name)
+
+        if apply_plays(plays, segment=name):
+            replayed_segments += 1
+            replayed_plays += len(plays)
+        os.remove(path)
+
+    return replayed_segments, replayed_plays
+
+
+def prune_ledger(days=7):
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = PlayIngestBatch.objects.filter(applied_at__lt=cutoff).delete()
+    return deleted
+
+
+def validate_batch(items, listener_id=None, ip_address=None, user_agent=''):
+    """
+    Check a client-submitted batch of ``{track_id, played_at}`` events.
+
+    Returns ``(plays, results, live_tracks)``: the plays that can be written,
+    one result dict per submitted item in order, and the track ids found.
+    Track ids are checked with a single query.
+    """
+    max_skew = timedelta(seconds=get_config()['MAX_CLOCK_SKEW'])
+    now = timezone.now()
+    results = []
+    candidates = []
+
+    for index, item in enumerate(items):
+        result = {'index': index, 'status': 'error'}
+        results.append(result)
+        if not isinstance(item, dict):
+            result['error'] = 'Expected an object'
+            continue
+
+        try:
+            track_id = str(uuid.UUID(str(item.get('track_id'))))
+        except ValueError:
+            result['error'] = 'Invalid track_id'
+            continue
+
+        played_at = item.get('played_at')
+        if played_at is None:
+            played_at = now
+        else:
+            try:
+                played_at = parse_datetime(str(played_at))
+            except ValueError:
+                played_at = None
+            if played_at is None:
+                result['error'] = 'Invalid played_at'
+                continue
+            if timezone.is_naive(played_at):
+                played_at = timezone.make_aware(played_at, dt_timezone.utc)
+            if played_at > now + max_skew:
+                result['error'] = 'played_at is in the future'
+                continue
+
+        candidates.append((result, encode_play(track_id, listener_id, ip_address, user_agent, played_at)))
+
+    live_tracks = existing_track_ids({play['track'] for _, play in candidates})
+    plays = []
+    for result, play in candidates:
+        if play['track'] in live_tracks:
+            result['status'] = 'recorded'
+            plays.append(play)
+        else:
+            result['error'] = 'Track not found'
+
+    return plays, results, live_tracks
+
+
+play_buffer = PlayBuffer()
+
+
+def record(track_id, listener_id=None, ip_address=None, user_agent=''):
+    """Queue one play; it is written on the next flush"""
+    play_buffer.add(encode_play(track_id, listener_id, ip_address, user_agent))
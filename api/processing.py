@@ -0,0 +1,183 @@
+"""
+Audio analysis for uploaded tracks.
+
+Uploads are saved with status ``processing`` and a ``process_track`` job.
+The worker decodes the file in fixed-size blocks (so memory stays flat for
+long tracks) and derives the duration, RMS loudness and a short list of
+waveform peaks with NumPy, then moves the track on to ``pending`` review.
+
+PCM WAV files are decoded with the standard library; any other format is
+piped through ``ffmpeg`` when it is installed.
+"""
+import math
+import shutil
+import subprocess
+import wave
+from datetime import timedelta
+
+import numpy as np
+
+from . import jobs
+from .models import Track
+
+PEAK_COUNT = 200
+BLOCK_FRAMES = 65536
+PEAK_WINDOW = 256
+FFMPEG_RATE = 22050
+SILENCE_DBFS = -120.0
+
+
+class UnsupportedAudio(Exception):
+    """The file cannot be decoded here"""
+
+
+def _pcm_to_float(raw, sample_width):
+    """Interleaved little-endian PCM bytes to float32 samples in [-1, 1]"""
+    if sample_width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    if sample_width == 3:
+        triples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        return values.astype(np.float32) / 8388608.0
+    if sample_width == 4:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    raise UnsupportedAudio(f'Unsupported sample width: {sample_width}')
+
+
+def _wav_blocks(path):
+    """Yield ``(rate, mono float32 block)`` from a PCM WAV file"""
+    try:
+        reader = wave.open(path, 'rb')
+    except (wave.Error, EOFError) as exc:
+        raise UnsupportedAudio(str(exc))
+    with reader:
+        channels = reader.getnchannels()
+        width = reader.getsampwidth()
+        rate = reader.getframerate()
+        while True:
+            raw = reader.readframes(BLOCK_FRAMES)
+            if not raw:
+                break
+            samples = _pcm_to_float(raw, width)
+            yield rate, samples.reshape(-1, channels).mean(axis=1) if channels > 1 else samples
+
+
+def _ffmpeg_blocks(path):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise UnsupportedAudio('Not a PCM WAV file and ffmpeg is not installed')
+    command = [ffmpeg, '-nostdin', '-v', 'error', '-i', path, '-f', 's16le', '-ac', '1', '-ar', str(FFMPEG_RATE), '-']
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        while True:
+            raw = process.stdout.read(BLOCK_FRAMES * 2)
+            if not raw:
+                break
+            yield FFMPEG_RATE, _pcm_to_float(raw[:len(raw) - len(raw) % 2], 2)
+        error = process.stderr.read()
+    if process.returncode:
+        raise UnsupportedAudio(error.decode(errors='replace').strip() or 'ffmpeg failed')
+
+
+def decode_blocks(path):
+    try:
+        blocks = _wav_blocks(path)
+        first = next(blocks, None)
+    except UnsupportedAudio:
+        yield from _ffmpeg_blocks(path)
+        return
+    if first is not None:
+        yield first
+        yield from blocks
+
+
+def analyze_audio(path, peak_count=PEAK_COUNT):
+    """
+    Decode ``path`` once and return ``{'duration', 'loudness', 'peaks'}``:
+    duration in seconds, RMS loudness in dBFS and up to ``peak_count``
+    absolute peak values (0..1) evenly spaced over the track.
+    """
+    rate = None
+    frames = 0
+    sum_squares = 0.0
+    # Maxima over short fixed windows; reduced to peak_count at the end
+    window_peaks = []
+    for rate, block in decode_blocks(path):
+        frames += len(block)
+        sum_squares += float(np.dot(block, block))
+        magnitude = np.abs(block)
+        window_peaks.append(np.maximum.reduceat(magnitude, np.arange(0, len(magnitude), PEAK_WINDOW)))
+
+    if not frames:
+        raise UnsupportedAudio('No audio samples')
+
+    rms = math.sqrt(sum_squares / frames)
+    loudness = 20 * math.log10(rms) if rms > 0 else SILENCE_DBFS
+
+    windows = np.concatenate(window_peaks)
+    buckets = min(peak_count, len(windows))
+    edges = np.linspace(0, len(windows), buckets, endpoint=False).astype(np.int64)
+    peaks = np.maximum.reduceat(windows, edges)
+
+    return {
+        'duration': frames / rate,
+        'loudness': round(loudness, 2),
+        'peaks': [round(float(p), 4) for p in peaks],
+    }
+
+
+def apply_analysis(track, duration, loudness, peaks):
+    track.duration = duration
+    track.loudness = loudness
+    track.waveform_peaks = peaks
+    update_fields = ['duration', 'loudness', 'waveform_peaks', 'updated_at']
+    if track.status == 'processing':
+        track.status = 'pending'
+        update_fields.append('status')
+    track.save(update_fields=update_fields)
+
+
+@jobs.register('process_track')
+class ProcessTrack:
+    """Fill in duration, loudness and waveform peaks, then queue for review"""
+
+    def prepare(self, job):
+        try:
+            track = Track.objects.only('audio_file').get(id=job.payload['track_id'])
+        except Track.DoesNotExist:
+            return None
+        return (track.audio_file.path,)
+
+    compute = staticmethod(analyze_audio)
+
+    def finish(self, job, result):
+        track = Track.objects.get(id=job.payload['track_id'])
+        apply_analysis(track, timedelta(seconds=result['duration']), result['loudness'], result['peaks'])
+
+    def give_up(self, job, error):
+        # Still let a moderator see (and reject) a file we could not analyze
+        track = Track.objects.filter(id=job.payload['track_id'], status='processing').first()
+        if track is not None:
+            track.status = 'pending'
+            track.admin_notes = (track.admin_notes + '\n' if track.admin_notes else '') + 'Audio analysis failed'
+            track.save(update_fields=['status', 'admin_notes', 'updated_at'])
+
+
+def enqueue_track(track):
+    """
+    Queue analysis for a new upload, or copy it from a track with identical
+    audio (e.g. a re-upload after rejection) and return None
+    """
+    if track.audio_sha256:
+        twin = (
+            Track.objects.filter(audio_sha256=track.audio_sha256, loudness__isnull=False)
+            .exclude(id=track.id)
+            .values('duration', 'loudness', 'waveform_peaks')
+            .first()
+        )
+        if twin is not None:
+            apply_analysis(track, twin['duration'], twin['loudness'], twin['waveform_peaks'])
+            return None
+    return jobs.enqueue('process_track', {'track_id': str(track.id)})
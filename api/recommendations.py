@@ -0,0 +1,270 @@
+"""
+Item-to-item "listeners also played" recommendations.
+
+Two plays co-occur when the same listener played both tracks within
+``SESSION_GAP`` seconds of each other. ``TrackCooccurrence`` holds the sparse
+symmetric pair counts (a track paired with itself counts its session plays,
+used to normalize), and ``TrackNeighbor`` the best ``TOP_K`` neighbours of
+each track by cosine similarity ``count(a, b) / sqrt(count(a) * count(b))``,
+so the related-tracks endpoint is a single indexed lookup.
+
+Builds are incremental like the analytics rollups: a ``RollupWatermark``
+named ``recommendations`` records the highest play id already counted, and
+runs stop at the highest settled id (``api.rollups.settled_play_id``). Each
+chunk of newer plays is split into ``WINDOW``-second buckets by ``played_at``
+and each bucket is joined with the same listeners' plays within
+``SESSION_GAP`` of it, so a backdated play (e.g. an offline batch) only loads
+history around its own time, and memory is bounded by a window of plays
+rather than the time span of the chunk. A pair is counted only when its
+newer play id is above the watermark, by the bucket holding its later new
+play, so every pair is counted exactly once however the plays are chunked
+and bucketed. Pairing is vectorized with NumPy over plays sorted by
+(listener, time), comparing each play with the next
+1..``MAX_PAIRS_PER_PLAY`` plays. Neighbour lists are refreshed for the tracks
+each chunk touched.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max
+
+from .models import PlayHistory, RollupWatermark, Track, TrackCooccurrence, TrackNeighbor
+from .rollups import settled_play_id
+
+DEFAULTS = {
+    'SESSION_GAP': 30 * 60,
+    'MAX_PAIRS_PER_PLAY': 20,
+    'MIN_COUNT': 2,
+    'TOP_K': 20,
+    'CHUNK_SIZE': 50000,
+    'WINDOW': 6 * 60 * 60,
+    # See api.rollups.settled_play_id
+    'SETTLE_SECONDS': 60,
+}
+
+WATERMARK = 'recommendations'
+QUERY_BATCH = 500
+# Backends whose INSERT ... ON CONFLICT DO UPDATE syntax _add_counts uses
+UPSERT_VENDORS = {'sqlite', 'postgresql'}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RECOMMENDATIONS', {})}
+
+
+def _play_arrays(rows):
+    """Column arrays from ``(id, listener_id, played_at, track_id)`` rows"""
+    rows = list(rows)
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    listeners = np.array([row[1] for row in rows], dtype=np.int64)
+    times = np.array([row[2].timestamp() for row in rows], dtype=np.float64)
+    return ids, listeners, times, [row[3] for row in rows]
+
+
+def count_pairs(ids, listeners, times, tracks, low, gap, max_pairs, owned=None):
+    """
+    ``(a, b)`` index arrays of co-occurring play pairs, in both orders, for
+    pairs whose newer play id is above ``low``. ``tracks`` are integer track
+    indexes; plays of the same track never pair. With ``owned`` (a boolean
+    array), only pairs whose later play above ``low`` is owned are counted.
+    """
+    order = np.lexsort((ids, times, listeners))
+    ids, listeners, times, tracks = ids[order], listeners[order], times[order], tracks[order]
+    if owned is not None:
+        owned = owned[order]
+
+    firsts, seconds = [], []
+    for k in range(1, min(max_pairs, len(ids) - 1) + 1):
+        near = (listeners[:-k] == listeners[k:]) & (times[k:] - times[:-k] <= gap)
+        if not near.any():
+            break
+        keep = near & (np.maximum(ids[:-k], ids[k:]) > low) & (tracks[:-k] != tracks[k:])
+        if owned is not None:
+            keep &= np.where(ids[k:] > low, owned[k:], owned[:-k])
+        firsts.append(tracks[:-k][keep])
+        seconds.append(tracks[k:][keep])
+    if not firsts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    a, b = np.concatenate(firsts), np.concatenate(seconds)
+    return np.concatenate([a, b]), np.concatenate([b, a])
+
+
+def _context(listener_ids, start, end, high):
+    """Plays up to id ``high`` by ``listener_ids`` between ``start`` and ``end``"""
+    listener_ids = sorted(listener_ids)
+    rows = []
+    for offset in range(0, len(listener_ids), QUERY_BATCH):
+        rows.extend(
+            PlayHistory.objects.filter(
+                listener_id__in=listener_ids[offset:offset + QUERY_BATCH], id__lte=high,
+                played_at__gte=start, played_at__lte=end,
+            ).values_list('id', 'listener_id', 'played_at', 'track_id')
+        )
+    return rows
+
+
+def _add_counts(counts):
+    """Add ``{(track_a, track_b): n}`` onto ``TrackCooccurrence``"""
+    if connection.vendor not in UPSERT_VENDORS:
+        _add_counts_portably(counts)
+        return
+    table = TrackCooccurrence._meta.db_table
+    prep = Track._meta.pk.get_db_prep_value
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (track_a_id, track_b_id, count) VALUES (%s, %s, %s) '
+            f'ON CONFLICT (track_a_id, track_b_id) DO UPDATE SET count = {table}.count + excluded.count',
+            [(prep(a, connection), prep(b, connection), n) for (a, b), n in counts.items()],
+        )
+
+
+def _add_counts_portably(counts):
+    """
+    ``_add_counts`` for any backend: read the existing pairs, then update and
+    insert, as ``api.rollups.apply_counts`` does. Safe because ``run`` holds
+    the watermark row lock, so no other build writes these rows meanwhile.
+    """
+    pending = Counter(counts)
+    keys = list(pending)
+    updated = []
+    for start in range(0, len(keys), QUERY_BATCH):
+        batch = keys[start:start + QUERY_BATCH]
+        existing = TrackCooccurrence.objects.filter(
+            track_a_id__in={a for a, _ in batch}, track_b_id__in={b for _, b in batch},
+        )
+        for row in existing:
+            n = pending.pop((row.track_a_id, row.track_b_id), 0)
+            if n:
+                row.count += n
+                updated.append(row)
+    TrackCooccurrence.objects.bulk_update(updated, ['count'], batch_size=QUERY_BATCH)
+    TrackCooccurrence.objects.bulk_create(
+        [TrackCooccurrence(track_a_id=a, track_b_id=b, count=n) for (a, b), n in pending.items()],
+        batch_size=QUERY_BATCH,
+    )
+
+
+def _fold_bucket(plays, low, high, config):
+    """``Counter`` of the ``(track_a, track_b)`` pairs owned by ``plays``, new plays from one window"""
+    gap = config['SESSION_GAP']
+    start = min(row[2] for row in plays) - timedelta(seconds=gap)
+    end = max(row[2] for row in plays) + timedelta(seconds=gap)
+    # The bucket's own plays, other new plays nearby and already-counted history
+    rows = _context({row[1] for row in plays}, start, end, high)
+
+    ids, listeners, times, track_ids = _play_arrays(rows)
+    owned = np.isin(ids, np.array([row[0] for row in plays], dtype=np.int64))
+    positions = {}
+    tracks = np.array([positions.setdefault(track_id, len(positions)) for track_id in track_ids], dtype=np.int64)
+    universe = list(positions)
+    a, b = count_pairs(ids, listeners, times, tracks, low, gap, config['MAX_PAIRS_PER_PLAY'], owned)
+
+    # Session plays per track, stored on the diagonal
+    fresh = tracks[owned]
+    a, b = np.concatenate([a, fresh]), np.concatenate([b, fresh])
+
+    size = len(universe)
+    keys, counts = np.unique(a * size + b, return_counts=True)
+    return Counter({
+        (universe[key // size], universe[key % size]): n for key, n in zip(keys.tolist(), counts.tolist())
+    })
+
+
+def fold_chunk(low, high, config):
+    """Count the pairs completed by plays ``low < id <= high``; returns the set of tracks touched"""
+    new = (
+        PlayHistory.objects.filter(id__gt=low, id__lte=high, listener__isnull=False)
+        .values_list('id', 'listener_id', 'played_at', 'track_id')
+    )
+    buckets = defaultdict(list)
+    for row in new:
+        buckets[int(row[2].timestamp() // config['WINDOW'])].append(row)
+
+    pairs = Counter()
+    for plays in buckets.values():
+        pairs.update(_fold_bucket(plays, low, high, config))
+    _add_counts(pairs)
+    return {pair[0] for pair in pairs}
+
+
+def refresh_neighbors(track_ids, config=None):
+    """Recompute the stored top-k neighbours of ``track_ids``"""
+    config = config or get_config()
+    track_ids = list(track_ids)
+    for offset in range(0, len(track_ids), QUERY_BATCH):
+        batch = track_ids[offset:offset + QUERY_BATCH]
+        pairs = list(
+            TrackCooccurrence.objects.filter(track_a_id__in=batch, count__gte=config['MIN_COUNT'])
+            .exclude(track_b_id=F('track_a_id'))
+            .values_list('track_a_id', 'track_b_id', 'count')
+        )
+        involved = set(batch) | {pair[1] for pair in pairs}
+        totals = dict(
+            TrackCooccurrence.objects.filter(track_a_id__in=involved, track_b_id=F('track_a_id'))
+            .values_list('track_a_id', 'count')
+        )
+
+        ranked = defaultdict(list)
+        if pairs:
+            counts = np.array([pair[2] for pair in pairs], dtype=np.float64)
+            norms = np.sqrt(np.array(
+                [totals.get(a, 1) * totals.get(b, 1) for a, b, _ in pairs], dtype=np.float64,
+            ))
+            scores = counts / np.maximum(norms, 1.0)
+            for position in np.argsort(-scores, kind='stable').tolist():
+                a, b, _ = pairs[position]
+                if len(ranked[a]) < config['TOP_K']:
+                    ranked[a].append((b, float(scores[position])))
+
+        TrackNeighbor.objects.filter(track_id__in=batch).delete()
+        TrackNeighbor.objects.bulk_create([
+            TrackNeighbor(track_id=a, neighbor_id=b, rank=rank, score=round(score, 4))
+            for a, neighbors in ranked.items()
+            for rank, (b, score) in enumerate(neighbors)
+        ], batch_size=1000)
+
+
+def run(chunk_size=None):
+    """Count every play above the watermark and refresh affected neighbours; returns the plays read"""
+    config = get_config()
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    settled = settled_play_id(WATERMARK, config['SETTLE_SECONDS'])
+    read = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            low = watermark.last_play_id
+            newer = PlayHistory.objects.filter(id__gt=low, id__lte=settled)
+            boundary = list(newer.order_by('id').values_list('id', flat=True)[chunk_size - 1:chunk_size])
+            high = boundary[0] if boundary else newer.aggregate(high=Max('id'))['high']
+            if high is None:
+                return read
+
+            refresh_neighbors(fold_chunk(low, high, config), config)
+            read += newer.filter(id__lte=high).count()
+            watermark.last_play_id = high
+            watermark.save(update_fields=['last_play_id', 'updated_at'])
+
+
+def reset():
+    """Drop all counts and rewind the watermark so the next run starts over"""
+    with transaction.atomic():
+        TrackNeighbor.objects.all().delete()
+        TrackCooccurrence.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).update(last_play_id=0)
+
+
+def related(track_id, limit=None):
+    """Approved neighbours of an approved track, best first"""
+    neighbors = (
+        TrackNeighbor.objects.filter(track_id=track_id, track__status='approved', neighbor__status='approved')
+        .select_related('neighbor__artist', 'neighbor__genre')
+        .order_by('rank')
+    )
+    if limit:
+        neighbors = neighbors[:limit]
+    return neighbors
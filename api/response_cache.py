@@ -0,0 +1,139 @@
+"""
+Response cache and conditional GET for read endpoints.
+
+``cached`` wraps a GET view so that its successful responses are rendered
+once and kept in a Django cache: ``CACHES['responses']``, a bounded in-memory
+LRU by default or a directory of files with ``RESPONSE_CACHE_BACKEND=file``.
+An entry is keyed by the full URL, the variant of the response (the user, for
+per-user views) and the current version stamps of the data it was built from.
+Cached views always answer with the stored JSON bytes, whatever the request's
+``Accept`` header, so a hit costs no serialization or rendering and the
+strong ETag (a digest of the body) names exactly the bytes sent. A request
+whose ``If-None-Match`` matches gets ``304 Not Modified``.
+
+Stamps are named after what they cover (``genres``, ``track:<id>``,
+``artist-tracks:<id>``, ``user:<id>``) and replaced by ``bump``, called from
+the Track, Genre and User save and delete signals (``api.signals``) and from
+bulk paths that bypass them. A new stamp orphans every entry built from the
+old data, which the LRU then evicts. Play counts change through
+``QuerySet.update()`` without a bump, so they can lag by up to ``TTL``
+seconds.
+"""
+import functools
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+ALIAS = 'responses'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 300,
+    'MAX_AGE': 60,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[ALIAS] if ALIAS in settings.CACHES else caches['default']
+
+
+def _stamp_key(name):
+    return f'response-stamp:{name}'
+
+
+def stamps(names):
+    """Current stamps for ``names``, in order"""
+    cache = get_cache()
+    keys = [_stamp_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Never set or evicted: a fresh stamp orphans whatever was cached under the old one
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, '') for key in keys]
+
+
+def bump(*names):
+    """
+    Replace the stamps for ``names`` now and again when the current transaction
+    commits, so no request can cache data read before the commit under the
+    new stamp
+    """
+    if not names:
+        return
+
+    def replace():
+        get_cache().set_many({_stamp_key(name): uuid.uuid4().hex for name in names}, None)
+
+    replace()
+    transaction.on_commit(replace)
+
+
+def track_stamps(tracks):
+    """Stamp names covering ``tracks`` (saved, deleted or bulk-updated)"""
+    names = set()
+    for track in tracks:
+        names.update((f'track:{track.pk}', f'artist-tracks:{track.artist_id}'))
+    return names
+
+
+def _not_modified(request, etag):
+    candidates = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def cached(scope, public=False):
+    """
+    Cache a view's 200 responses. ``scope(request, **kwargs)`` returns
+    ``(variant, stamp_names)``: a string that differs between users who may see
+    different responses at the same URL (empty if they all see the same), and
+    the stamps whose bump must invalidate the response.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            config = get_config()
+            if not config['ENABLED'] or request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            variant, names = scope(request, **kwargs)
+            key_source = '\n'.join([request.build_absolute_uri(), variant, *stamps(names)])
+            key = 'response:' + hashlib.sha256(key_source.encode()).hexdigest()
+            cache = get_cache()
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or not isinstance(response, Response):
+                    return response
+                body = JSONRenderer().render(response.data)
+                entry = (quote_etag(hashlib.sha256(body).hexdigest()[:32]), body)
+                cache.set(key, entry, config['TTL'])
+
+            etag, body = entry
+            if _not_modified(request, etag):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(body, content_type=JSONRenderer.media_type)
+            response['ETag'] = etag
+            if public:
+                response['Cache-Control'] = f"public, max-age={config['MAX_AGE']}"
+            else:
+                response['Cache-Control'] = 'private, no-cache'
+                patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,230 @@
+"""
+Incremental play analytics rollups.
+
+``PlayHistory`` rows are folded into per-track hourly/daily and per-artist and
+per-genre daily counters. A ``RollupWatermark`` records the highest play id
+already folded in; each run only reads plays above it and advances it in the
+same transaction as the counter updates, so re-running is a no-op and a
+crashed run is simply retried.
+
+Play ids are taken at insert but become visible at commit, so with concurrent
+writers (e.g. PostgreSQL) a lower id can show up after a higher one was
+folded; the watermark would skip it and ``api.archive`` would later delete it
+unfolded. Runs therefore stop at ``settled_play_id``: the highest id seen at
+least ``SETTLE_SECONDS`` ago, by when every insert that took a lower id has
+committed. Plays reach the rollups one run after they settle.
+"""
+import uuid
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import (
+    PlayHistory, RollupWatermark, Track, TrackHourlyPlays, TrackDailyPlays,
+    ArtistDailyPlays, GenreDailyPlays,
+)
+
+DEFAULTS = {
+    # Longer than any transaction that writes plays
+    'SETTLE_SECONDS': 60,
+}
+
+WATERMARK = 'plays'
+CHUNK_SIZE = 50000
+
+# (rollup model, key field on the rollup, path from PlayHistory, bucket function)
+ROLLUPS = [
+    (TrackHourlyPlays, 'track', 'track', TruncHour),
+    (TrackDailyPlays, 'track', 'track', TruncDate),
+    (ArtistDailyPlays, 'artist', 'track__artist', TruncDate),
+    (GenreDailyPlays, 'genre', 'track__genre', TruncDate),
+]
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ROLLUPS', {})}
+
+
+def settled_play_id(name, settle_seconds):
+    """
+    Highest play id the ``name`` consumer may read up to. Each call notes the
+    current highest id; one noted at least ``settle_seconds`` ago is settled.
+    """
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=name)
+        now = timezone.now()
+        if watermark.seen_at is not None and now - watermark.seen_at < timedelta(seconds=settle_seconds):
+            return watermark.settled_play_id
+        if watermark.seen_at is not None:
+            watermark.settled_play_id = watermark.seen_play_id
+        watermark.seen_play_id = PlayHistory.objects.aggregate(high=Max('id'))['high'] or 0
+        watermark.seen_at = now
+        if settle_seconds <= 0:
+            watermark.settled_play_id = watermark.seen_play_id
+        watermark.save(update_fields=['seen_play_id', 'seen_at', 'settled_play_id', 'updated_at'])
+        return watermark.settled_play_id
+
+
+def aggregate(plays):
+    """Group a PlayHistory queryset into ``{model: Counter((key_id, bucket) -> plays)}``"""
+    counts = {}
+    for model, _key, path, trunc in ROLLUPS:
+        rows = (
+            plays.filter(**{f'{path}__isnull': False})
+            .annotate(rollup_bucket=trunc('played_at'))
+            .values_list(path, 'rollup_bucket')
+            .annotate(plays=Count('id'))
+            .order_by()
+        )
+        counts[model] = Counter({(key_id, bucket): n for key_id, bucket, n in rows})
+    return counts
+
+
+def aggregate_records(records):
+    """
+    ``aggregate`` for plays held outside the database (e.g. archived segments).
+
+    ``records`` are dicts with ``track_id`` and an aware ``played_at``; plays of
+    tracks that no longer exist are skipped.
+    """
+    records = list(records)
+    owners = {
+        str(track_id): (artist_id, genre_id)
+        for track_id, artist_id, genre_id in Track.objects.filter(
+            id__in={record['track_id'] for record in records}
+        ).values_list('id', 'artist_id', 'genre_id')
+    }
+
+    counts = {model: Counter() for model, *_ in ROLLUPS}
+    for record in records:
+        track_id = str(record['track_id'])
+        if track_id not in owners:
+            continue
+        artist_id, genre_id = owners[track_id]
+        played_at = record['played_at'].astimezone(dt_timezone.utc)
+        day = played_at.date()
+        track_pk = uuid.UUID(track_id)
+
+        counts[TrackHourlyPlays][(track_pk, played_at.replace(minute=0, second=0, microsecond=0))] += 1
+        counts[TrackDailyPlays][(track_pk, day)] += 1
+        counts[ArtistDailyPlays][(artist_id, day)] += 1
+        if genre_id is not None:
+            counts[GenreDailyPlays][(genre_id, day)] += 1
+    return counts
+
+
+def apply_counts(counts):
+    """Add ``counts`` (as returned by ``aggregate``) onto the rollup tables"""
+    for model, key, _path, _trunc in ROLLUPS:
+        pending = Counter(counts.get(model, ()))
+        if not pending:
+            continue
+
+        key_ids = {key_id for key_id, _ in pending}
+        buckets = {bucket for _, bucket in pending}
+        existing = model.objects.filter(**{f'{key}_id__in': key_ids, 'bucket__in': buckets})
+
+        updated = []
+        for row in existing:
+            n = pending.pop((getattr(row, f'{key}_id'), row.bucket), 0)
+            if n:
+                row.plays += n
+                updated.append(row)
+
+        model.objects.bulk_update(updated, ['plays'], batch_size=500)
+        model.objects.bulk_create(
+            [model(**{f'{key}_id': key_id, 'bucket': bucket, 'plays': n}) for (key_id, bucket), n in pending.items()],
+            batch_size=500,
+        )
+
+
+def run(chunk_size=CHUNK_SIZE):
+    """Fold every settled play above the watermark into the rollups; returns the number of plays folded"""
+    settled = settled_play_id(WATERMARK, get_config()['SETTLE_SECONDS'])
+    folded = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            low = watermark.last_play_id
+            newer = PlayHistory.objects.filter(id__gt=low, id__lte=settled)
+            boundary = list(newer.order_by('id').values_list('id', flat=True)[chunk_size - 1:chunk_size])
+            high = boundary[0] if boundary else newer.aggregate(high=Max('id'))['high']
+            if high is None:
+                return folded
+
+            counts = aggregate(PlayHistory.objects.filter(id__gt=low, id__lte=high))
+            folded += sum(counts[TrackDailyPlays].values())
+            apply_counts(counts)
+            watermark.last_play_id = high
+            watermark.save(update_fields=['last_play_id', 'updated_at'])
+
+
+def reset():
+    """Drop all rollup rows and rewind the watermark so the next run starts over"""
+    with transaction.atomic():
+        for model, *_ in ROLLUPS:
+            model.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).update(last_play_id=0)
+
+
+def rebuild(chunk_size=CHUNK_SIZE):
+    """
+    Recompute every rollup from scratch: archived plays first, then the live
+    table. Returns the number of plays folded.
+    """
+    from .archive import iter_archived_plays
+
+    reset()
+    folded = 0
+    chunk = []
+    for record in iter_archived_plays():
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            with transaction.atomic():
+                apply_counts(aggregate_records(chunk))
+            folded += len(chunk)
+            chunk = []
+    if chunk:
+        with transaction.atomic():
+            apply_counts(aggregate_records(chunk))
+        folded += len(chunk)
+
+    return folded + run(chunk_size=chunk_size)
+
+
+def series(model, start, end, **key):
+    """Rollup points for one key with ``start <= bucket < end``, oldest first"""
+    rows = (
+        model.objects.filter(bucket__gte=start, bucket__lt=end, **key)
+        .order_by('bucket')
+        .values('bucket', 'plays')
+    )
+    return list(rows)
+
+
+def parse_range(params, default_days=30):
+    """
+    Read ``?start=YYYY-MM-DD&end=YYYY-MM-DD`` (both inclusive) into dates.
+
+    Defaults to the last ``default_days`` days; raises ValueError on bad input.
+    """
+    end = params.get('end')
+    end = date.fromisoformat(end) if end else timezone.now().date()
+    start = params.get('start')
+    start = date.fromisoformat(start) if start else end - timedelta(days=default_days - 1)
+    if start > end:
+        raise ValueError('start must not be after end')
+    return start, end
+
+
+def hourly_bounds(start, end):
+    """Aware UTC datetimes covering the dates ``start``..``end`` inclusive"""
+    return (
+        datetime.combine(start, time.min, tzinfo=dt_timezone.utc),
+        datetime.combine(end + timedelta(days=1), time.min, tzinfo=dt_timezone.utc),
+    )
@@ -0,0 +1,114 @@
+"""
+Read-replica routing.
+
+Views wrapped in ``use_replica`` (read-only admin lists, admin stats and
+analytics) read from one of ``DATABASE_ROUTING['REPLICAS']``, so their heavy
+queries stay off the primary that takes plays and uploads. Everything else,
+and every write, goes to ``default``.
+
+Replicas lag, so a user whose request wrote to the primary is pinned to it
+for ``PIN_SECONDS``: ``ReplicaPinningMiddleware`` notices writes through
+``ReplicaRouter.db_for_write`` and records the pin in Django's cache (use a
+shared backend so the pin holds across processes). Within a request, reads
+after a write go to the primary too.
+
+With no replicas configured the router changes nothing.
+"""
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    'REPLICAS': [],
+    'PIN_SECONDS': 10,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_ROUTING', {})}
+
+
+class RequestState:
+    """What the router needs to know about the request being served"""
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_request = contextvars.ContextVar('replica_routing_request', default=None)
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def is_pinned(user):
+    return bool(user and user.is_authenticated and cache.get(pin_key(user.id)))
+
+
+def use_replica(view):
+    """Serve a read-only view from a replica unless the user is pinned to the primary"""
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        replicas = get_config()['REPLICAS']
+        if not replicas or is_pinned(request.user):
+            return view(request, *args, **kwargs)
+
+        state = _request.get()
+        token = None
+        if state is None:
+            # Outside the middleware (e.g. a view called directly)
+            state = RequestState()
+            token = _request.set(state)
+        state.replica = random.choice(replicas)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.replica = None
+            if token is not None:
+                _request.reset(token)
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        if state is None or state.wrote or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state.wrote = True
+        # Explicitly, or Django would write an instance back to the replica it was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_config()['REPLICAS']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestState()
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            cache.set(pin_key(user.id), True, get_config()['PIN_SECONDS'])
+        return response
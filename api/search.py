@@ -0,0 +1,167 @@
+"""
+Full-text catalog search.
+
+On SQLite, tracks are indexed in the FTS5 table ``api_track_fts`` (created by
+migration 0011) with one row per track, keyed by the integer id of its
+``TrackSearchDocument``. Columns are weighted for BM25 ranking so a title or
+ISRC hit outranks a word buried in the lyrics. The index is updated from the
+signal handlers in ``api.signals`` whenever a track, its artist's display
+name or its genre's name changes; ``manage.py rebuild_search_index`` rebuilds
+it from scratch (e.g. after bulk updates that bypass signals).
+
+Other database backends fall back to unranked ``icontains`` filtering.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Track, TrackSearchDocument
+from .pagination import KeysetPagination, paginated_response
+
+TABLE = 'api_track_fts'
+COLUMNS = ('title', 'lyrics', 'artist', 'genre', 'isrc')
+# BM25 column weights, in COLUMNS order
+WEIGHTS = (10.0, 1.0, 6.0, 3.0, 8.0)
+RANK = f'bm25({TABLE}, {", ".join(str(w) for w in WEIGHTS)})'
+
+MAX_TERMS = 16
+INDEX_BATCH = 500
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def to_fts_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one
+    as a prefix (search-as-you-type). Returns None when there are no words.
+    """
+    terms = TOKEN.findall(text or '')[:MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def index_tracks(track_ids):
+    """(Re)index the given tracks; ids that no longer exist are skipped"""
+    if not enabled():
+        return
+    track_ids = list(track_ids)
+    for start in range(0, len(track_ids), INDEX_BATCH):
+        batch = track_ids[start:start + INDEX_BATCH]
+        rows = Track.objects.filter(id__in=batch).values_list(
+            'id', 'title', 'lyrics', 'artist__display_name', 'genre__name', 'isrc',
+        )
+        with transaction.atomic():
+            documents = dict(
+                TrackSearchDocument.objects.filter(track_id__in=batch).values_list('track_id', 'id')
+            )
+            missing = [row[0] for row in rows if row[0] not in documents]
+            if missing:
+                TrackSearchDocument.objects.bulk_create(
+                    [TrackSearchDocument(track_id=track_id) for track_id in missing], ignore_conflicts=True,
+                )
+                documents.update(
+                    TrackSearchDocument.objects.filter(track_id__in=missing).values_list('track_id', 'id')
+                )
+            with connection.cursor() as cursor:
+                cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(documents[row[0]],) for row in rows])
+                cursor.executemany(
+                    f'INSERT INTO {TABLE} (rowid, {", ".join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)',
+                    [(documents[row[0]], *(value or '' for value in row[1:])) for row in rows],
+                )
+
+
+def unindex(document_id):
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [document_id])
+
+
+def rebuild(batch_size=INDEX_BATCH):
+    """Re-index every track; returns how many were indexed"""
+    if not enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    TrackSearchDocument.objects.exclude(track_id__in=Track.objects.values('id')).delete()
+
+    indexed = 0
+    ids = Track.objects.order_by('id').values_list('id', flat=True)
+    last = None
+    while True:
+        page = ids.filter(id__gt=last) if last else ids
+        batch = list(page[:batch_size])
+        if not batch:
+            break
+        index_tracks(batch)
+        indexed += len(batch)
+        last = batch[-1]
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def matching(queryset, text):
+    """
+    Restrict a Track queryset to matches for ``text``, annotated with
+    ``search_rank`` (lower is better) on SQLite.
+    """
+    fts_query = to_fts_query(text)
+    if fts_query is None:
+        return queryset.none()
+
+    if not enabled():
+        condition = Q()
+        for term in TOKEN.findall(text)[:MAX_TERMS]:
+            condition &= (
+                Q(title__icontains=term) | Q(lyrics__icontains=term) | Q(artist__display_name__icontains=term)
+                | Q(genre__name__icontains=term) | Q(isrc__icontains=term)
+            )
+        return queryset.filter(condition).extra(select={'search_rank': '0'})
+
+    # Drive the join from the FTS index; each hit then looks up its track
+    return queryset.extra(
+        tables=[TABLE, TrackSearchDocument._meta.db_table],
+        where=[
+            f'{TABLE} MATCH %s',
+            f'{TABLE}.rowid = api_tracksearchdocument.id',
+            'api_tracksearchdocument.track_id = api_track.id',
+        ],
+        params=[fts_query],
+        select={'search_rank': RANK},
+    )
+
+
+def matching_ids(text):
+    """Subquery of track ids matching ``text``, for filters that keep their own ordering"""
+    return matching(Track.objects.all(), text).values('id')
+
+
+class RankedPagination(KeysetPagination):
+    """Keyset pagination over ``(search_rank, id)`` for FTS results"""
+
+    def __init__(self):
+        super().__init__(ordering=('search_rank', 'id'))
+
+    def filter_after(self, queryset, values):
+        rank, track_id = values
+        return queryset.extra(
+            where=[f'({RANK} > %s OR ({RANK} = %s AND api_track.id > %s))'],
+            params=[rank, rank, track_id.hex],
+        )
+
+
+def paginated_results(request, queryset, serializer_class, **kwargs):
+    """Paginate the output of ``matching`` best match first"""
+    if not enabled():
+        return paginated_response(request, queryset, serializer_class, **kwargs)
+    paginator = RankedPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True, **kwargs).data)
@@ -1,14 +1,20 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from .models import User, Track, Genre, PlayHistory, Notification
+from .models import User, Track, Genre, PlayHistory, Notification, UploadSession
+from . import blobs, fingerprint, images, uploads
 
 
 class UserSerializer(serializers.ModelSerializer):
     """User serializer for basic user information"""
+    profile_picture_urls = serializers.SerializerMethodField()
+    
     class Meta:
         model = User
-        fields = ['id', 'email', 'display_name', 'user_type', 'is_verified', 'created_at']
+        fields = ['id', 'email', 'display_name', 'user_type', 'is_verified', 'profile_picture_urls', 'created_at']
         read_only_fields = ['id', 'is_verified', 'created_at']
+    
+    def get_profile_picture_urls(self, obj):
+        return images.urls(self.context.get('request'), 'users', obj)
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -65,13 +71,14 @@ class TrackSerializer(serializers.ModelSerializer):
     artist = UserSerializer(read_only=True)
     genre = GenreSerializer(read_only=True)
     genre_name = serializers.CharField(write_only=True, required=False)
+    cover_art_urls = serializers.SerializerMethodField()
     
     class Meta:
         model = Track
         fields = [
             'id', 'title', 'artist', 'genre', 'genre_name', 'release_date', 
             'duration', 'lyrics', 'lyrics_status', 'isrc', 'status', 
-            'play_count', 'created_at', 'updated_at'
+            'play_count', 'cover_art_urls', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'artist', 'duration', 'isrc', 'play_count', 'created_at', 'updated_at']
     
@@ -83,10 +90,17 @@ class TrackSerializer(serializers.ModelSerializer):
         
         validated_data['artist'] = self.context['request'].user
         return super().create(validated_data)
+    
+    def get_cover_art_urls(self, obj):
+        return images.urls(self.context.get('request'), 'tracks', obj)
 
 
 class TrackUploadSerializer(serializers.ModelSerializer):
-    """Track upload serializer with file handling"""
+    """
+    Track upload serializer with file handling. Files are stored by content
+    (see api.blobs); pass ``audio_sha256`` in the context if the audio file
+    has already been hashed.
+    """
     genre_name = serializers.CharField(required=False)
     
     class Meta:
@@ -102,18 +116,114 @@ class TrackUploadSerializer(serializers.ModelSerializer):
             genre, created = Genre.objects.get_or_create(name=genre_name)
             validated_data['genre'] = genre
         
+        audio, _ = blobs.store(validated_data['audio_file'], 'audio_files', self.context.get('audio_sha256'))
+        validated_data['audio_file'] = audio.name
+        validated_data['audio_sha256'] = audio.sha256
+        if validated_data.get('cover_art'):
+            cover, _ = blobs.store(validated_data['cover_art'], 'cover_art')
+            validated_data['cover_art'] = cover.name
+            validated_data['cover_art_hash'] = cover.sha256
+        
+        validated_data['artist'] = self.context['request'].user
+        return super().create(validated_data)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Resumable upload session; received_chunks lets clients resume"""
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'total_size', 'chunk_size', 'chunk_count', 'sha256',
+            'status', 'received_chunks', 'track', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'status', 'track', 'created_at', 'updated_at']
+    
+    def get_received_chunks(self, obj):
+        return sorted(chunk.index for chunk in obj.chunks.all())
+    
+    def validate_total_size(self, value):
+        max_size = uploads.get_config()['MAX_FILE_SIZE']
+        if value <= 0 or value > max_size:
+            raise serializers.ValidationError(f"total_size must be between 1 and {max_size} bytes")
+        return value
+    
+    def validate_chunk_size(self, value):
+        max_size = uploads.get_config()['MAX_CHUNK_SIZE']
+        if value > max_size:
+            raise serializers.ValidationError(f"chunk_size must be at most {max_size} bytes")
+        return value
+    
+    def validate_sha256(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value.lower())):
+            raise serializers.ValidationError("sha256 must be a 64 character hex digest")
+        return value.lower()
+    
+    def validate(self, attrs):
+        # Small chunks only for small files, so no session has more than
+        # MAX_FILE_SIZE / MIN_CHUNK_SIZE chunks to track and assemble
+        min_size = uploads.get_config()['MIN_CHUNK_SIZE']
+        chunk_size = attrs.get('chunk_size')
+        if chunk_size is not None and chunk_size < min(min_size, attrs['total_size']):
+            raise serializers.ValidationError(
+                {'chunk_size': f"chunk_size must be at least {min_size} bytes, or the whole file"}
+            )
+        return attrs
+    
+    def create(self, validated_data):
+        validated_data.setdefault('chunk_size', uploads.get_config()['CHUNK_SIZE'])
         validated_data['artist'] = self.context['request'].user
         return super().create(validated_data)
 
 
+class TrackDetailListSerializer(serializers.ListSerializer):
+    """Resolves the fingerprint matches of a whole page of tracks with one query"""
+    def to_representation(self, data):
+        tracks = list(data.all() if hasattr(data, 'all') else data)
+        if self.child.shows_matches():
+            self.context['fingerprint_matches'] = fingerprint.resolve_matches(tracks)
+        return super().to_representation(tracks)
+
+
 class TrackDetailSerializer(serializers.ModelSerializer):
-    """Detailed track serializer for admin and detailed views"""
+    """
+    Detailed track serializer for admin and detailed views. Likely duplicates
+    (``fingerprint_matches``) name other artists' tracks, so they are only
+    included with ``context={'staff': True}``. ``waveform_peaks`` is only
+    included for a single track, not in lists.
+    """
     artist = UserSerializer(read_only=True)
     genre = GenreSerializer(read_only=True)
+    cover_art_urls = serializers.SerializerMethodField()
+    fingerprint_matches = serializers.SerializerMethodField()
     
     class Meta:
         model = Track
         fields = '__all__'
+        list_serializer_class = TrackDetailListSerializer
+    
+    def shows_matches(self):
+        return bool(self.context.get('staff'))
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.shows_matches():
+            del fields['fingerprint_matches']
+        if isinstance(self.parent, serializers.ListSerializer):
+            del fields['waveform_peaks']
+        return fields
+    
+    def get_cover_art_urls(self, obj):
+        return images.urls(self.context.get('request'), 'tracks', obj)
+    
+    def get_fingerprint_matches(self, obj):
+        resolved = self.context.get('fingerprint_matches')
+        if resolved is None or obj.id not in resolved:
+            resolved = fingerprint.resolve_matches([obj])
+        return resolved[obj.id]
 
 
 class TrackStatusUpdateSerializer(serializers.ModelSerializer):
@@ -128,6 +238,26 @@ class TrackStatusUpdateSerializer(serializers.ModelSerializer):
         return value
 
 
+class TrackDecisionSerializer(serializers.Serializer):
+    """One item of a bulk moderation request; validated without touching the database"""
+    id = serializers.UUIDField()
+    status = serializers.ChoiceField(choices=Track.STATUS_CHOICES, required=False)
+    isrc = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=12)
+    lyrics_status = serializers.ChoiceField(choices=Track.LYRICS_STATUS_CHOICES, required=False)
+    admin_notes = serializers.CharField(required=False, allow_blank=True)
+    
+    def validate_isrc(self, value):
+        if value and len(value) != 12:
+            raise serializers.ValidationError("ISRC must be exactly 12 characters")
+        # Blank clears the ISRC; stored as NULL so it stays unique
+        return value or None
+    
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError('Provide at least one of status, isrc, lyrics_status, admin_notes')
+        return attrs
+
+
 class PlayHistorySerializer(serializers.ModelSerializer):
     """Play history serializer"""
     track = TrackSerializer(read_only=True)
@@ -0,0 +1,242 @@
+import os
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import (
+    authentication, autocomplete, blobs, events, images, notifications, response_cache, search, stats, trending,
+)
+from .models import Genre, Notification, Track, TrackSearchDocument, User
+
+
+# Admin stats counter cache. post_init remembers the values a row was loaded
+# with so post_save can tell a status/user-type change from a no-op save.
+@receiver(post_init, sender=Track)
+def remember_track_status(sender, instance, **kwargs):
+    instance._stats_status = instance.__dict__.get('status')
+    instance._trend_key = (instance.__dict__.get('status'), instance.__dict__.get('genre_id'))
+    instance._image_name = _image_name(instance, 'cover_art')
+    instance._blob_names = {field: _image_name(instance, field) for field in blobs.TRACK_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_user_type(sender, instance, **kwargs):
+    instance._stats_user_type = instance.__dict__.get('user_type')
+    instance._search_display_name = instance.__dict__.get('display_name')
+    instance._image_name = _image_name(instance, 'profile_picture')
+
+
+@receiver(post_save, sender=Track)
+def count_track_save(sender, instance, created, **kwargs):
+    if stats.counter_cache_enabled():
+        old = None if created else instance._stats_status
+        if created:
+            stats.adjust({stats.TRACKS_TOTAL: 1, stats.track_counter(instance.status): 1})
+        elif old != instance.status:
+            stats.adjust({stats.track_counter(old): -1, stats.track_counter(instance.status): 1})
+    instance._stats_status = instance.status
+
+
+@receiver(post_save, sender=User)
+def count_user_save(sender, instance, created, **kwargs):
+    if stats.counter_cache_enabled():
+        old = None if created else instance._stats_user_type
+        if created:
+            stats.adjust({stats.user_counter(instance.user_type): 1})
+        elif old != instance.user_type:
+            stats.adjust({stats.user_counter(old): -1, stats.user_counter(instance.user_type): 1})
+    instance._stats_user_type = instance.user_type
+
+
+@receiver(post_delete, sender=Track)
+def count_track_delete(sender, instance, **kwargs):
+    if stats.counter_cache_enabled():
+        stats.adjust({stats.TRACKS_TOTAL: -1, stats.track_counter(instance._stats_status): -1})
+
+
+@receiver(post_delete, sender=User)
+def count_user_delete(sender, instance, **kwargs):
+    if stats.counter_cache_enabled():
+        stats.adjust({stats.user_counter(instance._stats_user_type): -1})
+
+
+# Image derivatives: re-render whenever a cover or profile picture changes
+def _image_name(instance, field):
+    value = instance.__dict__.get(field)
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_save, sender=Track)
+def render_cover_art(sender, instance, created, **kwargs):
+    _render_if_changed('tracks', instance, 'cover_art', created)
+
+
+@receiver(post_save, sender=User)
+def render_profile_picture(sender, instance, created, **kwargs):
+    _render_if_changed('users', instance, 'profile_picture', created)
+
+
+def _render_if_changed(kind, instance, field, created):
+    if field not in instance.__dict__:
+        return
+    name = _image_name(instance, field)
+    if name and created or name != instance._image_name:
+        # Content-addressed files are named after the hash stored with them
+        digest = getattr(instance, images.SOURCES[kind][2])
+        images.image_changed(kind, instance, hash_known=bool(digest) and os.path.basename(name).startswith(digest))
+    instance._image_name = name
+
+
+# Content-addressed blobs: drop a reference when a track stops pointing at one
+@receiver(post_save, sender=Track)
+def release_replaced_blobs(sender, instance, created, **kwargs):
+    for field in blobs.TRACK_FIELDS:
+        if field not in instance.__dict__:
+            continue
+        name = _image_name(instance, field)
+        if not created and name != instance._blob_names[field]:
+            blobs.release(instance._blob_names[field])
+        instance._blob_names[field] = name
+
+
+@receiver(post_delete, sender=Track)
+def release_deleted_blobs(sender, instance, **kwargs):
+    for field in blobs.TRACK_FIELDS:
+        blobs.release(instance._blob_names[field])
+
+
+# Full-text search index
+SEARCH_FIELDS = {'title', 'lyrics', 'isrc', 'genre', 'genre_id', 'artist', 'artist_id'}
+
+
+@receiver(post_save, sender=Track)
+def index_track(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        search.index_tracks([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def reindex_artist_tracks(sender, instance, created, **kwargs):
+    if 'display_name' not in instance.__dict__:
+        return
+    if not created and instance.display_name != instance._search_display_name:
+        search.index_tracks(Track.objects.filter(artist=instance).values_list('id', flat=True))
+    instance._search_display_name = instance.display_name
+
+
+@receiver(post_save, sender=Genre)
+def reindex_genre_tracks(sender, instance, created, **kwargs):
+    if not created:
+        search.index_tracks(Track.objects.filter(genre=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=TrackSearchDocument)
+def unindex_track(sender, instance, **kwargs):
+    search.unindex(instance.pk)
+
+
+# Autocomplete: queue edited entities for each process's next incremental refresh
+AUTOCOMPLETE_FIELDS = {
+    Track: ('track', {'title', 'status'}),
+    User: ('artist', {'display_name', 'user_type'}),
+    Genre: ('genre', {'name'}),
+}
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Genre)
+def record_catalog_change(sender, instance, update_fields=None, **kwargs):
+    kind, fields = AUTOCOMPLETE_FIELDS[sender]
+    # Saves such as a login's last_login update cannot change a suggestion
+    if update_fields is None or fields & set(update_fields):
+        autocomplete.record_change(kind, instance.pk)
+
+
+@receiver(post_delete, sender=Track)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Genre)
+def record_catalog_delete(sender, instance, **kwargs):
+    autocomplete.record_change(AUTOCOMPLETE_FIELDS[sender][0], instance.pk)
+
+
+# Push new notifications to connected event streams once they are committed
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: events.publish(instance))
+
+
+# Unread notification counters
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        notifications.adjust_unread(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        notifications.adjust_unread(instance.user_id, -1)
+
+
+# Cached JWT users: a new stamp makes every process reload the user. Bumped
+# after commit so a reload cannot read the row before the change is visible.
+@receiver(post_save, sender=User)
+def bump_auth_stamp(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        # Nothing can be cached under a new id, unless the id was reused
+        authentication.bump(instance.pk)
+    elif update_fields is None or set(update_fields) - {'last_login'}:
+        transaction.on_commit(lambda: authentication.bump(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def bump_deleted_auth_stamp(sender, instance, **kwargs):
+    transaction.on_commit(lambda pk=instance.pk: authentication.bump(pk))
+
+
+# Response cache (api.response_cache): new stamps orphan cached responses built from the old rows
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def bump_track_responses(sender, instance, **kwargs):
+    response_cache.bump(*response_cache.track_stamps([instance]))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def bump_genre_responses(sender, instance, **kwargs):
+    response_cache.bump('genres')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_responses(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) - {'last_login'}:
+        return
+    names = [f'user:{instance.pk}', f'artist-tracks:{instance.pk}']
+    if not created and instance.user_type == 'artist':
+        # Tracks embed their artist
+        names += [f'track:{pk}' for pk in Track.objects.filter(artist_id=instance.pk).values_list('id', flat=True)]
+    response_cache.bump(*names)
+
+
+# Trending charts: only approved tracks chart, each on its own genre's chart
+@receiver(post_save, sender=Track)
+def refresh_trending_on_change(sender, instance, created, **kwargs):
+    key = (instance.__dict__.get('status'), instance.__dict__.get('genre_id'))
+    if not created and key != instance._trend_key and 'approved' in (key[0], instance._trend_key[0]):
+        trending.schedule_refresh()
+    instance._trend_key = key
+
+
+@receiver(post_delete, sender=Track)
+def refresh_trending_on_delete(sender, instance, **kwargs):
+    if instance._trend_key[0] == 'approved':
+        trending.schedule_refresh()
+
+
+@receiver(post_delete, sender=Genre)
+def refresh_trending_on_genre_delete(sender, instance, **kwargs):
+    trending.schedule_refresh()
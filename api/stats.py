@@ -0,0 +1,110 @@
+"""
+Admin dashboard statistics.
+
+``compute_stats`` answers with one conditional aggregate per table. With
+``STATS_COUNTER_CACHE`` enabled, per-status and per-user-type counters in
+``StatCounter`` are kept up to date by the signal handlers in ``api.signals``
+(inside the same transaction as the row change), and ``get_stats`` reads them
+with a single indexed query. ``reconcile`` recomputes the counters and reports
+any drift, e.g. after bulk operations that bypass model signals.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import StatCounter, Track, User
+
+TRACK_STATUSES = [value for value, _ in Track.STATUS_CHOICES]
+USER_TYPES = [value for value, _ in User.USER_TYPE_CHOICES]
+
+TRACKS_TOTAL = 'tracks.total'
+
+
+def track_counter(status):
+    return f'tracks.{status}'
+
+
+def user_counter(user_type):
+    return f'users.{user_type}'
+
+
+COUNTERS = [TRACKS_TOTAL] + [track_counter(s) for s in TRACK_STATUSES] + [user_counter(t) for t in USER_TYPES]
+
+
+def counter_cache_enabled():
+    return getattr(settings, 'STATS_COUNTER_CACHE', False)
+
+
+def compute_counters():
+    """Exact counter values from the source tables, one query per table"""
+    tracks = Track.objects.aggregate(
+        **{TRACKS_TOTAL: Count('id')},
+        **{track_counter(s): Count('id', filter=Q(status=s)) for s in TRACK_STATUSES},
+    )
+    users = User.objects.aggregate(
+        **{user_counter(t): Count('id', filter=Q(user_type=t)) for t in USER_TYPES},
+    )
+    return {**tracks, **users}
+
+
+def read_counters():
+    """Cached counter values, or None if the cache has not been initialized"""
+    values = dict(StatCounter.objects.filter(name__in=COUNTERS).values_list('name', 'value'))
+    if len(values) != len(COUNTERS):
+        return None
+    return values
+
+
+def adjust(deltas):
+    """Apply ``{counter name: delta}``; counters that were never initialized are left for reconcile"""
+    for name, delta in deltas.items():
+        if delta:
+            StatCounter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def as_stats(counters):
+    return {
+        'total_tracks': counters[TRACKS_TOTAL],
+        'pending_tracks': counters[track_counter('pending')],
+        'approved_tracks': counters[track_counter('approved')],
+        'rejected_tracks': counters[track_counter('rejected')],
+        'total_artists': counters[user_counter('artist')],
+        'total_listeners': counters[user_counter('listener')],
+    }
+
+
+def get_stats():
+    counters = read_counters() if counter_cache_enabled() else None
+    if counters is None:
+        counters = compute_counters()
+    return as_stats(counters)
+
+
+def reconcile(dry_run=False):
+    """
+    Recompute every counter and overwrite the cached values.
+
+    Returns ``{name: (cached, actual)}`` for each counter that had drifted
+    (cached is None for counters that did not exist yet).
+    """
+    with transaction.atomic():
+        cached = {
+            counter.name: counter
+            for counter in StatCounter.objects.select_for_update().filter(name__in=COUNTERS)
+        }
+        actual = compute_counters()
+
+        drift = {}
+        for name in COUNTERS:
+            counter = cached.get(name)
+            current = counter.value if counter else None
+            if current != actual[name]:
+                drift[name] = (current, actual[name])
+                if dry_run:
+                    continue
+                if counter:
+                    counter.value = actual[name]
+                    counter.save(update_fields=['value'])
+                else:
+                    StatCounter.objects.create(name=name, value=actual[name])
+    return drift
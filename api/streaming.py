@@ -0,0 +1,216 @@
+"""
+HTTP Range support for serving stored audio files.
+
+Single-range and full responses are ``FileResponse`` objects around a
+``RangeFile`` positioned at the first byte, with an exact ``Content-Length``.
+Under a WSGI server that provides ``wsgi.file_wrapper`` with ``sendfile``
+(e.g. gunicorn) the bytes are sent by the kernel without passing through
+Python; elsewhere ``RangeFile.read`` stops at the end of the range.
+
+With ``AUDIO_STREAM_OFFLOAD`` set, the response carries only an
+``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache/lighttpd) header and the
+front-end server does the transfer, including Range handling.
+"""
+import mimetypes
+import os
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+
+class AnyMediaRenderer(BaseRenderer):
+    """
+    Accepts any ``Accept`` header so clients asking only for ``audio/*`` are
+    not refused with 406. File responses bypass rendering; error payloads are
+    rendered as JSON.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of ``path`` starting at ``start``"""
+
+    def __init__(self, path, start, length):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # Lets wsgi.file_wrapper sendfile() from the current offset
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header into sorted, merged ``(start, end)``
+    inclusive pairs.
+
+    Returns None when the header should be ignored (absent, malformed or
+    abusive) and an empty list when no range is satisfiable.
+    """
+    if not header or size <= 0:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    parts = spec.split(',')
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if start > end:
+                    return None
+                if start >= size:
+                    continue
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and since >= last_modified
+
+
+def _offload_response(fieldfile, path):
+    mode = settings.AUDIO_STREAM_OFFLOAD
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.AUDIO_STREAM_ACCEL_PREFIX.rstrip('/') + '/' + fieldfile.name
+    else:
+        response['X-Sendfile'] = path
+    # Let the front-end server pick the Content-Type from the file it serves
+    del response['Content-Type']
+    return response
+
+
+def _multipart_body(path, ranges, boundary, content_type, size):
+    with open(path, 'rb') as source:
+        for start, end in ranges:
+            yield (
+                f'--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode('ascii')
+            source.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = source.read(min(BLOCK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            yield b'\r\n'
+        yield f'--{boundary}--\r\n'.encode('ascii')
+
+
+def serve_file(request, fieldfile, etag_seed):
+    """
+    Serve a stored file with conditional GET and Range support.
+
+    ``etag_seed`` identifies the owning row; it is combined with the file's
+    size and modification time into a strong ETag.
+    """
+    path = fieldfile.path
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = f'"{etag_seed}-{size:x}-{stat.st_mtime_ns:x}"'
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        conditional['Accept-Ranges'] = 'bytes'
+        return conditional
+
+    if getattr(settings, 'AUDIO_STREAM_OFFLOAD', None):
+        response = _offload_response(fieldfile, path)
+    else:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        ranges = None
+        if _if_range_matches(request, etag, last_modified):
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif ranges and len(ranges) > 1:
+            boundary = uuid.uuid4().hex
+            response = StreamingHttpResponse(
+                _multipart_body(path, ranges, boundary, content_type, size),
+                status=206,
+                content_type=f'multipart/byteranges; boundary={boundary}',
+            )
+        else:
+            start, end = ranges[0] if ranges else (0, size - 1)
+            length = max(end - start + 1, 0)
+            response = FileResponse(RangeFile(path, start, length), content_type=content_type)
+            response.block_size = BLOCK_SIZE
+            response['Content-Length'] = str(length)
+            if ranges:
+                response.status_code = 206
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
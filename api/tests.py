@@ -1,3 +1,2121 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.utils import ConnectionDoesNotExist
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import (
+    admission, archive, authentication, autocomplete, blobs, events, images, isrc, jobs, notifications, search, plays,
+    processing, recommendations, response_cache, rollups, routers, stats, trending, uploads,
+)
+from .serializers import TrackSerializer
+from .models import (
+    User, Genre, Track, Notification, PlayHistory,
+    TrackHourlyPlays, TrackDailyPlays, ArtistDailyPlays, GenreDailyPlays, UploadSession, Job, Blob, TrackFingerprint,
+    CatalogChange, TrackCooccurrence, TrackNeighbor, RollupWatermark, TrendingChart, NotificationCounter,
+    IsrcSequence, IsrcAssignment,
+)
+
+
+ROW_COUNTS = (1, 100, 10000)
+
+
+def make_user(email, **extra):
+    # No password: hashing one per user would dominate the suite's runtime
+    return User.objects.create_user(email=email, username=email, password=None, **extra)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class QueryBudgetTests(TestCase):
+    """Each endpoint must cost a fixed number of queries however many rows exist (on a response cache miss)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        cls.artist = make_user('artist@example.com', user_type='artist', display_name='Artist')
+        cls.artists = [cls.artist] + [
+            make_user(f'artist{i}@example.com', user_type='artist') for i in range(3)
+        ]
+        cls.genres = Genre.objects.bulk_create(Genre(name=f'Genre {i}') for i in range(5))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.tracks = []
+
+    def grow_tracks(self, count):
+        """Top the catalog up to ``count`` tracks spread over several artists and genres"""
+        new = [
+            Track(
+                title=f'Track {i}',
+                artist=self.artists[i % len(self.artists)],
+                genre=self.genres[i % len(self.genres)],
+                release_date=datetime.date(2024, 1, 1),
+                audio_file='audio_files/track.mp3',
+            )
+            for i in range(len(self.tracks), count)
+        ]
+        self.tracks += Track.objects.bulk_create(new)
+        return len(self.tracks)
+
+    def assert_list_budget(self, url, user, grow, budget):
+        self.client.force_authenticate(user)
+        for count in ROW_COUNTS:
+            total = grow(count)
+            with self.subTest(rows=count):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url, {'page_size': 100})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), min(total, 100))
+
+                if response.data['next']:
+                    with self.assertNumQueries(budget):
+                        response = self.client.get(response.data['next'])
+                    self.assertEqual(response.status_code, 200)
+
+    def test_get_all_tracks(self):
+        self.assert_list_budget('/api/admin/all-tracks/', self.admin, self.grow_tracks, 1)
+
+    def test_get_all_tracks_filtered(self):
+        self.assert_list_budget('/api/admin/all-tracks/?status=pending', self.admin, self.grow_tracks, 1)
+
+    def test_get_pending_tracks(self):
+        self.assert_list_budget('/api/admin/pending-tracks/', self.admin, self.grow_tracks, 1)
+
+    def test_pending_tracks_only_lists_pending(self):
+        self.grow_tracks(3)
+        Track.objects.filter(id=self.tracks[0].id).update(status='approved')
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/admin/pending-tracks/')
+        self.assertEqual({track['id'] for track in response.data['results']}, {str(track.id) for track in self.tracks[1:]})
+
+    def test_get_artist_tracks(self):
+        def grow(count):
+            Track.objects.bulk_create(
+                Track(
+                    title=f'Track {i}',
+                    artist=self.artist,
+                    genre=self.genres[i % len(self.genres)],
+                    release_date=datetime.date(2024, 1, 1),
+                    audio_file='audio_files/track.mp3',
+                )
+                for i in range(Track.objects.count(), count)
+            )
+            return count
+
+        self.assert_list_budget('/api/music/artist-tracks/', self.artist, grow, 1)
+
+    def test_get_artist_list(self):
+        def grow(count):
+            existing = User.objects.filter(user_type='artist').count()
+            User.objects.bulk_create(
+                User(email=f'bulk{i}@example.com', username=f'bulk{i}', user_type='artist')
+                for i in range(existing, count)
+            )
+            return max(existing, count)
+
+        self.assert_list_budget('/api/admin/artists/', self.admin, grow, 1)
+
+    def test_get_user_notifications(self):
+        def grow(count):
+            self.grow_tracks(count)
+            existing = Notification.objects.filter(user=self.artist).count()
+            Notification.objects.bulk_create(
+                Notification(
+                    user=self.artist,
+                    notification_type='track_processing',
+                    title='Track Uploaded',
+                    message='Uploaded',
+                    track=self.tracks[i],
+                )
+                for i in range(existing, count)
+            )
+            return count
+
+        self.assert_list_budget('/api/users/notifications/', self.artist, grow, 1)
+
+    def test_get_track(self):
+        self.client.force_authenticate(self.admin)
+        self.grow_tracks(1)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/music/tracks/{self.tracks[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['artist']['email'], self.artist.email)
+
+    def test_get_genres(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/genres/')
+        self.assertEqual(len(response.data), len(self.genres))
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pagination walks the whole table exactly once"""
+
+    def setUp(self):
+        self.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        artist = make_user('artist@example.com', user_type='artist')
+        # Identical created_at values force the id tie-breaker to do its job
+        Track.objects.bulk_create(
+            Track(title=f'Track {i}', artist=artist, release_date=datetime.date(2024, 1, 1),
+                  audio_file='audio_files/track.mp3')
+            for i in range(45)
+        )
+        Track.objects.update(created_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_walks_every_row_once(self):
+        seen = []
+        url = '/api/admin/all-tracks/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            seen += [track['id'] for track in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/admin/all-tracks/', {'page_size': 100000})
+        self.assertEqual(len(response.data['results']), 45)
+        with self.settings(API_MAX_PAGE_SIZE=5):
+            response = self.client.get('/api/admin/all-tracks/', {'page_size': 100000})
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/admin/all-tracks/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PlayBufferTests(TestCase):
+    """record_play buffers plays and applies them in one batch"""
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+        overrides = override_settings(PLAY_BUFFER={
+            'MAX_SIZE': 1000, 'FLUSH_INTERVAL': 0, 'JOURNAL_DIR': self.journal_dir,
+        })
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(plays.play_buffer.flush)
+
+        artist = make_user('artist@example.com', user_type='artist')
+        self.listener = make_user('listener@example.com', user_type='listener')
+        self.tracks = [
+            Track.objects.create(title=f'Track {i}', artist=artist, release_date=datetime.date(2024, 1, 1),
+                                 audio_file='audio_files/track.mp3', lyrics='words')
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.listener)
+
+    def test_plays_are_buffered_until_flush(self):
+        for track in (self.tracks[0], self.tracks[0], self.tracks[1]):
+            response = self.client.post(f'/api/tracks/{track.id}/play/')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(PlayHistory.objects.count(), 0)
+
+        self.assertEqual(plays.play_buffer.flush(), 3)
+        self.assertEqual(PlayHistory.objects.filter(listener=self.listener).count(), 3)
+        self.tracks[0].refresh_from_db()
+        self.tracks[1].refresh_from_db()
+        self.assertEqual((self.tracks[0].play_count, self.tracks[1].play_count), (2, 1))
+        self.assertEqual(self.tracks[0].lyrics, 'words')
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_unknown_track(self):
+        response = self.client.post('/api/tracks/00000000-0000-0000-0000-000000000000/play/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_size_trigger(self):
+        with self.settings(PLAY_BUFFER={'MAX_SIZE': 2, 'FLUSH_INTERVAL': 0, 'JOURNAL_DIR': self.journal_dir}):
+            self.client.post(f'/api/tracks/{self.tracks[0].id}/play/')
+            self.client.post(f'/api/tracks/{self.tracks[0].id}/play/')
+        self.assertEqual(PlayHistory.objects.count(), 2)
+
+    def test_abandoned_segment_is_replayed_once(self):
+        buffer = plays.PlayBuffer()
+        buffer.add(plays.encode_play(self.tracks[0].id, self.listener.id))
+        buffer.add(plays.encode_play(self.tracks[1].id))
+        # Simulate a worker dying before its buffer was flushed
+        buffer._journal.close()
+        segment = buffer._segment
+        buffer._plays, buffer._segment, buffer._journal = [], None, None
+        shutil.copy(os.path.join(self.journal_dir, segment), os.path.join(self.journal_dir, 'copy'))
+
+        self.assertEqual(plays.recover_segments(grace=0), (1, 2))
+        self.assertEqual(PlayHistory.objects.count(), 2)
+
+        # A second replay of the same segment is a no-op
+        os.rename(os.path.join(self.journal_dir, 'copy'), os.path.join(self.journal_dir, segment))
+        self.assertEqual(plays.recover_segments(grace=0), (0, 0))
+        self.assertEqual(PlayHistory.objects.count(), 2)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+
+class PlayBatchTests(TestCase):
+    """POST /api/plays/batch/ validates every item and writes the good ones together"""
+
+    def setUp(self):
+        artist = make_user('artist@example.com', user_type='artist')
+        self.listener = make_user('listener@example.com', user_type='listener')
+        self.tracks = [
+            Track.objects.create(title=f'Track {i}', artist=artist, release_date=datetime.date(2024, 1, 1),
+                                 audio_file='audio_files/track.mp3')
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.listener)
+
+    def test_per_item_results(self):
+        payload = {'plays': [
+            {'track_id': str(self.tracks[0].id), 'played_at': '2024-05-01T10:00:00Z'},
+            {'track_id': str(self.tracks[0].id)},
+            {'track_id': 'not-a-uuid'},
+            {'track_id': '00000000-0000-0000-0000-000000000000'},
+            {'track_id': str(self.tracks[1].id), 'played_at': '2999-01-01T00:00:00Z'},
+            {'track_id': str(self.tracks[1].id), 'played_at': 'yesterday'},
+        ]}
+        response = self.client.post('/api/plays/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['recorded'], response.data['failed']), (2, 4))
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['recorded', 'recorded', 'error', 'error', 'error', 'error'],
+        )
+        self.assertEqual(response.data['results'][3]['error'], 'Track not found')
+
+        self.tracks[0].refresh_from_db()
+        self.assertEqual(self.tracks[0].play_count, 2)
+        self.assertTrue(PlayHistory.objects.filter(
+            played_at=datetime.datetime(2024, 5, 1, 10, tzinfo=datetime.timezone.utc)
+        ).exists())
+
+    def test_lookups_do_not_scale_with_batch_size(self):
+        payload = {'plays': [{'track_id': str(self.tracks[i % 3].id)} for i in range(400)]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/plays/batch/', payload, format='json')
+        self.assertEqual(response.data['recorded'], 400)
+        statements = [query['sql'].split()[0] for query in queries]
+        # One track IN lookup, one listener lookup, and the trend scores for
+        # api.trending (charts are refreshed by a job); inserts are chunked and
+        # tracks with equal deltas share an UPDATE
+        self.assertEqual(statements.count('SELECT'), 3)
+        self.assertLessEqual(statements.count('UPDATE'), 2)
+        self.assertEqual(PlayHistory.objects.count(), 400)
+
+    def test_rejects_oversized_batch(self):
+        with self.settings(PLAY_BUFFER={'MAX_BATCH_ITEMS': 2}):
+            payload = {'plays': [{'track_id': str(self.tracks[0].id)}] * 3}
+            response = self.client.post('/api/plays/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PlayHistory.objects.count(), 0)
+
+
+def at(day, hour=0):
+    return datetime.datetime(2024, 5, day, hour, tzinfo=datetime.timezone.utc)
+
+
+@override_settings(ROLLUPS={'SETTLE_SECONDS': 0})
+class RollupTests(TestCase):
+    """Rollups fold each play exactly once and back the analytics endpoints"""
+
+    def setUp(self):
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.genre = Genre.objects.create(name='Jazz')
+        self.track = Track.objects.create(title='Track', artist=self.artist, genre=self.genre,
+                                          release_date=datetime.date(2024, 1, 1), audio_file='audio_files/track.mp3')
+        self.play(at(1, 10), at(1, 10), at(1, 11), at(2, 9))
+
+    def play(self, *times):
+        PlayHistory.objects.bulk_create(PlayHistory(track=self.track, played_at=when) for when in times)
+
+    def test_incremental_and_idempotent(self):
+        self.assertEqual(rollups.run(chunk_size=3), 4)
+        self.assertEqual(rollups.run(), 0)
+        self.assertEqual(TrackHourlyPlays.objects.get(bucket=at(1, 10)).plays, 2)
+        self.assertEqual(TrackDailyPlays.objects.get(bucket=datetime.date(2024, 5, 1)).plays, 3)
+
+        self.play(at(2, 9), at(3, 0))
+        self.assertEqual(rollups.run(), 2)
+        self.assertEqual(ArtistDailyPlays.objects.get(bucket=datetime.date(2024, 5, 2)).plays, 2)
+        self.assertEqual(GenreDailyPlays.objects.filter(genre=self.genre).count(), 3)
+
+        rollups.reset()
+        self.assertEqual(rollups.run(), 6)
+        self.assertEqual(TrackDailyPlays.objects.get(bucket=datetime.date(2024, 5, 2)).plays, 2)
+
+    @override_settings(ROLLUPS={'SETTLE_SECONDS': 60})
+    def test_only_settled_plays_are_folded(self):
+        # The first run only notes the highest id; a lower id may still be uncommitted
+        self.assertEqual(rollups.run(), 0)
+        self.play(at(3, 0))
+        self.assertEqual(rollups.run(), 0)
+
+        RollupWatermark.objects.filter(name=rollups.WATERMARK).update(
+            seen_at=timezone.now() - datetime.timedelta(seconds=61)
+        )
+        self.assertEqual(rollups.run(), 4)
+        self.assertEqual(rollups.run(), 0)
+        RollupWatermark.objects.filter(name=rollups.WATERMARK).update(
+            seen_at=timezone.now() - datetime.timedelta(seconds=61)
+        )
+        self.assertEqual(rollups.run(), 1)
+
+    def test_series_endpoints(self):
+        rollups.run()
+        client = APIClient()
+        client.force_authenticate(self.artist)
+
+        response = client.get(f'/api/analytics/tracks/{self.track.id}/plays/',
+                              {'start': '2024-05-01', 'end': '2024-05-01', 'granularity': 'hour'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([point['plays'] for point in response.data['series']], [2, 1])
+
+        response = client.get(f'/api/analytics/artists/{self.artist.id}/plays/',
+                              {'start': '2024-05-01', 'end': '2024-05-31'})
+        self.assertEqual([point['plays'] for point in response.data['series']], [3, 1])
+
+        response = client.get(f'/api/analytics/tracks/{self.track.id}/plays/',
+                              {'start': '2024-01-01', 'end': '2024-12-31', 'granularity': 'hour'})
+        self.assertEqual(response.status_code, 400)
+
+        client.force_authenticate(make_user('other@example.com', user_type='artist'))
+        response = client.get(f'/api/analytics/tracks/{self.track.id}/plays/')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(ROLLUPS={'SETTLE_SECONDS': 0}, RECOMMENDATIONS={'SETTLE_SECONDS': 0})
+class PlayArchiveTests(TestCase):
+    """Old plays move to archive segments and still feed rollup rebuilds"""
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        overrides = override_settings(PLAY_ARCHIVE={'DIR': self.archive_dir, 'BATCH_SIZE': 2})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        artist = make_user('artist@example.com', user_type='artist')
+        self.track = Track.objects.create(title='Track', artist=artist, release_date=datetime.date(2024, 1, 1),
+                                          audio_file='audio_files/track.mp3')
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.old = [now - datetime.timedelta(days=days) for days in (200, 200, 150)]
+        PlayHistory.objects.bulk_create(PlayHistory(track=self.track, played_at=when) for when in self.old + [now])
+
+    def test_only_rolled_up_plays_are_archived(self):
+        self.assertEqual(archive.archive(retention_days=90), 0)
+        rollups.run()
+        self.assertEqual(archive.archive(retention_days=90), 3)
+        self.assertEqual(PlayHistory.objects.count(), 1)
+
+        archived = list(archive.iter_archived_plays())
+        self.assertEqual(sorted(record['played_at'] for record in archived), sorted(self.old))
+        self.assertEqual({record['track_id'] for record in archived}, {str(self.track.id)})
+        # Batches of two, split per day
+        self.assertEqual(len(list(archive.iter_archived_plays(start=self.old[2].date()))), 1)
+
+    def test_rebuild_reads_archive(self):
+        rollups.run()
+        before = list(TrackDailyPlays.objects.order_by('bucket').values_list('bucket', 'plays'))
+        archive.archive(retention_days=90)
+
+        self.assertEqual(rollups.rebuild(), 4)
+        after = list(TrackDailyPlays.objects.order_by('bucket').values_list('bucket', 'plays'))
+        self.assertEqual(after, before)
+        self.assertEqual(TrackHourlyPlays.objects.count(), 3)
+
+    def test_orphans_are_removed(self):
+        rollups.run()
+        archive.archive(retention_days=90)
+        orphan = os.path.join(self.archive_dir, 'orphan.jsonl.gz')
+        open(orphan, 'wb').close()
+        self.assertEqual(archive.remove_orphans(grace=0), 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(len(list(archive.iter_archived_plays())), 3)
+
+
+class AdminStatsTests(TestCase):
+    """Admin stats cost one aggregate per table, or one read with the counter cache"""
+
+    def setUp(self):
+        self.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        self.artist = make_user('artist@example.com', user_type='artist')
+        make_user('listener@example.com', user_type='listener')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_track(self, **extra):
+        return Track.objects.create(title='Track', artist=self.artist, release_date=datetime.date(2024, 1, 1),
+                                    audio_file='audio_files/track.mp3', **extra)
+
+    def test_aggregates(self):
+        self.add_track()
+        self.add_track(status='approved')
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/admin/stats/')
+        self.assertEqual(response.data['total_tracks'], 2)
+        self.assertEqual(response.data['approved_tracks'], 1)
+        self.assertEqual(response.data['total_artists'], 1)
+        self.assertEqual(response.data['total_listeners'], 1)
+
+    @override_settings(STATS_COUNTER_CACHE=True)
+    def test_counter_cache(self):
+        self.assertEqual(len(stats.reconcile()), len(stats.COUNTERS))
+
+        track = self.add_track()
+        self.add_track()
+        response = self.client.put(f'/api/admin/tracks/{track.id}/status/', {'status': 'rejected'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(self.artist)
+        self.assertEqual(self.client.delete(f'/api/music/tracks/{track.id}/delete/').status_code, 204)
+        self.client.force_authenticate(self.admin)
+        make_user('another@example.com', user_type='artist')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/admin/stats/')
+        self.assertEqual(response.data['total_tracks'], 1)
+        self.assertEqual(response.data['pending_tracks'], 1)
+        self.assertEqual(response.data['rejected_tracks'], 0)
+        self.assertEqual(response.data['total_artists'], 2)
+
+        # Cascading deletes go through post_delete too
+        self.artist.delete()
+        self.assertEqual(stats.reconcile(), {})
+
+    @override_settings(STATS_COUNTER_CACHE=True)
+    def test_reconcile_reports_drift(self):
+        stats.reconcile()
+        # bulk_create bypasses the signal handlers
+        Track.objects.bulk_create([Track(title='Bulk', artist=self.artist, release_date=datetime.date(2024, 1, 1),
+                                         audio_file='audio_files/track.mp3')])
+        self.assertEqual(stats.reconcile(dry_run=True), {'tracks.total': (0, 1), 'tracks.pending': (0, 1)})
+        self.assertEqual(stats.reconcile(), {'tracks.total': (0, 1), 'tracks.pending': (0, 1)})
+        self.assertEqual(stats.reconcile(), {})
+
+
+class StreamTrackTests(TestCase):
+    """Audio streaming honours Range, conditional GET and offload settings"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        overrides = override_settings(MEDIA_ROOT=self.media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'audio_files'))
+        self.payload = bytes(range(256)) * 4
+        with open(os.path.join(self.media_root, 'audio_files', 'song.mp3'), 'wb') as audio:
+            audio.write(self.payload)
+
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.track = Track.objects.create(title='Track', artist=self.artist, release_date=datetime.date(2024, 1, 1),
+                                          audio_file='audio_files/song.mp3')
+        self.url = f'/api/music/tracks/{self.track.id}/stream/'
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('listener@example.com', user_type='listener'))
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_and_single_range(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='audio/mpeg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(self.body(response), self.payload)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.body(response), self.payload[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(self.body(response), self.payload[-4:])
+
+    def test_multi_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1, 100-101, 1-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges'))
+        body = self.body(response)
+        self.assertIn(b'Content-Range: bytes 0-3/1024\r\n\r\n' + self.payload[0:4], body)
+        self.assertIn(b'Content-Range: bytes 100-101/1024\r\n\r\n' + self.payload[100:102], body)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-6000')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # A stale If-Range turns a range request into a full response
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_access_matches_get_track(self):
+        self.client.force_authenticate(make_user('other@example.com', user_type='artist'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(AUDIO_STREAM_OFFLOAD='x-accel-redirect', AUDIO_STREAM_ACCEL_PREFIX='/protected/')
+    def test_offload(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/audio_files/song.mp3')
+        self.assertEqual(response.content, b'')
+
+
+class ChunkedUploadTests(TestCase):
+    """Chunks can arrive in any order and finalize into a validated Track"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(
+            MEDIA_ROOT=os.path.join(self.root, 'media'),
+            CHUNKED_UPLOADS={'DIR': os.path.join(self.root, 'uploads'), 'MIN_CHUNK_SIZE': 4},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.client = APIClient()
+        self.client.force_authenticate(self.artist)
+        self.payload = b'0123456789'
+
+    def start(self, **extra):
+        response = self.client.post('/api/music/uploads/', {
+            'filename': 'master.wav', 'total_size': len(self.payload), 'chunk_size': 4, **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['chunk_count'], 3)
+        return f'/api/music/uploads/{response.data["id"]}/'
+
+    def put_chunk(self, url, index, body, **headers):
+        return self.client.put(f'{url}chunks/{index}/', body, content_type='application/octet-stream', **headers)
+
+    def test_resume_and_finalize(self):
+        url = self.start(sha256=hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(self.put_chunk(url, 2, self.payload[8:]).status_code, 200)
+        response = self.put_chunk(url, 0, self.payload[:4])
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.payload[:4]).hexdigest())
+        self.assertEqual(self.client.get(url).data['received_chunks'], [0, 2])
+
+        response = self.client.post(f'{url}finalize/', {'title': 'Master', 'release_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['missing_chunks'], [1])
+
+        self.assertEqual(self.put_chunk(url, 1, self.payload[4:8]).status_code, 200)
+        response = self.client.post(f'{url}finalize/', {'title': 'Master', 'release_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 201)
+
+        track = Track.objects.get(id=response.data['id'])
+        with track.audio_file.open('rb') as audio:
+            self.assertEqual(audio.read(), self.payload)
+        self.assertEqual(UploadSession.objects.get().status, 'complete')
+        self.assertEqual(Notification.objects.filter(track=track).count(), 1)
+        self.assertEqual(self.client.post(f'{url}finalize/', {}).status_code, 409)
+
+    def test_rejects_bad_chunks(self):
+        url = self.start()
+        self.assertEqual(self.put_chunk(url, 0, b'abc').status_code, 400)
+        self.assertEqual(self.put_chunk(url, 0, b'abcde').status_code, 400)
+        self.assertEqual(self.put_chunk(url, 3, b'ab').status_code, 400)
+        self.assertEqual(self.put_chunk(url, 0, b'abcd', HTTP_X_CHUNK_SHA256='0' * 64).status_code, 400)
+        self.assertEqual(self.client.get(url).data['received_chunks'], [])
+
+    def test_checksum_and_metadata_validation(self):
+        url = self.start(sha256='0' * 64)
+        for index in range(3):
+            self.put_chunk(url, index, self.payload[index * 4:index * 4 + 4])
+        response = self.client.post(f'{url}finalize/', {'title': 'Master', 'release_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.payload).hexdigest())
+
+        url = self.start()
+        for index in range(3):
+            self.put_chunk(url, index, self.payload[index * 4:index * 4 + 4])
+        response = self.client.post(f'{url}finalize/', {'title': 'Master'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('release_date', response.data)
+        self.assertEqual(Track.objects.count(), 0)
+
+    def test_minimum_chunk_size(self):
+        def start(total_size, chunk_size):
+            return self.client.post('/api/music/uploads/', {
+                'filename': 'master.wav', 'total_size': total_size, 'chunk_size': chunk_size,
+            }, format='json')
+
+        response = start(1024 * 1024 * 1024, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('chunk_size', response.data)
+        self.assertEqual(start(10, 3).status_code, 400)
+        # A file smaller than the minimum goes up in one chunk
+        self.assertEqual(start(3, 3).data['chunk_count'], 1)
+
+    def test_stale_sessions_are_collected(self):
+        url = self.start()
+        self.put_chunk(url, 0, self.payload[:4])
+        self.assertEqual(uploads.collect_garbage(ttl_hours=1), 0)
+        UploadSession.objects.update(updated_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(uploads.collect_garbage(ttl_hours=1), 1)
+        self.assertEqual(os.listdir(os.path.join(self.root, 'uploads')), [])
+
+
+def make_wav(seconds=1.0, rate=44100, amplitude=0.5, channels=2, width=2):
+    """A sine tone as PCM WAV bytes"""
+    import io
+    import numpy as np
+    t = np.arange(int(seconds * rate)) / rate
+    samples = np.round(amplitude * np.sin(2 * np.pi * 440 * t) * (2 ** (8 * width - 1) - 1)).astype('<i4')
+    frames = np.repeat(samples, channels)
+    if width == 1:
+        frames += 128
+    raw = b''.join(int(v).to_bytes(width, 'little', signed=True) for v in frames) if width == 3 else frames.astype('u1' if width == 1 else f'<i{width}').tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(width)
+        writer.setframerate(rate)
+        writer.writeframes(raw)
+    return buffer.getvalue()
+
+
+@override_settings(JOB_WORKER={'RETRY_BACKOFF': 0})
+class MediaProcessingTests(TestCase):
+    """Uploads stay in processing until the worker has analyzed them"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(MEDIA_ROOT=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.client = APIClient()
+        self.client.force_authenticate(self.artist)
+
+    def upload(self, content, name='tone.wav'):
+        response = self.client.post('/api/music/upload/', {
+            'title': 'Tone', 'release_date': '2024-01-01',
+            'audio_file': SimpleUploadedFile(name, content, content_type='audio/wav'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'processing')
+        return Track.objects.get(id=response.data['id'])
+
+    def test_analyze_audio(self):
+        for width in (1, 2, 3, 4):
+            path = os.path.join(self.root, f'tone{width}.wav')
+            with open(path, 'wb') as f:
+                f.write(make_wav(seconds=2, width=width, channels=1 if width == 1 else 2))
+            result = processing.analyze_audio(path)
+            self.assertAlmostEqual(result['duration'], 2.0)
+            # A sine at half scale is 1/(2*sqrt(2)) RMS, about -9 dBFS
+            self.assertAlmostEqual(result['loudness'], -9.03, delta=0.1)
+            self.assertEqual(len(result['peaks']), processing.PEAK_COUNT)
+            self.assertAlmostEqual(max(result['peaks']), 0.5, delta=0.01)
+
+    def test_upload_is_processed_then_pending(self):
+        track = self.upload(make_wav(seconds=1.5))
+        self.assertEqual(Job.objects.get(kind='process_track').payload, {'track_id': str(track.id)})
+
+        self.assertEqual(jobs.run_worker(concurrency=2, poll_interval=0.1, once=True), 2)
+        track.refresh_from_db()
+        self.assertEqual(track.status, 'pending')
+        self.assertEqual(track.duration, datetime.timedelta(seconds=1.5))
+        self.assertEqual(len(track.waveform_peaks), processing.PEAK_COUNT)
+        self.assertIsNotNone(track.loudness)
+        self.assertEqual(Job.objects.get(kind='process_track').status, 'done')
+
+        # Peaks are sent with the track itself, not with every track in a list
+        listed = self.client.get('/api/music/artist-tracks/').json()['results'][0]
+        self.assertNotIn('waveform_peaks', listed)
+        detail = self.client.get(f'/api/music/tracks/{track.id}/').json()
+        self.assertEqual(len(detail['waveform_peaks']), processing.PEAK_COUNT)
+
+    def test_failed_jobs_retry_then_give_up(self):
+        track = self.upload(b'not audio at all', name='broken.mp3')
+        self.assertEqual(jobs.run_worker(once=True, inline=True), 6)
+        job = Job.objects.get(kind='process_track')
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertIn('UnsupportedAudio', job.last_error)
+        track.refresh_from_db()
+        self.assertEqual(track.status, 'pending')
+        self.assertIsNone(track.duration)
+
+    def test_claim_is_exclusive_and_expired_leases_requeue(self):
+        job = jobs.enqueue('process_track', {'track_id': '00000000-0000-0000-0000-000000000000'})
+        self.assertEqual(jobs.claim('a', ['process_track']).id, job.id)
+        self.assertIsNone(jobs.claim('b', ['process_track']))
+
+        jobs.requeue_expired(lease_seconds=0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        # A job whose track is gone completes without doing anything
+        self.assertEqual(jobs.run_worker(once=True, inline=True), 1)
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    def test_renewed_leases_and_stale_attempts(self):
+        jobs.enqueue('process_track', {'track_id': '00000000-0000-0000-0000-000000000000'})
+        first = jobs.claim('a', ['process_track'])
+        Job.objects.filter(id=first.id).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        # A renewed lease is not expired
+        jobs.renew([first])
+        jobs.requeue_expired(lease_seconds=60)
+        self.assertEqual(Job.objects.get().status, 'running')
+
+        # Once it does expire and another attempt takes over, the first one cannot record its outcome
+        jobs.requeue_expired(lease_seconds=0)
+        Job.objects.update(run_after=timezone.now())
+        second = jobs.claim('a', ['process_track'])
+        self.assertEqual(second.attempts, 2)
+        self.assertFalse(jobs.complete(first))
+        jobs.fail(first, 'stale')
+        jobs.renew([first])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.locked_at), ('running', 2, second.locked_at))
+        self.assertTrue(jobs.complete(second))
+        self.assertEqual(Job.objects.get().status, 'done')
+
+
+def make_png(width=800, height=600, mode='RGB'):
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ImageDerivativeTests(TestCase):
+    """Covers are resized by the worker and served under content-hashed names"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(MEDIA_ROOT=self.root, IMAGE_DERIVATIVES={})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.client = APIClient()
+
+    def make_track(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Track.objects.create(
+                title='Cover', artist=self.artist, release_date='2024-01-01', audio_file='audio_files/a.mp3',
+                cover_art=SimpleUploadedFile('cover.png', content, content_type='image/png'),
+            )
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_worker_renders_every_variant(self):
+        from PIL import Image
+        track = self.make_track(make_png())
+        self.assertIsNone(TrackSerializer(track).data['cover_art_urls'])
+        self.assertEqual(jobs.run_worker(once=True, inline=True), 1)
+
+        track.refresh_from_db()
+        self.assertEqual(track.cover_art_hash, hashlib.sha256(make_png()).hexdigest())
+        urls = TrackSerializer(track).data['cover_art_urls']
+        self.assertEqual(set(urls), set(images.DEFAULTS['SIZES']))
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'image_cache', track.cover_art_hash[:2]))), 8)
+
+        response, body = self.fetch(urls['small']['webp'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(body)) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (256, 192)))
+        self.assertEqual(self.fetch(urls['small']['webp'], HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+
+    def test_missing_variants_render_on_demand_within_cache_limit(self):
+        from PIL import Image
+        track = self.make_track(make_png(mode='RGBA'))
+        Job.objects.all().delete()
+        Track.objects.filter(id=track.id).update(cover_art_hash=hashlib.sha256(make_png(mode='RGBA')).hexdigest())
+        track.refresh_from_db()
+        urls = TrackSerializer(track).data['cover_art_urls']
+
+        response, body = self.fetch(urls['thumb']['jpg'])
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(body)) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (96, 72)))
+
+        with self.settings(IMAGE_DERIVATIVES={'CACHE_MAX_BYTES': 1}):
+            self.assertEqual(self.fetch(urls['large']['webp'])[0].status_code, 200)
+        self.assertEqual(os.listdir(os.path.join(self.root, 'image_cache', track.cover_art_hash[:2])),
+                         [urls['large']['webp'].rsplit('/', 1)[1]])
+
+        self.assertEqual(self.fetch(urls['large']['webp'].replace('large', 'huge'))[0].status_code, 404)
+        self.assertEqual(self.fetch(urls['large']['webp'].replace(track.cover_art_hash[:4], '0000'))[0].status_code, 404)
+
+    def test_cache_is_only_scanned_when_it_may_be_full(self):
+        track = self.make_track(make_png())
+        Job.objects.all().delete()
+        Track.objects.filter(id=track.id).update(cover_art_hash=hashlib.sha256(make_png()).hexdigest())
+        track.refresh_from_db()
+        urls = TrackSerializer(track).data['cover_art_urls']
+        sweep = mock.patch.object(images, '_sweep', wraps=images._sweep)
+
+        with sweep as swept:
+            # The first write scans to learn the cache size; later ones are counted
+            for size in ('thumb', 'small', 'medium'):
+                self.assertEqual(self.fetch(urls[size]['jpg'])[0].status_code, 200)
+            self.assertEqual(swept.call_count, 1)
+            with self.settings(IMAGE_DERIVATIVES={'CACHE_MAX_BYTES': 1}):
+                self.fetch(urls['large']['jpg'])
+            self.assertEqual(swept.call_count, 2)
+            with self.settings(IMAGE_DERIVATIVES={'SWEEP_SECONDS': 0}):
+                self.fetch(urls['thumb']['webp'])
+            self.assertEqual(swept.call_count, 3)
+
+    def test_replacing_the_image_invalidates_the_hash(self):
+        track = self.make_track(make_png())
+        jobs.run_worker(once=True, inline=True)
+        track.refresh_from_db()
+        old_hash = track.cover_art_hash
+
+        track.cover_art = SimpleUploadedFile('cover2.png', make_png(400, 400), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            track.save()
+        track.refresh_from_db()
+        self.assertEqual(track.cover_art_hash, '')
+        jobs.run_worker(once=True, inline=True)
+        track.refresh_from_db()
+        self.assertNotIn(track.cover_art_hash, ('', old_hash))
+
+        track.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            track.save()
+        self.assertEqual(Job.objects.filter(status='queued').count(), 0)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Identical uploads share one stored file and one analysis"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(MEDIA_ROOT=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.client = APIClient()
+        self.client.force_authenticate(self.artist)
+        self.audio = make_wav(seconds=0.5)
+        self.cover = make_png(64, 64)
+
+    def upload(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/music/upload/', {
+                'title': title, 'release_date': '2024-01-01',
+                'audio_file': SimpleUploadedFile('master.WAV', self.audio, content_type='audio/wav'),
+                'cover_art': SimpleUploadedFile('cover.png', self.cover, content_type='image/png'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Track.objects.get(id=response.data['id'])
+
+    def stored_files(self, prefix):
+        directory = os.path.join(self.root, prefix)
+        return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+    def test_identical_upload_is_metadata_only(self):
+        first = self.upload('Take 1')
+        sha256 = hashlib.sha256(self.audio).hexdigest()
+        self.assertEqual(first.audio_file.name, f'audio_files/{sha256[:2]}/{sha256}.wav')
+        self.assertEqual(first.cover_art_hash, hashlib.sha256(self.cover).hexdigest())
+        # Analysis, fingerprint and cover derivatives
+        self.assertEqual(jobs.run_worker(once=True, inline=True), 3)
+
+        second = self.upload('Take 2')
+        self.assertEqual(Job.objects.filter(kind__in=['process_track', 'image_derivatives']).count(), 2)
+        self.assertEqual(second.status, 'pending')
+        first.refresh_from_db()
+        self.assertEqual((second.duration, second.waveform_peaks), (first.duration, first.waveform_peaks))
+        self.assertEqual(self.stored_files('audio_files'), [f'{sha256}.wav'])
+        self.assertEqual(len(self.stored_files('cover_art')), 1)
+        self.assertEqual(sorted(Blob.objects.values_list('ref_count', flat=True)), [2, 2])
+        self.assertIsNotNone(self.client.get(f'/api/music/tracks/{second.id}/').json()['cover_art_urls'])
+
+    def test_last_reference_deletes_the_file(self):
+        first, second = self.upload('Take 1'), self.upload('Take 2')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get(name=second.audio_file.name).ref_count, 1)
+        self.assertEqual(len(self.stored_files('audio_files')), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(Blob.objects.count(), 0)
+        self.assertEqual(self.stored_files('audio_files') + self.stored_files('cover_art'), [])
+
+    def test_verify(self):
+        track = self.upload('Take 1')
+        self.assertEqual(list(blobs.verify()), [])
+        self.assertEqual(Blob.objects.filter(verified_at__isnull=True).count(), 0)
+
+        Blob.objects.filter(name=track.audio_file.name).update(ref_count=5)
+        with open(track.cover_art.path, 'ab') as cover:
+            cover.write(b'bitrot')
+        problems = {blob.name: problem for blob, problem in blobs.verify(repair=True)}
+        self.assertEqual(problems, {
+            track.audio_file.name: 'ref_count is 5, 1 references found',
+            track.cover_art.name: 'content does not match sha256',
+        })
+        self.assertEqual(Blob.objects.get(name=track.audio_file.name).ref_count, 1)
+
+
+def make_melody_wav(seed, seconds=20, rate=44100, trim=0.0, gain=0.5, width=2):
+    """A random sequence of decaying harmonic notes as mono PCM WAV bytes"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(0.25 * rate)) / rate
+    notes = []
+    for frequency in rng.choice([220, 247, 262, 294, 330, 349, 392, 440, 494, 523, 587, 659, 698, 784, 880], int(seconds * 4)):
+        notes.append(np.exp(-3 * t) * (np.sin(2 * np.pi * frequency * t) + 0.5 * np.sin(4 * np.pi * frequency * t)))
+    samples = np.concatenate(notes)[int(trim * rate):] * gain / 1.5
+    raw = (samples * 127 + 128).astype('u1') if width == 1 else (samples * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(width)
+        writer.setframerate(rate)
+        writer.writeframes(raw.tobytes())
+    return buffer.getvalue()
+
+
+class FingerprintTests(TestCase):
+    """Re-encoded and trimmed copies are flagged for the reviewer"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(MEDIA_ROOT=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.artist = make_user('artist@example.com', user_type='artist', display_name='Artist')
+        self.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        self.client = APIClient()
+
+    def upload(self, title, content):
+        self.client.force_authenticate(self.artist)
+        response = self.client.post('/api/music/upload/', {
+            'title': title, 'release_date': '2024-01-01',
+            'audio_file': SimpleUploadedFile(f'{title}.wav', content, content_type='audio/wav'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        jobs.run_worker(once=True, inline=True)
+        return Track.objects.get(id=response.data['id'])
+
+    def test_trimmed_reencode_matches_original(self):
+        original = self.upload('original', make_melody_wav(1))
+        unrelated = self.upload('unrelated', make_melody_wav(2))
+        self.assertEqual((original.fingerprint_matches, unrelated.fingerprint_matches), ([], []))
+
+        copy = self.upload('copy', make_melody_wav(1, seconds=15, rate=22050, trim=1.37, gain=0.3, width=1))
+        self.assertEqual([match['id'] for match in copy.fingerprint_matches], [str(original.id)])
+        self.assertEqual(set(copy.fingerprint_matches[0]), {'id', 'matches', 'score'})
+        self.assertGreater(copy.fingerprint_matches[0]['score'], 0.2)
+
+        # Details are read when shown, so they follow the matched track
+        Track.objects.filter(id=original.id).update(status='approved', isrc='USABC2400001')
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(f'/api/music/tracks/{copy.id}/')
+        self.assertEqual(response.json()['fingerprint_matches'], [{
+            **copy.fingerprint_matches[0], 'title': 'original', 'artist': 'Artist', 'status': 'approved', 'isrc': 'USABC2400001',
+        }])
+        response = self.client.get('/api/admin/all-tracks/')
+        listed = {item['id']: item['fingerprint_matches'] for item in response.data['results']}
+        self.assertEqual(listed[str(copy.id)][0]['title'], 'original')
+
+    def test_matches_hidden_from_artists(self):
+        other = make_user('other@example.com', user_type='artist')
+        original = self.upload('original', make_melody_wav(1))
+        self.client.force_authenticate(other)
+        response = self.client.post('/api/music/upload/', {
+            'title': 'copy', 'release_date': '2024-01-01',
+            'audio_file': SimpleUploadedFile('copy.wav', make_melody_wav(1, seconds=10), content_type='audio/wav'),
+        }, format='multipart')
+        jobs.run_worker(once=True, inline=True)
+        copy = Track.objects.get(id=response.data['id'])
+        self.assertEqual(copy.fingerprint_matches[0]['id'], str(original.id))
+
+        response = self.client.get(f'/api/music/tracks/{copy.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('fingerprint_matches', response.json())
+        self.assertNotIn('artist@example.com', response.content.decode())
+
+    def test_identical_audio_reuses_fingerprint(self):
+        content = make_melody_wav(3, seconds=10)
+        first = self.upload('first', content)
+        second = self.upload('second', content)
+        self.assertEqual(bytes(TrackFingerprint.objects.get(track=second).data), bytes(TrackFingerprint.objects.get(track=first).data))
+        self.assertEqual(second.fingerprint_matches[0]['id'], str(first.id))
+        self.assertEqual(second.fingerprint_matches[0]['score'], 1.0)
+
+
+class SearchTests(TestCase):
+    """Ranked full-text search stays in sync with tracks, artists and genres"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin@example.com', user_type='admin', is_staff=True, is_superuser=True)
+        cls.listener = make_user('listener@example.com')
+        cls.artist = make_user('artist@example.com', user_type='artist', display_name='Night Owls')
+        cls.jazz = Genre.objects.create(name='Jazz')
+        cls.rock = Genre.objects.create(name='Rock')
+
+        def track(title, genre, status='approved', **extra):
+            return Track.objects.create(
+                title=title, artist=cls.artist, genre=genre, release_date='2024-01-01',
+                audio_file='audio_files/a.mp3', status=status, **extra,
+            )
+        cls.moon = track('Blue Moon', cls.jazz, lyrics='a river of stars', isrc='USABC2400001')
+        cls.river = track('River Song', cls.rock, lyrics='blue skies over the moon')
+        cls.hidden = track('Blue Pending', cls.jazz, status='pending')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/music/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+
+    def test_ranked_and_filtered(self):
+        # A title hit outranks a lyrics hit; prefixes match; pending tracks are admin-only
+        self.assertEqual(self.search(self.listener, q='blue'), ['Blue Moon', 'River Song'])
+        self.assertEqual(self.search(self.listener, q='riv'), ['River Song', 'Blue Moon'])
+        self.assertEqual(self.search(self.listener, q='usabc2400001'), ['Blue Moon'])
+        self.assertEqual(self.search(self.listener, q='night owls stars'), ['Blue Moon'])
+        self.assertEqual(sorted(self.search(self.admin, q='blue', genre='Jazz')), ['Blue Moon', 'Blue Pending'])
+        self.assertEqual(self.search(self.admin, q='blue', status='pending'), ['Blue Pending'])
+        self.assertEqual(self.search(self.listener, q='"unbalanced'), [])
+        # Staff status decides, as on the admin endpoints, not user_type
+        staff = make_user('staff@example.com', is_staff=True)
+        self.assertEqual(self.search(staff, q='blue', status='pending'), ['Blue Pending'])
+        self.assertEqual(self.search(make_user('typed@example.com', user_type='admin'), q='blue', status='pending'), [])
+
+        self.client.force_authenticate(self.listener)
+        self.assertEqual(self.client.get('/api/music/search/').status_code, 400)
+
+    def test_cursor_pages_follow_rank(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/music/search/', {'q': 'blue', 'page_size': 1})
+        titles = [response.data['results'][0]['title']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            titles.extend(item['title'] for item in response.data['results'])
+        self.assertEqual(titles, self.search(self.admin, q='blue'))
+        self.assertEqual(len(titles), 3)
+
+    def test_index_follows_changes(self):
+        self.moon.title = 'Harvest Moon'
+        self.moon.save()
+        self.assertEqual(self.search(self.listener, q='harvest'), ['Harvest Moon'])
+
+        self.artist.display_name = 'Early Birds'
+        self.artist.save()
+        self.assertEqual(len(self.search(self.listener, q='early birds')), 2)
+
+        self.rock.name = 'Grunge'
+        self.rock.save()
+        self.assertEqual(self.search(self.listener, q='grunge'), ['River Song'])
+
+        self.river.delete()
+        self.assertEqual(self.search(self.listener, q='grunge'), [])
+
+        Track.objects.filter(id=self.moon.id).update(title='Silent Update')
+        self.assertEqual(self.search(self.listener, q='silent'), [])
+        self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(self.search(self.listener, q='silent'), ['Silent Update'])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/api/track/', {'q': 'stars'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.moon])
+        response = self.client.get('/admin/api/track/', {'q': 'artist@example.com'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get('/admin/api/track/', {'q': 'artist@exam'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+@override_settings(AUTOCOMPLETE={'REFRESH_SECONDS': 0, 'SETTLE_SECONDS': 0})
+class AutocompleteTests(TestCase):
+    """Prefix suggestions are ranked by plays and follow catalog edits incrementally"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = make_user('artist@example.com', user_type='artist', display_name='Blue Notes')
+        cls.jazz = Genre.objects.create(name='Bluegrass')
+
+        def track(title, plays, status='approved'):
+            return Track.objects.create(
+                title=title, artist=cls.artist, genre=cls.jazz, release_date='2024-01-01',
+                audio_file='audio_files/a.mp3', status=status, play_count=plays,
+            )
+        cls.moon = track('Blue Moon', 50)
+        cls.velvet = track('Blue Velvet', 200)
+        cls.once = track('Once In A Blue Sky', 10)
+        cls.hidden = track('Blue Pending', 1000, status='pending')
+
+    def setUp(self):
+        self.index = autocomplete.Autocomplete()
+        patcher = mock.patch.object(autocomplete, 'index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def labels(self, q, **params):
+        response = self.client.get('/api/autocomplete/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['label']) for item in response.data['results']]
+
+    def test_ranked_word_prefixes(self):
+        # Artist and genre scores are their approved tracks' total plays
+        self.assertEqual(self.labels('blu'), [
+            ('artist', 'Blue Notes'), ('genre', 'Bluegrass'), ('track', 'Blue Velvet'),
+            ('track', 'Blue Moon'), ('track', 'Once In A Blue Sky'),
+        ])
+        self.assertEqual(self.labels('BLUE  m', types='track'), [('track', 'Blue Moon')])
+        self.assertEqual(self.labels('sky'), [('track', 'Once In A Blue Sky')])
+        self.assertEqual(self.labels('b', types='track', limit=2), [('track', 'Blue Velvet'), ('track', 'Blue Moon')])
+        self.assertEqual(self.labels('pending'), [])
+        self.assertEqual(self.client.get('/api/autocomplete/').status_code, 400)
+        self.assertEqual(self.client.get('/api/autocomplete/', {'q': 'b', 'types': 'album'}).status_code, 400)
+
+    def test_incremental_refresh(self):
+        self.labels('blu')
+        base = self.index.base
+
+        self.hidden.status = 'approved'
+        self.hidden.save()
+        self.moon.title = 'Harvest Moon'
+        self.moon.save()
+        Genre.objects.create(name='Blues')
+        self.once.delete()
+        # Totals of untouched genres and artists catch up on the next full rebuild
+        self.assertEqual(self.labels('blu', types='track,genre'), [
+            ('track', 'Blue Pending'), ('genre', 'Bluegrass'), ('track', 'Blue Velvet'), ('genre', 'Blues'),
+        ])
+        self.assertEqual(self.labels('harv'), [('track', 'Harvest Moon')])
+        # Applied as an overlay, not by rebuilding
+        self.assertIs(self.index.base['track'], base['track'])
+
+        with override_settings(AUTOCOMPLETE={'REFRESH_SECONDS': 0, 'MERGE_THRESHOLD': 0}):
+            self.moon.title = 'Blue Harvest'
+            self.moon.save()
+            self.assertEqual(self.labels('blue h'), [('track', 'Blue Harvest')])
+        # Merged in the background
+        self.index.wait()
+        self.assertEqual(self.index.overlay['track'], {})
+        self.assertIsNot(self.index.base['track'], base['track'])
+        self.assertEqual(self.labels('blue h'), [('track', 'Blue Harvest')])
+
+    def test_rebuild_in_background(self):
+        self.labels('blu')
+        base = self.index.base
+        self.velvet.title = 'Velvet Underground'
+        self.velvet.save()
+        fresh = self.index.build()
+        built = threading.Event()
+
+        def build():
+            built.wait(5)
+            return fresh
+
+        with mock.patch.object(self.index, 'build', build), \
+                override_settings(AUTOCOMPLETE={'REFRESH_SECONDS': 0, 'REBUILD_SECONDS': 0}):
+            # Served from the old base while the new one is built
+            self.assertEqual(self.labels('blue v'), [('track', 'Blue Velvet')])
+            self.assertIs(self.index.base, base)
+            built.set()
+            self.index.wait()
+        self.assertIs(self.index.base, fresh[0])
+        self.assertEqual(self.labels('blue v'), [])
+        self.assertEqual(self.labels('velv'), [('track', 'Velvet Underground')])
+
+    def test_login_does_not_queue_change(self):
+        before = CatalogChange.objects.count()
+        self.artist.last_login = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self.artist.save(update_fields=['last_login'])
+        self.assertEqual(CatalogChange.objects.count(), before)
+
+    def test_long_prefix_and_precomputed_top(self):
+        title = 'Supercalifragilisticexpialidocious Anthem'
+        Track.objects.create(
+            title=title, artist=self.artist, release_date='2024-01-01', audio_file='audio_files/a.mp3', status='approved',
+        )
+        self.assertEqual(self.labels('supercalifragilisticexpialidocious an'), [('track', title)])
+        index = autocomplete.PrefixIndex([('track', str(i), f'song {i}', i) for i in range(200)])
+        self.assertEqual([index.entries[p][3] for p in index.search(b's', 3)], [199, 198, 197])
+        self.assertEqual([index.entries[p][3] for p in index.search(b'song 1', 3)], [199, 198, 197])
+
+
+@override_settings(
+    RECOMMENDATIONS={'MIN_COUNT': 1, 'TOP_K': 3, 'SETTLE_SECONDS': 0}, ROLLUPS={'SETTLE_SECONDS': 0},
+)
+class RecommendationTests(TestCase):
+    """Co-occurrence counts are exact however the plays are chunked, and feed the related endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        artist = make_user('artist@example.com', user_type='artist')
+        cls.listeners = [make_user(f'listener{i}@example.com') for i in range(3)]
+        cls.tracks = {
+            name: Track.objects.create(
+                title=name, artist=artist, release_date='2024-01-01', audio_file='audio_files/a.mp3', status='approved',
+            )
+            for name in 'ABCDE'
+        }
+        cls.start = datetime.datetime(2024, 5, 1, 12, tzinfo=datetime.timezone.utc)
+
+    def play(self, listener, names, start_minutes=0, step=5):
+        PlayHistory.objects.bulk_create(
+            PlayHistory(
+                track=self.tracks[name], listener=self.listeners[listener],
+                played_at=self.start + datetime.timedelta(minutes=start_minutes + step * i),
+            )
+            for i, name in enumerate(names)
+        )
+
+    def counts(self):
+        names = {track.id: name for name, track in self.tracks.items()}
+        return {
+            (names[a], names[b]): n
+            for a, b, n in TrackCooccurrence.objects.values_list('track_a_id', 'track_b_id', 'count')
+        }
+
+    def related(self, name):
+        response = APIClient().get(f'/api/tracks/{self.tracks[name].id}/related/')
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+
+    def test_chunked_incremental_counts_match_full_build(self):
+        self.play(0, 'ABC')
+        self.play(1, 'AB')
+        # Two hours later: a new session
+        self.play(1, 'DE', start_minutes=120)
+        self.play(2, 'AC')
+        recommendations.run()
+        full = self.counts()
+        self.assertEqual(full[('A', 'B')], 2)
+        self.assertEqual(full[('B', 'A')], 2)
+        self.assertEqual(full[('A', 'A')], 3)
+        self.assertNotIn(('B', 'D'), full)
+
+        recommendations.reset()
+        self.assertEqual(recommendations.run(chunk_size=2), 9)
+        self.assertEqual(self.counts(), full)
+
+        # Backends without ON CONFLICT upserts add onto existing pairs the same way
+        recommendations.reset()
+        with mock.patch.object(recommendations, 'UPSERT_VENDORS', set()):
+            self.assertEqual(recommendations.run(chunk_size=2), 9)
+        self.assertEqual(self.counts(), full)
+
+        # Sessions that straddle window boundaries are still counted once
+        recommendations.reset()
+        with override_settings(RECOMMENDATIONS={'MIN_COUNT': 1, 'TOP_K': 3, 'WINDOW': 600}):
+            recommendations.run(chunk_size=4)
+        self.assertEqual(self.counts(), full)
+
+        # Plays arriving later pair with earlier plays of the same session
+        self.play(1, 'C', start_minutes=10)
+        self.assertEqual(recommendations.run(), 1)
+        self.assertEqual(self.counts()[('B', 'C')], 2)
+        self.assertEqual(self.counts()[('A', 'C')], 3)
+        self.assertEqual(recommendations.run(), 0)
+
+    def test_backdated_plays_load_only_nearby_history(self):
+        self.play(0, 'AB')
+        self.play(1, 'AB')
+        self.play(0, 'CD', start_minutes=-60 * 24 * 30)
+        spans = []
+        context = recommendations._context
+
+        def recording(listener_ids, start, end, high):
+            spans.append(end - start)
+            return context(listener_ids, start, end, high)
+
+        with mock.patch.object(recommendations, '_context', recording):
+            recommendations.run()
+        limit = datetime.timedelta(seconds=recommendations.DEFAULTS['WINDOW'] + 2 * recommendations.DEFAULTS['SESSION_GAP'])
+        self.assertEqual(len(spans), 2)
+        self.assertTrue(all(span <= limit for span in spans))
+        self.assertEqual(self.counts()[('C', 'D')], 1)
+        self.assertEqual(self.counts()[('A', 'B')], 2)
+
+    def test_related_endpoint(self):
+        self.play(0, 'ABC')
+        self.play(1, 'AB')
+        self.play(2, 'AD', start_minutes=60)
+        recommendations.run()
+        self.assertEqual(self.related('A'), ['B', 'C', 'D'])
+        self.assertEqual(TrackNeighbor.objects.filter(track=self.tracks['A']).count(), 3)
+
+        self.tracks['B'].status = 'rejected'
+        self.tracks['B'].save()
+        self.assertEqual(self.related('A'), ['C', 'D'])
+        self.assertEqual(self.related('E'), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.related('A')
+        self.assertEqual(len(queries), 1)
+
+    def test_archive_waits_for_recommendations(self):
+        old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=200)
+        PlayHistory.objects.create(track=self.tracks['A'], listener=self.listeners[0], played_at=old)
+        rollups.run()
+        RollupWatermark.objects.create(name=recommendations.WATERMARK, last_play_id=0)
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        with override_settings(PLAY_ARCHIVE={'DIR': archive_dir}):
+            self.assertEqual(archive.archive(retention_days=90), 0)
+            recommendations.run()
+            self.assertEqual(archive.archive(retention_days=90), 1)
+
+
+@override_settings(TRENDING={'HALF_LIFE_HOURS': 24, 'CHART_SIZE': 2, 'REFRESH_SECONDS': 0})
+class TrendingTests(TestCase):
+    """Decayed trending scores and bounded charts follow ingested plays"""
+
+    @classmethod
+    def setUpTestData(cls):
+        artist = make_user('artist@example.com', user_type='artist')
+        cls.jazz = Genre.objects.create(name='Jazz')
+        cls.rock = Genre.objects.create(name='Rock')
+        cls.tracks = {
+            name: Track.objects.create(
+                title=name, artist=artist, genre=genre, release_date='2024-01-01',
+                audio_file='audio_files/a.mp3', status='approved',
+            )
+            for name, genre in (('A', cls.jazz), ('B', cls.jazz), ('C', cls.rock), ('D', cls.rock))
+        }
+
+    def ingest(self, name, count, hours_ago=0, refresh=True):
+        when = timezone.now() - datetime.timedelta(hours=hours_ago)
+        with self.captureOnCommitCallbacks(execute=True):
+            plays.apply_plays([plays.encode_play(self.tracks[name].id, played_at=when) for _ in range(count)])
+        if refresh:
+            jobs.run_worker(once=True, inline=True, poll_interval=0)
+
+    def save(self, name, **fields):
+        track = Track.objects.get(id=self.tracks[name].id)
+        for field, value in fields.items():
+            setattr(track, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            track.save()
+        jobs.run_worker(once=True, inline=True, poll_interval=0)
+
+    def chart(self, url='/api/charts/trending/'):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=', response['Cache-Control'])
+        return [(item['title'], round(item['trending_score'], 1)) for item in response.data['results']]
+
+    def test_decay_and_bounded_charts(self):
+        # Four plays a day ago are worth two now
+        self.ingest('A', 4, hours_ago=24)
+        self.ingest('B', 3)
+        self.ingest('C', 1)
+        self.assertEqual(self.chart(), [('B', 3.0), ('A', 2.0)])
+        self.assertEqual(self.chart(f'/api/charts/trending/genres/{self.rock.id}/'), [('C', 1.0)])
+
+        # A track outside the chart enters once its plays beat last place
+        self.ingest('D', 2)
+        self.ingest('D', 2)
+        self.assertEqual(self.chart(), [('D', 4.0), ('B', 3.0)])
+        self.assertEqual(self.chart(f'/api/charts/trending/genres/{self.rock.id}/'), [('D', 4.0), ('C', 1.0)])
+
+        before = list(TrendingChart.objects.order_by('name').values_list('name', 'entries'))
+        self.assertEqual(trending.rebuild(), 12)
+        after = list(TrendingChart.objects.order_by('name').values_list('name', 'entries'))
+        self.assertEqual([name for name, _ in after], [name for name, _ in before])
+        for (_, old), (_, new) in zip(before, after):
+            self.assertEqual([track for track, _ in old], [track for track, _ in new])
+            for (_, x), (_, y) in zip(old, new):
+                self.assertAlmostEqual(x, y, places=6)
+
+    def test_ingest_leaves_charts_to_one_refresh(self):
+        self.ingest('A', 1, refresh=False)
+        self.ingest('B', 1, refresh=False)
+        self.assertFalse(TrendingChart.objects.exists())
+        self.assertEqual(Job.objects.filter(kind='refresh_trending', status='queued').count(), 1)
+        jobs.run_worker(once=True, inline=True, poll_interval=0)
+        self.assertCountEqual(self.chart(), [('A', 1.0), ('B', 1.0)])
+
+    def test_unapproved_and_regenred_tracks_leave_charts(self):
+        self.ingest('A', 5)
+        self.ingest('B', 3)
+        self.ingest('C', 1)
+        self.assertEqual(self.chart(), [('A', 5.0), ('B', 3.0)])
+
+        # A rejected track frees its slot for the next best approved track
+        self.save('A', status='rejected')
+        self.assertEqual(self.chart(), [('B', 3.0), ('C', 1.0)])
+        self.assertEqual(self.chart(f'/api/charts/trending/genres/{self.jazz.id}/'), [('B', 3.0)])
+
+        self.save('B', genre=self.rock)
+        self.assertEqual(self.chart(f'/api/charts/trending/genres/{self.jazz.id}/'), [])
+        self.assertEqual(self.chart(f'/api/charts/trending/genres/{self.rock.id}/'), [('B', 3.0), ('C', 1.0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Track.objects.get(id=self.tracks['B'].id).delete()
+        jobs.run_worker(once=True, inline=True, poll_interval=0)
+        self.assertEqual(self.chart(), [('C', 1.0)])
+
+    def test_chart_is_one_lookup_and_hides_unapproved(self):
+        self.ingest('A', 2)
+        self.ingest('B', 1)
+        self.tracks['A'].status = 'rejected'
+        self.tracks['A'].save()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.chart(), [('B', 1.0)])
+        self.assertEqual(len(queries), 2)
+
+
+class NotificationStreamTests(TestCase):
+    """New notifications are pushed over SSE and missed ones replayed from Last-Event-ID"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        cls.artist = make_user('artist@example.com', user_type='artist')
+        cls.token = str(RefreshToken.for_user(cls.artist).access_token)
+        cls.old = [
+            Notification.objects.create(user=cls.artist, notification_type='track_approved', title=f'Old {i}', message='')
+            for i in range(3)
+        ]
+
+    def notify(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(user=self.artist, notification_type='track_approved', title=title, message='')
+
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/users/notifications/stream/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/users/notifications/stream/', {'token': 'garbage'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_requires_asgi(self):
+        response = self.client.get('/api/users/notifications/stream/', {'token': self.token})
+        self.assertEqual(response.status_code, 501)
+        self.assertIn('ASGI', response.json()['error'])
+
+    async def test_resume_then_live(self):
+        response = await self.async_client.get(
+            '/api/users/notifications/stream/', {'token': self.token}, headers={'Last-Event-ID': str(self.old[0].id)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertTrue((await anext(content)).startswith(b'retry:'))
+        replayed = [await anext(content) for _ in range(2)]
+        self.assertEqual(
+            [chunk.split(b'\n')[0] for chunk in replayed],
+            [f'id: {note.id}'.encode() for note in self.old[1:]],
+        )
+
+        notification = await sync_to_async(self.notify)('Fresh')
+        chunk = await asyncio.wait_for(anext(content), 5)
+        self.assertTrue(chunk.startswith(f'id: {notification.id}\nevent: notification\n'.encode()))
+        self.assertEqual(json.loads(chunk.split(b'data: ')[1])['title'], 'Fresh')
+        await content.aclose()
+
+    @override_settings(NOTIFICATION_EVENTS={'QUEUE_SIZE': 1, 'HEARTBEAT_SECONDS': 0.01})
+    async def test_heartbeat_and_overflow(self):
+        stream = events.stream(self.artist.id)
+        await anext(stream)
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+
+        # A stream that falls behind is closed so the client resumes from its last id
+        for note in self.old:
+            events.hub.deliver(self.artist.id, events.serialize(note))
+        await asyncio.sleep(0)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(events.hub.connected(self.artist.id), 0)
+
+
+    @override_settings(NOTIFICATION_EVENTS={'HEARTBEAT_SECONDS': 0.01})
+    async def test_ends_when_token_expires_or_user_changes(self):
+        stream = events.stream(self.artist.id, expires_at=time.time() + 0.05)
+        await anext(stream)
+        with self.assertRaises(StopAsyncIteration):
+            while True:
+                await asyncio.wait_for(anext(stream), 1)
+
+        stamp = await sync_to_async(authentication.stamp)(self.artist.id)
+        stream = events.stream(self.artist.id, auth_stamp=stamp)
+        await anext(stream)
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+        # e.g. the account was deactivated
+        await sync_to_async(authentication.bump)(self.artist.id)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(events.hub.connected(self.artist.id), 0)
+
+    async def test_stream_bound_to_token(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = AccessToken.for_user(self.artist)
+        token.set_exp(lifetime=datetime.timedelta(seconds=1))
+        response = await self.async_client.get('/api/users/notifications/stream/', {'token': str(token)})
+        content = response.streaming_content
+        await anext(content)
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(content), 5)
+
+
+class NotificationReadStateTests(TestCase):
+    """Unread counters follow creation, read marking, deletion and retention"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('listener@example.com')
+        cls.other = make_user('other@example.com')
+        cls.notes = [
+            Notification.objects.create(user=cls.user, notification_type='track_approved', title=f'N{i}', message='')
+            for i in range(5)
+        ]
+        Notification.objects.create(user=cls.other, notification_type='track_approved', title='Theirs', message='')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def unread(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/notifications/unread-count/')
+        self.assertEqual(len(queries), 1)
+        return response.data['unread_count']
+
+    def test_counts_and_bulk_mark_read(self):
+        self.assertEqual(self.unread(), 5)
+
+        response = self.client.post(f'/api/users/notifications/{self.notes[0].id}/read/')
+        self.assertEqual(response.status_code, 200)
+        self.client.post(f'/api/users/notifications/{self.notes[0].id}/read/')
+        self.assertEqual(self.unread(), 4)
+        theirs = Notification.objects.get(user=self.other)
+        self.assertEqual(self.client.post(f'/api/users/notifications/{theirs.id}/read/').status_code, 404)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/users/notifications/mark-read/', {'ids': [self.notes[1].id, theirs.id]}, format='json',
+            )
+        self.assertEqual(response.data, {'marked': 1, 'unread_count': 3})
+        self.assertEqual([q['sql'].split()[0] for q in queries].count('UPDATE'), 2)
+
+        # Everything older than the first page
+        page = self.client.get('/api/users/notifications/', {'page_size': 1}).data
+        self.assertEqual(page['results'][0]['title'], 'N4')
+        response = self.client.post('/api/users/notifications/mark-read/', {'before': page['next_cursor']}, format='json')
+        self.assertEqual(response.data, {'marked': 2, 'unread_count': 1})
+
+        response = self.client.post('/api/users/notifications/mark-read/', {'all': True}, format='json')
+        self.assertEqual(response.data, {'marked': 1, 'unread_count': 0})
+        self.assertTrue(Notification.objects.get(user=self.other, is_read=False))
+        self.assertEqual(notifications.unread_count(self.other.id), 1)
+
+        self.assertEqual(self.client.post('/api/users/notifications/mark-read/', {}, format='json').status_code, 400)
+        self.assertEqual(
+            self.client.post('/api/users/notifications/mark-read/', {'before': 'junk'}, format='json').status_code, 400,
+        )
+
+    def test_delete_and_retention(self):
+        self.notes[0].delete()
+        self.assertEqual(self.unread(), 4)
+
+        Notification.objects.filter(id=self.notes[1].id).update(is_read=True)
+        NotificationCounter.objects.filter(user=self.user).update(unread=3)
+        long_ago = timezone.now() - datetime.timedelta(days=400)
+        Notification.objects.filter(id__in=[n.id for n in self.notes[1:4]]).update(created_at=long_ago)
+
+        # notes[1] was read: deleted; notes[2:4] were unread: marked read, then deleted too
+        self.assertEqual(notifications.prune(read_days=30, unread_days=365, batch_size=1), (2, 3))
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(list(Notification.objects.filter(user=self.user).values_list('title', flat=True)), ['N4'])
+
+        NotificationCounter.objects.filter(user=self.user).update(unread=7)
+        self.assertEqual(notifications.reconcile(), {self.user.id: (7, 1)})
+        self.assertEqual(self.unread(), 1)
+
+
+class BulkModerationTests(TestCase):
+    """Bulk moderation applies many decisions with a constant number of queries"""
+
+    def setUp(self):
+        self.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        self.artists = [make_user(f'artist{i}@example.com', user_type='artist') for i in range(2)]
+        self.tracks = [
+            Track.objects.create(title=f'Track {i}', artist=self.artists[i % 2], release_date=datetime.date(2024, 1, 1),
+                                 audio_file='audio_files/track.mp3')
+            for i in range(6)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def moderate(self, items):
+        return self.client.post('/api/admin/tracks/bulk-status/', {'tracks': items}, format='json')
+
+    @override_settings(STATS_COUNTER_CACHE=True)
+    def test_applies_decisions_and_side_effects(self):
+        stats.reconcile()
+        last_change = CatalogChange.objects.latest('id').id
+        taken = self.tracks[5]
+        Track.objects.filter(id=taken.id).update(isrc='USABC2400001')
+        missing = '00000000-0000-0000-0000-000000000000'
+        items = [
+            {'id': str(self.tracks[0].id), 'status': 'approved', 'isrc': 'USABC2400002'},
+            {'id': str(self.tracks[1].id), 'status': 'rejected', 'admin_notes': 'Clipping'},
+            {'id': str(self.tracks[2].id), 'status': 'approved', 'isrc': 'USABC2400001'},
+            {'id': missing, 'status': 'approved'},
+            {'id': str(self.tracks[3].id), 'status': 'bogus'},
+            {'id': str(self.tracks[0].id), 'status': 'rejected'},
+            {'id': str(self.tracks[4].id), 'lyrics_status': 'approved'},
+        ]
+        with mock.patch.object(events, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            response = self.moderate(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['failed']), (3, 4))
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['updated', 'updated', 'error', 'error', 'error', 'error', 'updated'])
+        self.assertEqual(response.data['results'][2]['error'], 'ISRC already assigned to another track')
+        self.assertEqual(response.data['results'][3]['error'], 'Track not found')
+        self.assertIn('status', response.data['results'][4]['error'])
+        self.assertEqual(response.data['results'][5]['error'], 'Duplicate track in batch')
+
+        self.tracks[0].refresh_from_db()
+        self.assertEqual((self.tracks[0].status, self.tracks[0].isrc), ('approved', 'USABC2400002'))
+        self.assertEqual(Track.objects.get(id=self.tracks[1].id).admin_notes, 'Clipping')
+        self.assertEqual(Track.objects.get(id=self.tracks[2].id).status, 'pending')
+
+        note = Notification.objects.get(track=self.tracks[0])
+        self.assertEqual(note.notification_type, 'track_approved')
+        self.assertEqual(note.message, 'Your track "Track 0" has been approved. ISRC: USABC2400002')
+        self.assertEqual(publish.call_count, 3)
+        self.assertEqual(notifications.unread_count(self.artists[0].id), 2)
+        self.assertEqual(notifications.unread_count(self.artists[1].id), 1)
+        self.assertEqual(stats.reconcile(), {})
+        self.assertEqual(
+            set(CatalogChange.objects.filter(id__gt=last_change).values_list('object_id', flat=True)),
+            {str(self.tracks[0].id), str(self.tracks[1].id)},
+        )
+
+    def test_query_count_is_constant(self):
+        def run(tracks):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.moderate([{'id': str(track.id), 'status': 'approved'} for track in tracks])
+            self.assertEqual(response.data['updated'], len(tracks))
+            return len(queries)
+
+        # Every batch spans both artists (one unread counter update each); the first creates the counters
+        run(self.tracks[:2])
+        self.assertEqual(run(self.tracks[2:3] + self.tracks[3:4]), run(self.tracks[2:]))
+
+    def test_request_validation(self):
+        self.assertEqual(self.moderate([]).status_code, 400)
+        self.assertEqual(self.client.post('/api/admin/tracks/bulk-status/', {}, format='json').status_code, 400)
+        response = self.moderate([{'id': str(self.tracks[0].id)}, 'junk'])
+        self.assertEqual(response.data['updated'], 0)
+        self.client.force_authenticate(self.artists[0])
+        self.assertEqual(self.moderate([{'id': str(self.tracks[0].id), 'status': 'approved'}]).status_code, 403)
+
+
+@override_settings(ISRC={'REGISTRANT': 'USABC', 'BLOCK_SIZE': 10})
+class IsrcAllocationTests(TestCase):
+    """ISRCs come from per-process blocks of a database sequence, and every issued code is audited"""
+
+    def setUp(self):
+        isrc.allocator.reset()
+        self.addCleanup(isrc.allocator.reset)
+        self.prefix = f'USABC{timezone.now().year % 100:02d}'
+        self.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        self.artist = make_user('artist@example.com', user_type='artist')
+        self.tracks = [
+            Track.objects.create(title=f'Track {i}', artist=self.artist, release_date=datetime.date(2024, 1, 1),
+                                 audio_file='audio_files/track.mp3')
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def sequence(self):
+        return IsrcSequence.objects.get(prefix=self.prefix).next_designation
+
+    def test_blocks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(isrc.allocator.take(3), [f'{self.prefix}0000{i}' for i in (1, 2, 3)])
+        self.assertEqual(self.sequence(), 11)
+
+        # Served from the block without touching the sequence
+        with self.assertNumQueries(0):
+            self.assertEqual(isrc.allocator.take(2)[-1], f'{self.prefix}00005')
+        # More than the block holds: the rest of it plus one reservation
+        with self.captureOnCommitCallbacks(execute=True):
+            codes = isrc.allocator.take(25)
+        self.assertEqual((codes[0], codes[-1]), (f'{self.prefix}00006', f'{self.prefix}00030'))
+        self.assertEqual(self.sequence(), 31)
+
+        # A rolled-back reservation is not kept
+        isrc.allocator.reset()
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            isrc.allocator.take(1)
+            1 / 0
+        self.assertEqual(self.sequence(), 31)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(isrc.allocator.take(1), [f'{self.prefix}00031'])
+
+        IsrcSequence.objects.filter(prefix=self.prefix).update(next_designation=isrc.MAX_DESIGNATION)
+        isrc.allocator.reset()
+        with self.assertRaises(isrc.AllocationError):
+            isrc.allocator.take(2)
+
+    def test_batch_assignment(self):
+        # Typed in by hand earlier: the allocator skips it
+        Track.objects.filter(id=self.tracks[0].id).update(isrc=f'{self.prefix}00001')
+        items = [str(self.tracks[0].id), str(self.tracks[1].id), str(self.tracks[2].id), str(self.tracks[1].id), 'junk',
+                 '00000000-0000-0000-0000-000000000000']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/admin/tracks/assign-isrc/', {'track_ids': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['assigned'], response.data['failed']), (2, 4))
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['error', 'assigned', 'assigned', 'error', 'error', 'error'])
+        self.assertEqual(results[0]['isrc'], f'{self.prefix}00001')
+        self.assertEqual([r['error'] for r in results[3:]],
+                         ['Duplicate track in batch', 'Invalid track id', 'Track not found'])
+        self.assertEqual(results[1]['isrc'], f'{self.prefix}00002')
+        # The skipped code was replaced from a fresh block: the first one's leftover is only kept on commit
+        self.assertEqual(results[2]['isrc'], f'{self.prefix}00011')
+
+        self.assertEqual(Track.objects.get(id=self.tracks[1].id).isrc, results[1]['isrc'])
+        audit = IsrcAssignment.objects.get(isrc=results[2]['isrc'])
+        self.assertEqual((audit.track_id, audit.assigned_by_id), (self.tracks[2].id, self.admin.id))
+        self.assertEqual(Notification.objects.filter(notification_type='isrc_assigned').count(), 2)
+        self.assertEqual(notifications.unread_count(self.artist.id), 2)
+
+        with override_settings(ISRC={'REGISTRANT': ''}):
+            response = self.client.post('/api/admin/tracks/assign-isrc/', {'track_ids': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assigned'], 0)
+        Track.objects.filter(id=self.tracks[1].id).update(isrc=None)
+        with override_settings(ISRC={'REGISTRANT': ''}):
+            response = self.client.post('/api/admin/tracks/assign-isrc/', {'track_ids': items}, format='json')
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(ISRC={'REGISTRANT': 'USABC', 'ASSIGN_ON_APPROVAL': True})
+    def test_assign_on_approval(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/admin/tracks/{self.tracks[0].id}/status/', {'status': 'approved'},
+                                       format='json')
+        self.assertEqual(response.data['isrc'], f'{self.prefix}00001')
+        self.assertEqual(Notification.objects.get(notification_type='track_approved').message,
+                         f'Your track "Track 0" has been approved. ISRC: {self.prefix}00001')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/admin/tracks/bulk-status/', {'tracks': [
+                {'id': str(self.tracks[1].id), 'status': 'approved'},
+                {'id': str(self.tracks[2].id), 'status': 'rejected'},
+            ]}, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(Track.objects.get(id=self.tracks[1].id).isrc, f'{self.prefix}00002')
+        self.assertIsNone(Track.objects.get(id=self.tracks[2].id).isrc)
+        self.assertEqual(IsrcAssignment.objects.count(), 2)
+
+
+class CachedAuthenticationTests(TestCase):
+    """JWT users come from the in-process cache until the user changes"""
+
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        authentication.user_cache.clear()
+        self.addCleanup(authentication.user_cache.clear)
+        self.user = make_user('listener@example.com', display_name='Before')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def profile(self, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get('/api/users/profile/')
+
+    def test_cached_until_changed(self):
+        self.assertEqual(self.profile(1).json()['display_name'], 'Before')
+        self.assertEqual(self.profile(0).json()['display_name'], 'Before')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/api/users/profile/update/', {'display_name': 'After'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.profile(1).json()['display_name'], 'After')
+
+        # Saves that only record a login keep the cached user
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        self.profile(0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-password')
+            self.user.save()
+        self.profile(1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.profile(1).status_code, 401)
+
+    def test_ttl_and_bound(self):
+        self.profile(1)
+        with override_settings(AUTH_USER_CACHE={'TTL': 0}):
+            self.profile(1)
+        with mock.patch.object(authentication.time, 'monotonic', return_value=authentication.time.monotonic() + 61):
+            self.profile(1)
+
+        cache = authentication.UserCache()
+        for user_id in range(3):
+            cache.put(user_id, 'stamp', user_id, {'TTL': 60, 'MAX_USERS': 2})
+        self.assertEqual((len(cache), cache.get(0, 'stamp'), cache.get(2, 'stamp')), (2, None, 2))
+        self.assertIsNone(cache.get(2, 'other'))
+
+
+class AdmissionControlTests(TestCase):
+    """Endpoint classes are limited separately and shed load with 503/429 instead of queueing forever"""
+
+    def test_gate_queue(self):
+        gate = admission.Gate(limit=1, queue=1, timeout=5)
+        self.assertTrue(gate.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(gate.acquire()))
+        waiter.start()
+        while not gate.snapshot()['waiting']:
+            time.sleep(0.001)
+        # Queue full: refused without waiting
+        self.assertFalse(gate.acquire())
+        gate.release()
+        waiter.join()
+        self.assertEqual(results, [True])
+        self.assertEqual(gate.snapshot(), {'limit': 1, 'queue': 1, 'active': 1, 'waiting': 0,
+                                           'admitted': 2, 'rejected': 1, 'timed_out': 0})
+        gate.timeout = 0.01
+        self.assertFalse(gate.acquire())
+        self.assertEqual(gate.snapshot()['timed_out'], 1)
+
+    def test_middleware(self):
+        config = {
+            'CLASSES': {
+                'critical': {'LIMIT': None},
+                'auth': {'LIMIT': 2, 'QUEUE': 2, 'TIMEOUT': 1, 'RATE': 0.5, 'BURST': 2},
+                'heavy': {'LIMIT': 0},
+                'default': {'LIMIT': 8, 'QUEUE': 8, 'TIMEOUT': 1},
+            },
+        }
+        client = APIClient()
+        with override_settings(ADMISSION_CONTROL=config):
+            statuses = [client.post('/api/auth/forgot-password/', {'email': 'a@example.com'}).status_code
+                        for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            self.assertEqual(client.post('/api/auth/forgot-password/', {}, REMOTE_ADDR='10.0.0.2').status_code, 400)
+
+            response = client.get('/api/admin/all-tracks/')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(client.get('/api/admin/pending-tracks/').status_code, 503)
+            self.assertEqual(client.get('/api/analytics/genres/1/plays/').status_code, 503)
+            self.assertEqual(client.get('/api/health/').status_code, 200)
+
+            client.force_authenticate(make_user('admin@example.com', user_type='admin', is_staff=True))
+            stats = client.get('/api/admin/admission/').data
+        self.assertEqual(stats['heavy']['rejected'], 3)
+        self.assertEqual(stats['critical']['admitted'], 1)
+        self.assertEqual(stats['auth']['admitted'], 3)
+        self.assertEqual(stats['auth']['rate_limit']['limited'], 1)
+        self.assertEqual(stats['default']['active'], 1)
+
+    def test_rate_limit_behind_proxy(self):
+        config = {
+            'CLASSES': {'auth': {'LIMIT': None, 'RATE': 0.5, 'BURST': 1}, 'default': {'LIMIT': None}},
+            'TRUSTED_PROXIES': ['127.0.0.1', '10.1.0.0/16'],
+        }
+        client = APIClient()
+
+        def forgot(**headers):
+            return client.post('/api/auth/forgot-password/', {}, **headers).status_code
+
+        with override_settings(ADMISSION_CONTROL=config):
+            # Each client behind the proxy has its own bucket
+            self.assertEqual(forgot(HTTP_X_REAL_IP='203.0.113.1'), 400)
+            self.assertEqual(forgot(HTTP_X_REAL_IP='203.0.113.2'), 400)
+            self.assertEqual(forgot(HTTP_X_REAL_IP='203.0.113.1'), 429)
+            # X-Forwarded-For is read from the nearest untrusted hop, so a forged first entry is ignored
+            self.assertEqual(forgot(HTTP_X_FORWARDED_FOR='198.51.100.9, 203.0.113.3, 10.1.2.3'), 400)
+            self.assertEqual(forgot(HTTP_X_FORWARDED_FOR='198.51.100.10, 203.0.113.3'), 429)
+            # Headers from clients that are not proxies are not trusted
+            self.assertEqual(forgot(REMOTE_ADDR='192.0.2.7', HTTP_X_REAL_IP='203.0.113.4'), 400)
+            self.assertEqual(forgot(REMOTE_ADDR='192.0.2.7', HTTP_X_REAL_IP='203.0.113.5'), 429)
+
+
+class ResponseCacheTests(TestCase):
+    """Read endpoints are served from the response cache with ETags until their rows change"""
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.genre = Genre.objects.create(name='Rock')
+        self.artist = make_user('artist@example.com', user_type='artist', display_name='Artist')
+        self.listener = make_user('listener@example.com', user_type='listener')
+        self.track = Track.objects.create(title='Song', artist=self.artist, genre=self.genre,
+                                          release_date=datetime.date(2024, 1, 1), audio_file='audio_files/track.mp3')
+        self.client = APIClient()
+
+    def get(self, url, user=None, queries=None, **headers):
+        self.client.force_authenticate(user)
+        if queries is None:
+            return self.client.get(url, headers=headers)
+        with self.assertNumQueries(queries):
+            return self.client.get(url, headers=headers)
+
+    def test_genres_conditional_get(self):
+        first = self.get('/api/genres/', queries=1)
+        self.assertEqual(first['Cache-Control'], 'public, max-age=60')
+        self.assertTrue(first['ETag'].startswith('"'))
+        self.assertEqual(self.get('/api/genres/', queries=0).json(), first.json())
+        # The stored bytes are sent as they are, whatever the client asks for
+        browsable = self.get('/api/genres/', queries=0, accept='text/html')
+        self.assertEqual((browsable['Content-Type'], browsable.content), ('application/json', first.content))
+        self.assertEqual(browsable['ETag'], first['ETag'])
+
+        response = self.get('/api/genres/', queries=0, if_none_match=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.create(name='Jazz')
+        response = self.get('/api/genres/', queries=1, if_none_match=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([genre['name'] for genre in response.json()], ['Jazz', 'Rock'])
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_track_invalidation_and_access(self):
+        url = f'/api/music/tracks/{self.track.id}/'
+        admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        self.get(url, self.listener, queries=1)
+        self.assertEqual(self.get(url, self.listener, queries=0).json()['title'], 'Song')
+        # Admins get their own copy (it lists likely duplicates, whose stamps it looks up); other artists are still refused
+        self.get(url, admin, queries=2)
+        self.assertEqual(self.get(url, admin, queries=1).json()['fingerprint_matches'], [])
+        self.assertEqual(self.get(url, make_user('other@example.com', user_type='artist'), queries=1).status_code, 403)
+        response = self.get(url, self.artist, queries=1)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.track.title = 'Renamed'
+            self.track.save()
+        self.assertEqual(self.get(url, self.listener, queries=1).json()['title'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.artist.display_name = 'New name'
+            self.artist.save()
+        self.assertEqual(self.get(url, self.listener).json()['artist']['display_name'], 'New name')
+        self.assertEqual(self.get('/api/music/artist-tracks/', self.artist).json()['results'][0]['artist']['display_name'],
+                         'New name')
+
+    def test_per_user_responses(self):
+        self.assertEqual(self.get('/api/users/profile/', self.artist, queries=0).json()['email'], 'artist@example.com')
+        self.assertEqual(self.get('/api/users/profile/', self.listener).json()['email'], 'listener@example.com')
+        self.assertEqual(self.get('/api/users/profile/', self.artist).json()['email'], 'artist@example.com')
+
+        self.assertEqual(len(self.get('/api/music/artist-tracks/', self.artist, queries=1).json()['results']), 1)
+        self.get('/api/music/artist-tracks/', self.artist, queries=0)
+        self.assertEqual(self.get('/api/music/artist-tracks/', self.listener).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            Track.objects.create(title='Another', artist=self.artist, release_date=datetime.date(2024, 1, 1),
+                                 audio_file='audio_files/track.mp3')
+        self.assertEqual(len(self.get('/api/music/artist-tracks/', self.artist, queries=1).json()['results']), 2)
+
+    def test_file_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={'default': settings.CACHES['default'], 'responses': backend}):
+            first = self.get('/api/genres/', queries=1)
+            self.assertEqual(self.get('/api/genres/', queries=0, if_none_match=first['ETag']).status_code, 304)
+            self.assertTrue(os.listdir(location))
+
+
+@override_settings(DATABASE_ROUTING={'REPLICAS': ['replica'], 'PIN_SECONDS': 10})
+class ReplicaRoutingTests(TestCase):
+    """Read-only admin and analytics views read from a replica unless the user just wrote"""
+
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+        self.admin = make_user('admin@example.com', user_type='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Track), 'default')
+
+        seen = []
+
+        @routers.use_replica
+        def view(request):
+            seen.append(self.router.db_for_read(Track))
+            seen.append(self.router.db_for_write(Track))
+            seen.append(self.router.db_for_read(Track))
+
+        view(mock.Mock(user=self.admin))
+        # Reads after a write in the same request see it
+        self.assertEqual(seen, ['replica', 'default', 'default'])
+        self.assertEqual(self.router.db_for_read(Track), 'default')
+
+        track = Track(artist=self.admin)
+        track._state.db = 'replica'
+        self.assertTrue(self.router.allow_relation(track, self.admin))
+
+    def test_pinned_after_write(self):
+        # No 'replica' database exists here, so reaching it proves the view was routed there
+        with self.assertRaises(ConnectionDoesNotExist):
+            self.client.get('/api/admin/all-tracks/')
+
+        self.assertEqual(self.client.get('/api/health/').status_code, 200)
+        self.assertFalse(routers.is_pinned(self.admin))
+        response = self.client.put('/api/users/profile/update/', {'display_name': 'Admin'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(routers.is_pinned(self.admin))
+        self.assertEqual(self.client.get('/api/admin/all-tracks/').status_code, 200)
+
+        with override_settings(DATABASE_ROUTING={'REPLICAS': []}):
+            self.assertEqual(self.router.db_for_read(Track), 'default')
@@ -0,0 +1,208 @@
+"""
+Trending charts from exponentially time-decayed play counts.
+
+A play at time ``t`` is worth ``2 ** -((now - t) / half_life)``. Because every
+score decays at the same rate, the ranking never changes unless plays are
+added, so scores are stored undecayed relative to a fixed ``EPOCH`` and in log
+space: ``TrackTrend.score = log(sum(exp(rate * (t - EPOCH))))``. Adding plays is
+a ``logaddexp`` and the value never overflows however long the site runs; the
+decayed score is recovered at read time as ``exp(score - rate * (now - EPOCH))``.
+
+The same property makes each chart the top N approved tracks by stored score.
+``record`` is called by ``api.plays.apply_plays`` in the transaction that
+writes the plays and only updates the played tracks' ``TrackTrend`` rows; it
+then queues a ``refresh_trending`` job, which rewrites the global and
+per-genre ``TrendingChart`` rows from ``TrackTrend`` outside any ingest
+transaction, so concurrent ingests never wait on a chart row. Tracks that are
+approved, rejected, re-genred or deleted queue the same refresh, and until it
+runs ``chart`` skips tracks no longer approved or in the chart's genre. The
+chart endpoint reads one stored list however many plays there are.
+``manage.py rebuild_trending`` recomputes everything from the live plays (e.g.
+after changing the half-life).
+"""
+import math
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import jobs
+from .models import Genre, Job, PlayHistory, Track, TrackTrend, TrendingChart
+
+DEFAULTS = {
+    'HALF_LIFE_HOURS': 72,
+    'CHART_SIZE': 100,
+    'CACHE_SECONDS': 60,
+    # Plays ingested within this many seconds share one chart refresh
+    'REFRESH_SECONDS': 10,
+}
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+GLOBAL = 'global'
+REBUILD_CHUNK = 50000
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'TRENDING', {})}
+
+
+def rate(config=None):
+    """Decay rate per second"""
+    config = config or get_config()
+    return math.log(2) / (config['HALF_LIFE_HOURS'] * 3600)
+
+
+def chart_name(genre_id=None):
+    return GLOBAL if genre_id is None else f'genre:{genre_id}'
+
+
+def log_weights(played_at, config=None):
+    """Summed log-space weight of plays per track from ``[(track_id, played_at)]``"""
+    by_track = defaultdict(list)
+    for track_id, when in played_at:
+        by_track[track_id].append((when - EPOCH).total_seconds())
+    decay = rate(config)
+    return {
+        track_id: float(np.logaddexp.reduce(np.array(seconds) * decay))
+        for track_id, seconds in by_track.items()
+    }
+
+
+def merge(entries, scores, size):
+    """Chart ``entries`` (``[[track_id, score]]``, best first) with ``scores`` merged in, top ``size`` kept"""
+    merged = dict(entries)
+    merged.update(scores)
+    return sorted(([track_id, score] for track_id, score in merged.items()), key=lambda entry: -entry[1])[:size]
+
+
+def candidates(config):
+    """``{chart name: [(track_id, score)]}``: the best-scored approved tracks, globally and per genre"""
+    size = config['CHART_SIZE']
+    approved = TrackTrend.objects.filter(track__status='approved').order_by('-score')
+    charts = {GLOBAL: approved}
+    for genre_id in Genre.objects.values_list('id', flat=True):
+        charts[chart_name(genre_id)] = approved.filter(track__genre_id=genre_id)
+    return {
+        name: [(str(track_id), score) for track_id, score in trends.values_list('track_id', 'score')[:size]]
+        for name, trends in charts.items()
+    }
+
+
+def rank(candidates, size):
+    """Chart entries (``[[track_id, score]]``, best first) from ``candidates``"""
+    return {name: merge([], dict(scores), size) for name, scores in candidates.items() if scores}
+
+
+def save_charts(charts):
+    """Replace every stored chart with ``{chart name: entries}``"""
+    with transaction.atomic():
+        TrendingChart.objects.all().delete()
+        TrendingChart.objects.bulk_create(TrendingChart(name=name, entries=entries) for name, entries in charts.items())
+
+
+def refresh_charts():
+    config = get_config()
+    save_charts(rank(candidates(config), config['CHART_SIZE']))
+
+
+@jobs.register('refresh_trending')
+class RefreshCharts:
+    """Rewrite the trending charts from the stored trend scores"""
+
+    def prepare(self, job):
+        config = get_config()
+        return candidates(config), config['CHART_SIZE']
+
+    compute = staticmethod(rank)
+
+    def finish(self, job, result):
+        save_charts(result)
+
+
+def schedule_refresh():
+    """Queue a chart refresh once the current transaction commits, unless one is already waiting"""
+    def enqueue():
+        if not Job.objects.filter(kind='refresh_trending', status='queued').exists():
+            jobs.enqueue('refresh_trending', {}, delay=get_config()['REFRESH_SECONDS'])
+    transaction.on_commit(enqueue)
+
+
+def record(played_at):
+    """Add plays (``[(track_id, played_at)]`` with string track ids) to the trend scores and queue a chart refresh"""
+    if not played_at:
+        return
+    config = get_config()
+    weights = log_weights(played_at, config)
+    with transaction.atomic():
+        trends = {
+            str(trend.track_id): trend
+            for trend in TrackTrend.objects.select_for_update().filter(track_id__in=weights)
+        }
+        created, updated = [], []
+        for track_id, weight in weights.items():
+            trend = trends.get(track_id)
+            if trend is None:
+                created.append(TrackTrend(track_id=track_id, score=weight))
+            else:
+                trend.score = float(np.logaddexp(trend.score, weight))
+                updated.append(trend)
+        TrackTrend.objects.bulk_create(created)
+        TrackTrend.objects.bulk_update(updated, ['score'])
+    schedule_refresh()
+
+
+def rebuild(chunk_size=REBUILD_CHUNK):
+    """Recompute every trend score and chart from the live plays; returns the plays read"""
+    config = get_config()
+    totals = {}
+    read = 0
+    last = 0
+    while True:
+        rows = list(
+            PlayHistory.objects.filter(id__gt=last).order_by('id').values_list('id', 'track_id', 'played_at')[:chunk_size]
+        )
+        if not rows:
+            break
+        for track_id, score in log_weights([(str(track_id), when) for _, track_id, when in rows], config).items():
+            totals[track_id] = float(np.logaddexp(totals[track_id], score)) if track_id in totals else score
+        read += len(rows)
+        last = rows[-1][0]
+
+    existing = {str(pk) for pk in Track.objects.filter(id__in=totals).values_list('id', flat=True)}
+    with transaction.atomic():
+        TrackTrend.objects.all().delete()
+        TrackTrend.objects.bulk_create(
+            (TrackTrend(track_id=track_id, score=score) for track_id, score in totals.items() if track_id in existing),
+            batch_size=1000,
+        )
+        refresh_charts()
+    return read
+
+
+def decayed(score, now=None, config=None):
+    """Current value of a stored log-space score, in plays"""
+    now = now or timezone.now()
+    return math.exp(score - rate(config) * (now - EPOCH).total_seconds())
+
+
+def chart(genre_id=None, limit=None):
+    """``[(track, score)]`` for the tracks on a chart still approved and in its genre, best first"""
+    config = get_config()
+    entries = TrendingChart.objects.filter(name=chart_name(genre_id)).values_list('entries', flat=True).first() or []
+    tracks = Track.objects.select_related('artist', 'genre').filter(status='approved')
+    if genre_id is not None:
+        tracks = tracks.filter(genre_id=genre_id)
+    tracks = tracks.in_bulk([uuid.UUID(track_id) for track_id, _ in entries])
+    now = timezone.now()
+    ranked = []
+    for track_id, score in entries:
+        track = tracks.get(uuid.UUID(track_id))
+        if track is not None:
+            ranked.append((track, round(decayed(score, now, config), 3)))
+            if limit and len(ranked) == limit:
+                break
+    return ranked
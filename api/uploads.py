@@ -0,0 +1,148 @@
+"""
+Resumable chunked uploads.
+
+A client creates an ``UploadSession``, PUTs numbered chunks (in any order and
+in parallel) and finalizes it. Each chunk is streamed from the request body
+straight into its own file under ``CHUNKED_UPLOADS['DIR']/<session>/`` and
+renamed into place once complete, so a retried chunk simply replaces the old
+one. Finalizing concatenates the chunks in a single pass while hashing them,
+and hands the assembled file to storage by path so it is moved, not copied.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import UploadChunk, UploadSession
+
+DEFAULTS = {
+    'DIR': os.path.join(settings.BASE_DIR, 'var', 'uploads'),
+    'CHUNK_SIZE': 8 * 1024 * 1024,
+    'MIN_CHUNK_SIZE': 256 * 1024,
+    'MAX_CHUNK_SIZE': 32 * 1024 * 1024,
+    'MAX_FILE_SIZE': 1024 * 1024 * 1024,
+    'SESSION_TTL_HOURS': 24,
+}
+
+BLOCK_SIZE = 256 * 1024
+
+
+class ChunkError(Exception):
+    """A chunk body did not match what the session expects"""
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CHUNKED_UPLOADS', {})}
+
+
+def session_dir(session):
+    return os.path.join(get_config()['DIR'], str(session.id))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_dir(session), f'{index:06d}.part')
+
+
+def write_chunk(session, index, stream, expected_sha256=None):
+    """
+    Stream one chunk body to disk and record it; returns the ``UploadChunk``.
+
+    Raises ChunkError if the body is not exactly the expected size or does
+    not match ``expected_sha256``.
+    """
+    expected = session.expected_chunk_size(index)
+    directory = session_dir(session)
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    received = 0
+    partial = os.path.join(directory, f'{index:06d}.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(partial, 'wb') as target:
+            while received <= expected:
+                block = stream.read(min(BLOCK_SIZE, expected + 1 - received))
+                if not block:
+                    break
+                target.write(block)
+                digest.update(block)
+                received += len(block)
+
+        if received > expected:
+            raise ChunkError(f'Chunk {index} is larger than {expected} bytes')
+        if received < expected:
+            raise ChunkError(f'Chunk {index} must be {expected} bytes, got {received}')
+        if expected_sha256 and expected_sha256.lower() != digest.hexdigest():
+            raise ChunkError(f'Chunk {index} does not match its SHA-256')
+
+        os.replace(partial, chunk_path(session, index))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index,
+        defaults={'size': received, 'sha256': digest.hexdigest()},
+    )
+    session.save(update_fields=['updated_at'])
+    return chunk
+
+
+class AssembledFile(File):
+    """An on-disk file FileSystemStorage can move into place instead of copying"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def missing_chunks(session):
+    received = set(session.chunks.values_list('index', flat=True))
+    return [index for index in range(session.chunk_count) if index not in received]
+
+
+def assemble(session):
+    """
+    Concatenate every chunk into one new file, hashing as it goes.
+
+    Returns ``(path, sha256)``. Chunks are left in place until the session is
+    discarded, so a failed finalize can be retried.
+    """
+    path = os.path.join(session_dir(session), f'assembled.{uuid.uuid4().hex}')
+    digest = hashlib.sha256()
+    with open(path, 'wb') as target:
+        for index in range(session.chunk_count):
+            source_path = chunk_path(session, index)
+            with open(source_path, 'rb') as source:
+                while True:
+                    block = source.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    target.write(block)
+    return path, digest.hexdigest()
+
+
+def open_assembled(session, path):
+    return AssembledFile(open(path, 'rb'), name=session.filename)
+
+
+def discard(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+
+
+def collect_garbage(ttl_hours=None):
+    """Delete unfinished sessions idle for longer than the TTL; returns how many"""
+    config = get_config()
+    ttl_hours = config['SESSION_TTL_HOURS'] if ttl_hours is None else ttl_hours
+    cutoff = timezone.now() - timedelta(hours=ttl_hours)
+
+    removed = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        discard(session)
+        session.delete()
+        removed += 1
+    return removed
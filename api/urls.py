@@ -12,25 +12,51 @@ urlpatterns = [
     
     # Music Management
     path('music/upload/', views.upload_music, name='upload_music'),
+    path('music/uploads/', views.create_upload_session, name='create_upload_session'),
+    path('music/uploads/<uuid:session_id>/', views.get_upload_session, name='get_upload_session'),
+    path('music/uploads/<uuid:session_id>/chunks/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('music/uploads/<uuid:session_id>/finalize/', views.finalize_upload, name='finalize_upload'),
     path('music/artist-tracks/', views.get_artist_tracks, name='get_artist_tracks'),
+    path('music/search/', views.search_tracks, name='search_tracks'),
     path('music/tracks/<uuid:track_id>/', views.get_track, name='get_track'),
+    path('music/tracks/<uuid:track_id>/stream/', views.stream_track, name='stream_track'),
     path('music/tracks/<uuid:track_id>/update/', views.update_track, name='update_track'),
     path('music/tracks/<uuid:track_id>/delete/', views.delete_track, name='delete_track'),
+    path('images/tracks/<uuid:object_id>/<str:variant>', views.image_derivative, {'kind': 'tracks'},
+         name='image_derivative_tracks'),
+    path('images/users/<int:object_id>/<str:variant>', views.image_derivative, {'kind': 'users'},
+         name='image_derivative_users'),
     
     # Admin Functions
     path('admin/pending-tracks/', views.get_pending_tracks, name='get_pending_tracks'),
     path('admin/all-tracks/', views.get_all_tracks, name='get_all_tracks'),
+    path('admin/tracks/assign-isrc/', views.assign_isrcs, name='assign_isrcs'),
+    path('admin/tracks/bulk-status/', views.bulk_update_track_status, name='bulk_update_track_status'),
     path('admin/tracks/<uuid:track_id>/status/', views.update_track_status, name='update_track_status'),
     path('admin/stats/', views.get_admin_stats, name='get_admin_stats'),
+    path('admin/admission/', views.get_admission_stats, name='get_admission_stats'),
     path('admin/artists/', views.get_artist_list, name='get_artist_list'),
     
     # User Profile
     path('users/profile/', views.get_user_profile, name='get_user_profile'),
     path('users/profile/update/', views.update_user_profile, name='update_user_profile'),
     path('users/notifications/', views.get_user_notifications, name='get_user_notifications'),
+    path('users/notifications/stream/', views.notification_stream, name='notification_stream'),
+    path('users/notifications/unread-count/', views.get_unread_notification_count, name='get_unread_notification_count'),
+    path('users/notifications/mark-read/', views.mark_notifications_read, name='mark_notifications_read'),
     path('users/notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
     
     # Public
     path('genres/', views.get_genres, name='get_genres'),
+    path('autocomplete/', views.autocomplete_catalog, name='autocomplete_catalog'),
     path('tracks/<uuid:track_id>/play/', views.record_play, name='record_play'),
+    path('tracks/<uuid:track_id>/related/', views.related_tracks, name='related_tracks'),
+    path('charts/trending/', views.trending_chart, name='trending_chart'),
+    path('charts/trending/genres/<int:genre_id>/', views.trending_chart, name='trending_genre_chart'),
+    path('plays/batch/', views.record_play_batch, name='record_play_batch'),
+    
+    # Analytics
+    path('analytics/tracks/<uuid:track_id>/plays/', views.get_track_play_series, name='get_track_play_series'),
+    path('analytics/artists/<int:artist_id>/plays/', views.get_artist_play_series, name='get_artist_play_series'),
+    path('analytics/genres/<int:genre_id>/plays/', views.get_genre_play_series, name='get_genre_play_series'),
 ]
\ No newline at end of file
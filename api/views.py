@@ -1,25 +1,50 @@
-from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes, renderer_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import transaction
 from django.db.models import Count, Q
 from django.utils import timezone
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import os
 
-from .models import Track, Genre, PlayHistory, Notification
+from . import (
+    admission, authentication, autocomplete, events, fingerprint, images, isrc, moderation, notifications, plays,
+    processing, recommendations, response_cache, rollups, routers, search, stats as admin_stats, streaming, trending,
+    uploads,
+)
+from .models import (
+    Track, Genre, PlayHistory, Notification,
+    TrackHourlyPlays, TrackDailyPlays, ArtistDailyPlays, GenreDailyPlays, UploadSession,
+)
+from .pagination import KeysetPagination, paginated_response
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, UserLoginSerializer,
     TrackSerializer, TrackUploadSerializer, TrackDetailSerializer,
-    TrackStatusUpdateSerializer, PlayHistorySerializer, NotificationSerializer,
-    AdminStatsSerializer
+    TrackStatusUpdateSerializer, TrackDecisionSerializer, PlayHistorySerializer, NotificationSerializer,
+    AdminStatsSerializer, UploadSessionSerializer
 )
 
 User = get_user_model()
 
+# Relations walked by the nested serializers. Querysets feeding those
+# serializers select them up front so a page costs one query, not 2N+1.
+TRACK_RELATED = ('artist', 'genre')
+# Waveform peaks are only sent for a single track (get_track); lists skip loading them
+TRACK_LIST_DEFERRED = ('waveform_peaks',)
+NOTIFICATION_RELATED = ('track__artist', 'track__genre')
+
 
 # Health Check
 @api_view(['GET'])
@@ -106,57 +131,229 @@ def upload_music(request):
     
     serializer = TrackUploadSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        track = serializer.save()
-        
-        # Create notification for admin
-        Notification.objects.create(
-            user=request.user,
-            notification_type='track_processing',
-            title='Track Uploaded',
-            message=f'Your track "{track.title}" has been uploaded and is pending review.',
-            track=track
-        )
-        
+        with transaction.atomic():
+            track = serializer.save(status='processing')
+            _notify_track_uploaded(track)
         return Response(TrackSerializer(track).data, status=status.HTTP_201_CREATED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _notify_track_uploaded(track):
+    processing.enqueue_track(track)
+    fingerprint.enqueue_track(track)
+    Notification.objects.create(
+        user=track.artist,
+        notification_type='track_processing',
+        title='Track Uploaded',
+        message=f'Your track "{track.title}" has been uploaded and is pending review.',
+        track=track
+    )
+
+
+# Resumable Uploads
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """Start a resumable chunked upload"""
+    if request.user.user_type != 'artist':
+        return Response({'error': 'Only artists can upload music'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = UploadSessionSerializer(data=request.data, context={'request': request})
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def get_upload_session(request, session_id):
+    """Get upload progress, including which chunks have arrived"""
+    try:
+        session = UploadSession.objects.prefetch_related('chunks').get(id=session_id, artist=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(UploadSessionSerializer(session).data)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, session_id, index):
+    """Store one chunk; the raw request body is the chunk's bytes"""
+    try:
+        session = UploadSession.objects.get(id=session_id, artist=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if session.status != 'uploading':
+        return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+    if index >= session.chunk_count:
+        return Response({'error': f'Chunk index must be below {session.chunk_count}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        chunk = uploads.write_chunk(session, index, request.stream, request.META.get('HTTP_X_CHUNK_SHA256'))
+    except uploads.ChunkError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'index': chunk.index, 'size': chunk.size, 'sha256': chunk.sha256})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser, JSONParser])
+def finalize_upload(request, session_id):
+    """Assemble the chunks and create the track from the submitted metadata"""
+    try:
+        session = UploadSession.objects.get(id=session_id, artist=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if session.status != 'uploading':
+        return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+    missing = uploads.missing_chunks(session)
+    if missing:
+        return Response({'error': 'Upload incomplete', 'missing_chunks': missing}, status=status.HTTP_400_BAD_REQUEST)
+    
+    path, digest = uploads.assemble(session)
+    audio_file = uploads.open_assembled(session, path)
+    try:
+        if session.sha256 and digest != session.sha256:
+            return Response({'error': 'Assembled file does not match sha256', 'sha256': digest},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        data = {key: request.data.get(key) for key in request.data}
+        data['audio_file'] = audio_file
+        serializer = TrackUploadSerializer(data=data, context={'request': request, 'audio_sha256': digest})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            # Re-check under a row lock so concurrent finalizes create one track
+            session = UploadSession.objects.select_for_update().get(id=session.id)
+            if session.status != 'uploading':
+                return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+            track = serializer.save(status='processing')
+            session.status = 'complete'
+            session.track = track
+            session.save(update_fields=['status', 'track', 'updated_at'])
+            _notify_track_uploaded(track)
+    finally:
+        # Storage moves the assembled file into MEDIA_ROOT on success
+        audio_file.close()
+        if os.path.exists(path):
+            os.remove(path)
+    
+    uploads.discard(session)
+    return Response(TrackSerializer(track).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@response_cache.cached(lambda request: (str(request.user.id), [f'artist-tracks:{request.user.id}', 'genres']))
 def get_artist_tracks(request):
     """Get tracks for the authenticated artist"""
     if request.user.user_type != 'artist':
         return Response({'error': 'Only artists can access this endpoint'}, status=status.HTTP_403_FORBIDDEN)
     
-    tracks = Track.objects.filter(artist=request.user)
-    serializer = TrackSerializer(tracks, many=True)
-    return Response(serializer.data)
+    tracks = Track.objects.filter(artist=request.user).select_related(*TRACK_RELATED).defer(*TRACK_LIST_DEFERRED)
+    return paginated_response(request, tracks, TrackSerializer)
+
+
+def _track_scope(request, track_id):
+    # Artists may only see their own tracks, so their copies are kept apart,
+    # and only staff see likely duplicates
+    names = [f'track:{track_id}', 'genres']
+    if not request.user.is_staff:
+        return (str(request.user.id) if request.user.user_type == 'artist' else ''), names
+    matches = Track.objects.filter(id=track_id).values_list('fingerprint_matches', flat=True).first()
+    return 'staff', names + [f"track:{match['id']}" for match in matches or ()]
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@response_cache.cached(_track_scope)
 def get_track(request, track_id):
     """Get specific track details"""
     try:
-        track = Track.objects.get(id=track_id)
+        track = Track.objects.select_related(*TRACK_RELATED).get(id=track_id)
         # Check if user can access this track
-        if request.user.user_type == 'artist' and track.artist != request.user:
+        if request.user.user_type == 'artist' and track.artist_id != request.user.id:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        serializer = TrackDetailSerializer(track)
+        serializer = TrackDetailSerializer(track, context={'staff': request.user.is_staff})
         return Response(serializer.data)
     except Track.DoesNotExist:
         return Response({'error': 'Track not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, streaming.AnyMediaRenderer])
+def stream_track(request, track_id):
+    """Stream a track's audio with Range and conditional GET support"""
+    try:
+        track = Track.objects.only('id', 'artist_id', 'audio_file').get(id=track_id)
+    except Track.DoesNotExist:
+        return Response({'error': 'Track not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # Same access rule as get_track
+    if request.user.user_type == 'artist' and track.artist_id != request.user.id:
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    response = streaming.serve_file(request, track.audio_file, track.id.hex) if track.audio_file else None
+    if response is None:
+        return Response({'error': 'Audio file not found'}, status=status.HTTP_404_NOT_FOUND)
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes([JSONRenderer, streaming.AnyMediaRenderer])
+def image_derivative(request, kind, object_id, variant):
+    """Serve a resized cover or profile picture, rendering it if it is not cached"""
+    model, field, hash_field = images.SOURCES[kind]
+    obj = model.objects.filter(pk=object_id).only('pk', field, hash_field).first()
+    cached = images.derive_on_demand(kind, obj, variant) if obj is not None else None
+    response = streaming.serve_file(request, cached, variant) if cached is not None else None
+    if response is None:
+        return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # The name changes with the image, so it never needs revalidating
+    response['Cache-Control'] = f"public, max-age={images.get_config()['MAX_AGE']}, immutable"
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_tracks(request):
+    """Ranked full-text search over title, lyrics, artist, genre and ISRC"""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Search query (q) is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    tracks = Track.objects.select_related(*TRACK_RELATED).defer(*TRACK_LIST_DEFERRED)
+    # Staff search everything, as on the admin endpoints; others see the approved catalog (and artists their own tracks)
+    if not request.user.is_staff:
+        tracks = tracks.filter(Q(status='approved') | Q(artist_id=request.user.id))
+    
+    status_filter = request.query_params.get('status')
+    genre_filter = request.query_params.get('genre')
+    if status_filter:
+        tracks = tracks.filter(status=status_filter)
+    if genre_filter:
+        tracks = tracks.filter(genre__name=genre_filter)
+    
+    return search.paginated_results(request, search.matching(tracks, query), TrackSerializer)
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_track(request, track_id):
     """Update track information (artist only)"""
     try:
-        track = Track.objects.get(id=track_id)
-        if track.artist != request.user:
+        track = Track.objects.select_related(*TRACK_RELATED).get(id=track_id)
+        if track.artist_id != request.user.id:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
         serializer = TrackSerializer(track, data=request.data, partial=True)
@@ -174,7 +371,7 @@ def delete_track(request, track_id):
     """Delete track (artist only)"""
     try:
         track = Track.objects.get(id=track_id)
-        if track.artist != request.user:
+        if track.artist_id != request.user.id:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
         track.delete()
@@ -186,30 +383,29 @@ def delete_track(request, track_id):
 # Admin Views
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@routers.use_replica
 def get_pending_tracks(request):
-    """Get all tracks for admin review"""
-    tracks = Track.objects.all().order_by('-created_at')
-    serializer = TrackDetailSerializer(tracks, many=True)
-    return Response(serializer.data)
+    """Get tracks awaiting admin review"""
+    tracks = Track.objects.filter(status='pending').select_related(*TRACK_RELATED).defer(*TRACK_LIST_DEFERRED)
+    return paginated_response(request, tracks, TrackDetailSerializer, context={'staff': True})
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@routers.use_replica
 def get_all_tracks(request):
     """Get all tracks with filtering options"""
     status_filter = request.query_params.get('status')
     genre_filter = request.query_params.get('genre')
     
-    tracks = Track.objects.all()
+    tracks = Track.objects.select_related(*TRACK_RELATED).defer(*TRACK_LIST_DEFERRED)
     
     if status_filter:
         tracks = tracks.filter(status=status_filter)
     if genre_filter:
         tracks = tracks.filter(genre__name=genre_filter)
     
-    tracks = tracks.order_by('-created_at')
-    serializer = TrackDetailSerializer(tracks, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, tracks, TrackDetailSerializer, context={'staff': True})
 
 
 @api_view(['PUT'])
@@ -217,55 +413,94 @@ def get_all_tracks(request):
 def update_track_status(request, track_id):
     """Update track status (admin only)"""
     try:
-        track = Track.objects.get(id=track_id)
+        track = Track.objects.select_related(*TRACK_RELATED).get(id=track_id)
         serializer = TrackStatusUpdateSerializer(track, data=request.data, partial=True)
         
         if serializer.is_valid():
             old_status = track.status
-            track = serializer.save()
+            with transaction.atomic():
+                track = serializer.save()
+                if track.status == 'approved' and not track.isrc and isrc.get_config()['ASSIGN_ON_APPROVAL']:
+                    isrc.issue([track], request.user)
+                    track.save(update_fields=['isrc', 'updated_at'])
+                
+                # Create notification for artist
+                moderation.status_notification(track).save()
             
-            # Create notification for artist
-            notification_type = f'track_{track.status}'
-            title = f'Track {track.status.title()}'
-            message = f'Your track "{track.title}" has been {track.status}.'
-            
-            if track.isrc:
-                message += f' ISRC: {track.isrc}'
-            
-            Notification.objects.create(
-                user=track.artist,
-                notification_type=notification_type,
-                title=title,
-                message=message,
-                track=track
-            )
-            
-            return Response(TrackDetailSerializer(track).data)
+            return Response(TrackDetailSerializer(track, context={'staff': True}).data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Track.DoesNotExist:
         return Response({'error': 'Track not found'}, status=status.HTTP_404_NOT_FOUND)
+    except isrc.AllocationError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_update_track_status(request):
+    """Apply many moderation decisions in one transaction (admin only)"""
+    items = request.data.get('tracks') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'tracks must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > moderation.MAX_ITEMS:
+        return Response(
+            {'error': f'At most {moderation.MAX_ITEMS} tracks can be moderated per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = []
+    decisions = []
+    for index, item in enumerate(items):
+        result = {'index': index, 'id': item.get('id') if isinstance(item, dict) else None, 'status': 'error'}
+        results.append(result)
+        serializer = TrackDecisionSerializer(data=item)
+        if serializer.is_valid():
+            decisions.append((result, serializer.validated_data))
+        else:
+            result['error'] = serializer.errors
+    
+    try:
+        updated = moderation.apply_decisions(decisions, request.user) if decisions else []
+    except isrc.AllocationError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({
+        'updated': len(updated),
+        'failed': len(results) - len(updated),
+        'results': results,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def assign_isrcs(request):
+    """Issue ISRCs from the allocator to many tracks at once (admin only)"""
+    track_ids = request.data.get('track_ids') if isinstance(request.data, dict) else None
+    if not isinstance(track_ids, list) or not track_ids:
+        return Response({'error': 'track_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(track_ids) > isrc.MAX_BATCH:
+        return Response(
+            {'error': f'At most {isrc.MAX_BATCH} tracks can be assigned ISRCs per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        assigned, results = isrc.assign_batch(track_ids, request.user)
+    except isrc.AllocationError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({
+        'assigned': assigned,
+        'failed': len(results) - assigned,
+        'results': results,
+    })
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@routers.use_replica
 def get_admin_stats(request):
     """Get admin dashboard statistics"""
-    total_tracks = Track.objects.count()
-    pending_tracks = Track.objects.filter(status='pending').count()
-    approved_tracks = Track.objects.filter(status='approved').count()
-    rejected_tracks = Track.objects.filter(status='rejected').count()
-    total_artists = User.objects.filter(user_type='artist').count()
-    total_listeners = User.objects.filter(user_type='listener').count()
-    
-    stats = {
-        'total_tracks': total_tracks,
-        'pending_tracks': pending_tracks,
-        'approved_tracks': approved_tracks,
-        'rejected_tracks': rejected_tracks,
-        'total_artists': total_artists,
-        'total_listeners': total_listeners,
-    }
+    stats = admin_stats.get_stats()
     
     serializer = AdminStatsSerializer(stats)
     return Response(serializer.data)
@@ -273,16 +508,24 @@ def get_admin_stats(request):
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+def get_admission_stats(request):
+    """Concurrency, queue depth and rejection counters per endpoint class in this process (admin only)"""
+    return Response(admission.snapshot())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@routers.use_replica
 def get_artist_list(request):
     """Get list of all artists"""
     artists = User.objects.filter(user_type='artist')
-    serializer = UserSerializer(artists, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, artists, UserSerializer)
 
 
 # User Profile Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@response_cache.cached(lambda request: (str(request.user.id), [f'user:{request.user.id}']))
 def get_user_profile(request):
     """Get current user profile"""
     serializer = UserSerializer(request.user)
@@ -304,27 +547,106 @@ def update_user_profile(request):
 @permission_classes([IsAuthenticated])
 def get_user_notifications(request):
     """Get current user notifications"""
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    serializer = NotificationSerializer(notifications, many=True)
-    return Response(serializer.data)
+    notifications = Notification.objects.filter(user=request.user).select_related(*NOTIFICATION_RELATED)
+    return paginated_response(request, notifications, NotificationSerializer)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_notification_read(request, notification_id):
     """Mark notification as read"""
-    try:
-        notification = Notification.objects.get(id=notification_id, user=request.user)
-        notification.is_read = True
-        notification.save()
-        return Response({'message': 'Notification marked as read'})
-    except Notification.DoesNotExist:
+    marked = notifications.mark_read(request.user.id, Notification.objects.filter(id=notification_id))
+    if not marked and not Notification.objects.filter(id=notification_id, user=request.user).exists():
         return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Notification marked as read'})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_unread_notification_count(request):
+    """Number of unread notifications, from the per-user counter"""
+    return Response({'unread_count': notifications.unread_count(request.user.id)})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    """Mark notifications read in one UPDATE: by `ids`, everything older than a list `before` cursor, or `all`"""
+    data = request.data if isinstance(request.data, dict) else {}
+    selected = Notification.objects.all()
+    if 'before' in data:
+        paginator = KeysetPagination()
+        try:
+            values = paginator.decode_cursor(str(data['before']), Notification)
+        except NotFound:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        selected = selected.filter(paginator.build_filter(values))
+    elif 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({'error': 'ids must be a list of notification ids'}, status=status.HTTP_400_BAD_REQUEST)
+        selected = selected.filter(id__in=ids)
+    elif data.get('all') is not True:
+        return Response({'error': 'Provide ids, before or all'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    marked = notifications.mark_read(request.user.id, selected)
+    return Response({'marked': marked, 'unread_count': notifications.unread_count(request.user.id)})
+
+
+def _stream_user(request):
+    """
+    ``(user, token expiry, auth stamp)`` from the JWT in the Authorization
+    header or, for EventSource clients that cannot set headers, ?token=
+    """
+    authenticator = authentication.CachedJWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else request.GET.get('token', '').encode()
+    if not raw_token:
+        return None
+    try:
+        token = authenticator.get_validated_token(raw_token)
+        # Stamped before the user is loaded, so a change made in between still ends the stream
+        user_id = token.get(jwt_settings.USER_ID_CLAIM)
+        auth_stamp = authentication.stamp(user_id) if user_id is not None else None
+        user = authenticator.get_user(token)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+    return user, token.get('exp'), auth_stamp
+
+
+async def notification_stream(request):
+    """Server-Sent Events stream of the user's new notifications (needs an ASGI server)"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    # A WSGI server drains the whole async stream before sending any of it
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Notification streams need an ASGI server (e.g. uvicorn core.asgi:application)'}, status=501,
+        )
+    authorized = await sync_to_async(_stream_user)(request)
+    if authorized is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid'}, status=401)
+    user, expires_at, auth_stamp = authorized
+    
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return JsonResponse({'error': 'Last-Event-ID must be a notification id'}, status=400)
+    
+    response = StreamingHttpResponse(
+        events.stream(user.id, last_id, expires_at, auth_stamp), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # Public Views
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@response_cache.cached(lambda request: ('', ['genres']), public=True)
 def get_genres(request):
     """Get all available genres"""
     genres = Genre.objects.all()
@@ -333,25 +655,179 @@ def get_genres(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocomplete_catalog(request):
+    """Search-as-you-type suggestions from approved track titles, artists and genres"""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Search query (q) is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    kinds = request.query_params.get('types')
+    kinds = tuple(dict.fromkeys(kinds.split(','))) if kinds else autocomplete.KINDS
+    if not set(kinds) <= set(autocomplete.KINDS):
+        return Response({'error': f'types must be drawn from {", ".join(autocomplete.KINDS)}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    max_limit = autocomplete.get_config()['MAX_LIMIT']
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), max_limit)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'results': autocomplete.index.suggest(query, limit, kinds)})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def related_tracks(request, track_id):
+    """Approved tracks most often played in the same sessions as this one"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), recommendations.get_config()['TOP_K'])
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    neighbors = recommendations.related(track_id, limit)
+    results = []
+    for neighbor in neighbors:
+        data = TrackSerializer(neighbor.neighbor).data
+        data['score'] = neighbor.score
+        results.append(data)
+    return Response({'results': results})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def trending_chart(request, genre_id=None):
+    """Tracks with the highest time-decayed play counts, globally or in one genre"""
+    config = trending.get_config()
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), config['CHART_SIZE'])
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = []
+    for track, score in trending.chart(genre_id, limit):
+        data = TrackSerializer(track).data
+        data['trending_score'] = score
+        results.append(data)
+    response = Response({'half_life_hours': config['HALF_LIFE_HOURS'], 'results': results})
+    response['Cache-Control'] = f"public, max-age={config['CACHE_SECONDS']}"
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def record_play(request, track_id):
     """Record a track play for analytics"""
-    try:
-        track = Track.objects.get(id=track_id)
-        
-        # Record play
-        PlayHistory.objects.create(
-            track=track,
-            listener=request.user if request.user.user_type == 'listener' else None,
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
+    if not Track.objects.filter(id=track_id).exists():
+        return Response({'error': 'Track not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # Buffered; PlayHistory and play_count are written on the next flush
+    plays.record(
+        track_id,
+        listener_id=request.user.id if request.user.user_type == 'listener' else None,
+        ip_address=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')
+    )
+    
+    return Response({'message': 'Play recorded'})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def record_play_batch(request):
+    """Record many plays, e.g. buffered offline by a mobile client"""
+    items = request.data.get('plays') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'plays must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    max_items = plays.get_config()['MAX_BATCH_ITEMS']
+    if len(items) > max_items:
+        return Response(
+            {'error': f'At most {max_items} plays can be reported per batch'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        
-        # Update play count
-        track.play_count += 1
-        track.save()
-        
-        return Response({'message': 'Play recorded'})
+    
+    listener_id = request.user.id if request.user.user_type == 'listener' else None
+    valid, results, live_tracks = plays.validate_batch(
+        items,
+        listener_id=listener_id,
+        ip_address=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')
+    )
+    plays.apply_plays(valid, live_tracks=live_tracks)
+    
+    return Response({
+        'recorded': len(valid),
+        'failed': len(results) - len(valid),
+        'results': results,
+    })
+
+
+# Analytics Views
+# Served from the rollup tables maintained by `manage.py rollup_plays`, never
+# from raw PlayHistory.
+MAX_SERIES_DAYS = {'hour': 31, 'day': 366}
+
+
+def _play_series(request, model, granularity='day', **key):
+    try:
+        start, end = rollups.parse_range(request.query_params)
+    except ValueError:
+        return Response({'error': 'start and end must be YYYY-MM-DD dates with start <= end'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    if (end - start).days + 1 > MAX_SERIES_DAYS[granularity]:
+        return Response({'error': f'At most {MAX_SERIES_DAYS[granularity]} days per {granularity}ly series'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    if granularity == 'hour':
+        low, high = rollups.hourly_bounds(start, end)
+    else:
+        low, high = start, end + timedelta(days=1)
+    
+    return Response({
+        'granularity': granularity,
+        'start': start,
+        'end': end,
+        'series': rollups.series(model, low, high, **key),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@routers.use_replica
+def get_track_play_series(request, track_id):
+    """Hourly or daily play counts for a track"""
+    try:
+        artist_id = Track.objects.values_list('artist_id', flat=True).get(id=track_id)
     except Track.DoesNotExist:
         return Response({'error': 'Track not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not request.user.is_staff and artist_id != request.user.id:
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    granularity = request.query_params.get('granularity', 'day')
+    if granularity not in MAX_SERIES_DAYS:
+        return Response({'error': 'granularity must be hour or day'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    model = TrackHourlyPlays if granularity == 'hour' else TrackDailyPlays
+    return _play_series(request, model, granularity, track_id=track_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@routers.use_replica
+def get_artist_play_series(request, artist_id):
+    """Daily play counts across all of an artist's tracks"""
+    if not request.user.is_staff and artist_id != request.user.id:
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    return _play_series(request, ArtistDailyPlays, artist_id=artist_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@routers.use_replica
+def get_genre_play_series(request, genre_id):
+    """Daily play counts across a genre"""
+    return _play_series(request, GenreDailyPlays, genre_id=genre_id)
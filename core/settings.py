@@ -57,6 +57,8 @@ AUTH_USER_MODEL = 'api.User'
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.admission.AdmissionControlMiddleware',
+    'api.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,11 +91,44 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from DB_* variables (DB_ENGINE, DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT, DB_CONN_MAX_AGE). DB_REPLICAS lists read-replica aliases;
+# each takes DB_<ALIAS>_* overrides of the primary's values, e.g.
+# DB_REPLICAS=replica DB_REPLICA_HOST=... (see api/routers.py).
+def database_settings(prefix=None):
+    def env(name, default=''):
+        value = os.getenv(f'DB_{name}', default)
+        return os.getenv(f'DB_{prefix}_{name}', value) if prefix else value
+    
+    return {
+        'ENGINE': env('ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': env('NAME', str(BASE_DIR / 'db.sqlite3')),
+        'USER': env('USER'),
+        'PASSWORD': env('PASSWORD'),
+        'HOST': env('HOST'),
+        'PORT': env('PORT'),
+        # Persistent connections, checked before reuse
+        'CONN_MAX_AGE': int(env('CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
+
+
+DATABASE_REPLICAS = [alias.strip() for alias in os.getenv('DB_REPLICAS', '').split(',') if alias.strip()]
+
+DATABASES = {
+    'default': database_settings(),
+    **{
+        # Tests read replicas through the primary's test database
+        alias: {**database_settings(alias.upper()), 'TEST': {'MIRROR': 'default'}}
+        for alias in DATABASE_REPLICAS
+    },
+}
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+DATABASE_ROUTING = {
+    'REPLICAS': DATABASE_REPLICAS,
+    'PIN_SECONDS': int(os.getenv('DB_REPLICA_PIN_SECONDS', '10')),
 }
 
 
@@ -141,7 +176,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -150,6 +185,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Upper bound for the ?page_size= override on keyset-paginated list endpoints
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '100'))
+
 # JWT Settings
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -189,3 +227,181 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Static files configuration
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Play ingestion buffer (api/plays.py). Plays are journaled to JOURNAL_DIR and
+# flushed to the database every MAX_SIZE plays or FLUSH_INTERVAL seconds.
+PLAY_BUFFER = {
+    'MAX_SIZE': int(os.getenv('PLAY_BUFFER_MAX_SIZE', '500')),
+    'FLUSH_INTERVAL': float(os.getenv('PLAY_BUFFER_FLUSH_INTERVAL', '5')),
+    'JOURNAL_DIR': os.getenv('PLAY_JOURNAL_DIR', os.path.join(BASE_DIR, 'var', 'play_journal')),
+    'FSYNC': os.getenv('PLAY_JOURNAL_FSYNC', 'False').lower() == 'true',
+    'RECOVERY_GRACE': int(os.getenv('PLAY_JOURNAL_RECOVERY_GRACE', '60')),
+    # POST /api/plays/batch/ limits
+    'MAX_BATCH_ITEMS': int(os.getenv('PLAY_BATCH_MAX_ITEMS', '5000')),
+    'MAX_CLOCK_SKEW': int(os.getenv('PLAY_BATCH_MAX_CLOCK_SKEW', '300')),
+}
+
+# Analytics rollups (api/rollups.py, `manage.py rollup_plays`). Runs only fold
+# plays whose ids were seen at least SETTLE_SECONDS ago, which must be longer
+# than any transaction writing plays, so none committing late is skipped.
+ROLLUPS = {
+    'SETTLE_SECONDS': int(os.getenv('ROLLUPS_SETTLE_SECONDS', '60')),
+}
+
+# Cold archival of old plays (api/archive.py, `manage.py archive_plays`)
+PLAY_ARCHIVE = {
+    'DIR': os.getenv('PLAY_ARCHIVE_DIR', os.path.join(BASE_DIR, 'var', 'play_archive')),
+    'RETENTION_DAYS': int(os.getenv('PLAY_ARCHIVE_RETENTION_DAYS', '90')),
+    'BATCH_SIZE': int(os.getenv('PLAY_ARCHIVE_BATCH_SIZE', '5000')),
+}
+
+# Serve /api/admin/stats/ from transactionally maintained counters instead of
+# aggregating Track/User on every request. Run `manage.py reconcile_stats`
+# once after enabling to initialize them.
+STATS_COUNTER_CACHE = os.getenv('STATS_COUNTER_CACHE', 'False').lower() == 'true'
+
+# Audio streaming (/api/music/tracks/<id>/stream/). Set AUDIO_STREAM_OFFLOAD to
+# 'x-accel-redirect' (nginx, with an internal location at
+# AUDIO_STREAM_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache,
+# lighttpd) to let the front-end server send the bytes.
+AUDIO_STREAM_OFFLOAD = os.getenv('AUDIO_STREAM_OFFLOAD') or None
+AUDIO_STREAM_ACCEL_PREFIX = os.getenv('AUDIO_STREAM_ACCEL_PREFIX', '/protected-media/')
+
+# Resumable chunked uploads (api/uploads.py, `manage.py cleanup_uploads`)
+CHUNKED_UPLOADS = {
+    'DIR': os.getenv('CHUNKED_UPLOAD_DIR', os.path.join(BASE_DIR, 'var', 'uploads')),
+    'CHUNK_SIZE': int(os.getenv('CHUNKED_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024))),
+    'MIN_CHUNK_SIZE': int(os.getenv('CHUNKED_UPLOAD_MIN_CHUNK_SIZE', str(256 * 1024))),
+    'MAX_CHUNK_SIZE': int(os.getenv('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', str(32 * 1024 * 1024))),
+    'MAX_FILE_SIZE': int(os.getenv('CHUNKED_UPLOAD_MAX_FILE_SIZE', str(1024 * 1024 * 1024))),
+    'SESSION_TTL_HOURS': int(os.getenv('CHUNKED_UPLOAD_SESSION_TTL_HOURS', '24')),
+}
+
+# Background media processing (api/jobs.py, `manage.py run_worker`). Analysis
+# runs in a pool of CONCURRENCY processes; failed jobs are retried
+# MAX_ATTEMPTS times with exponential backoff starting at RETRY_BACKOFF seconds.
+JOB_WORKER = {
+    'CONCURRENCY': int(os.getenv('JOB_WORKER_CONCURRENCY', str(os.cpu_count() or 1))),
+    'POLL_INTERVAL': float(os.getenv('JOB_WORKER_POLL_INTERVAL', '1.0')),
+    'MAX_ATTEMPTS': int(os.getenv('JOB_WORKER_MAX_ATTEMPTS', '3')),
+    'LEASE_SECONDS': int(os.getenv('JOB_WORKER_LEASE_SECONDS', '600')),
+    'RETRY_BACKOFF': int(os.getenv('JOB_WORKER_RETRY_BACKOFF', '30')),
+}
+
+# Resized cover art / profile pictures (api/images.py). Rendered by the job
+# worker after upload and on demand into a disk cache under MEDIA_ROOT.
+IMAGE_DERIVATIVES = {
+    'QUALITY': int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '82')),
+    'CACHE_MAX_BYTES': int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024))),
+    'SWEEP_SECONDS': int(os.getenv('IMAGE_CACHE_SWEEP_SECONDS', '300')),
+}
+
+# Acoustic fingerprints for duplicate detection (api/fingerprint.py). A match
+# needs MIN_MATCHES time-aligned landmark hashes; TOP_K matches are kept.
+FINGERPRINT = {
+    'MIN_MATCHES': int(os.getenv('FINGERPRINT_MIN_MATCHES', '8')),
+    'TOP_K': int(os.getenv('FINGERPRINT_TOP_K', '5')),
+}
+
+# In-process autocomplete (api/autocomplete.py). Each process applies catalog
+# edits every REFRESH_SECONDS and rebuilds (picking up play counts) every
+# REBUILD_SECONDS.
+AUTOCOMPLETE = {
+    'REFRESH_SECONDS': float(os.getenv('AUTOCOMPLETE_REFRESH_SECONDS', '2')),
+    'REBUILD_SECONDS': int(os.getenv('AUTOCOMPLETE_REBUILD_SECONDS', str(15 * 60))),
+    'SETTLE_SECONDS': int(os.getenv('AUTOCOMPLETE_SETTLE_SECONDS', '60')),
+}
+
+# "Listeners also played" recommendations (api/recommendations.py, built by
+# `manage.py build_recommendations`). Plays by one listener less than
+# SESSION_GAP seconds apart co-occur; TOP_K neighbours are kept per track.
+RECOMMENDATIONS = {
+    'SESSION_GAP': int(os.getenv('RECOMMENDATIONS_SESSION_GAP', str(30 * 60))),
+    'MIN_COUNT': int(os.getenv('RECOMMENDATIONS_MIN_COUNT', '2')),
+    'TOP_K': int(os.getenv('RECOMMENDATIONS_TOP_K', '20')),
+    'SETTLE_SECONDS': int(os.getenv('RECOMMENDATIONS_SETTLE_SECONDS', '60')),
+}
+
+# Trending charts (api/trending.py). A play's weight halves every
+# HALF_LIFE_HOURS; charts keep the top CHART_SIZE tracks and are cacheable for
+# CACHE_SECONDS.
+TRENDING = {
+    'HALF_LIFE_HOURS': float(os.getenv('TRENDING_HALF_LIFE_HOURS', '72')),
+    'CHART_SIZE': int(os.getenv('TRENDING_CHART_SIZE', '100')),
+    'CACHE_SECONDS': int(os.getenv('TRENDING_CACHE_SECONDS', '60')),
+    'REFRESH_SECONDS': int(os.getenv('TRENDING_REFRESH_SECONDS', '10')),
+}
+
+# Server-Sent Events notification stream (api/events.py), served under ASGI.
+# BACKEND fans published notifications out to open streams; the default only
+# reaches streams in the publishing process.
+NOTIFICATION_EVENTS = {
+    'BACKEND': os.getenv('NOTIFICATION_EVENTS_BACKEND', 'api.events.LocalBackend'),
+    'HEARTBEAT_SECONDS': int(os.getenv('NOTIFICATION_EVENTS_HEARTBEAT_SECONDS', '15')),
+}
+
+# Notification retention (api/notifications.py, `manage.py prune_notifications`)
+NOTIFICATIONS = {
+    'READ_RETENTION_DAYS': int(os.getenv('NOTIFICATION_READ_RETENTION_DAYS', '90')),
+    'UNREAD_RETENTION_DAYS': int(os.getenv('NOTIFICATION_UNREAD_RETENTION_DAYS', '365')),
+}
+
+# ISRC allocation (api/isrc.py). REGISTRANT is the country and registrant code
+# (e.g. USABC); each process reserves BLOCK_SIZE designation codes at a time.
+# With ASSIGN_ON_APPROVAL, approving a track without an ISRC issues one.
+ISRC = {
+    'REGISTRANT': os.getenv('ISRC_REGISTRANT', ''),
+    'BLOCK_SIZE': int(os.getenv('ISRC_BLOCK_SIZE', '100')),
+    'ASSIGN_ON_APPROVAL': os.getenv('ISRC_ASSIGN_ON_APPROVAL', 'False').lower() == 'true',
+}
+
+# Cached JWT users (api/authentication.py). Users are reused for up to TTL
+# seconds (0 disables) unless changed; a shared CACHES backend makes changes
+# visible to every process at once.
+AUTH_USER_CACHE = {
+    'TTL': int(os.getenv('AUTH_USER_CACHE_TTL', '60')),
+    'MAX_USERS': int(os.getenv('AUTH_USER_CACHE_MAX_USERS', '10000')),
+}
+
+# Admission control (api/admission.py). Endpoint classes get separate
+# concurrency limits and wait queues, auth endpoints a per-client rate limit;
+# override ADMISSION_CONTROL['CLASSES'] / ['ROUTES'] here to tune them.
+# Requests from ADMISSION_TRUSTED_PROXIES (the nginx proxy set up by
+# install.sh runs on this host) are rate limited by their X-Real-IP.
+ADMISSION_CONTROL = {
+    'ENABLED': os.getenv('ADMISSION_CONTROL_ENABLED', 'True').lower() == 'true',
+    'TRUSTED_PROXIES': [
+        proxy.strip() for proxy in os.getenv('ADMISSION_TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if proxy.strip()
+    ],
+}
+
+# Response cache for read endpoints (api/response_cache.py). Responses are
+# kept in CACHES['responses'] (in-memory LRU, or files under var/ with
+# RESPONSE_CACHE_BACKEND=file) for at most TTL seconds; public ones may be
+# cached by clients for MAX_AGE seconds.
+RESPONSE_CACHE_BACKENDS = {
+    'memory': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'var', 'response_cache'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        **RESPONSE_CACHE_BACKENDS[os.getenv('RESPONSE_CACHE_BACKEND', 'memory')],
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))},
+    },
+}
+
+RESPONSE_CACHE = {
+    'ENABLED': os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true',
+    'TTL': int(os.getenv('RESPONSE_CACHE_TTL', '300')),
+    'MAX_AGE': int(os.getenv('RESPONSE_CACHE_MAX_AGE', '60')),
+}
@@ -138,7 +138,7 @@ def test_get_artist_tracks(access_token):
     try:
         response = requests.get(f"{BASE_URL}/music/artist-tracks/", headers=headers)
         if response.status_code == 200:
-            tracks = response.json()
+            tracks = response.json()['results']
             print(f"✅ Retrieved {len(tracks)} tracks")
             for track in tracks:
                 print(f"   - {track['title']} ({track['status']})")
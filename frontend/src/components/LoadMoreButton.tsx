@@ -0,0 +1,24 @@
+interface LoadMoreButtonProps {
+  next: string | null;
+  loading: boolean;
+  onClick: () => void;
+}
+
+// Fetches the next page of a cursor-paginated list; hidden on the last page
+const LoadMoreButton = ({ next, loading, onClick }: LoadMoreButtonProps) => {
+  if (!next) return null;
+
+  return (
+    <div className="text-center mt-6">
+      <button
+        onClick={onClick}
+        disabled={loading}
+        className="bg-white/10 text-white px-6 py-2 rounded-lg hover:bg-white/20 transition-all duration-200 disabled:opacity-50"
+      >
+        {loading ? 'Loading...' : 'Load more'}
+      </button>
+    </div>
+  );
+};
+
+export default LoadMoreButton;
@@ -1,7 +1,8 @@
 import { useState, useEffect } from 'react';
 import { useAuthStore } from '../store/authStore';
-import { getPendingTracks, updateTrackStatus, getAdminStats } from '../services/api';
+import { getPendingTracks, getAllTracks, updateTrackStatus, getAdminStats } from '../services/api';
 import { Shield, Music, CheckCircle, Clock, BarChart3, User, LogOut } from 'lucide-react';
+import LoadMoreButton from '../components/LoadMoreButton';
 
 interface Track {
   id: string;
@@ -26,11 +27,23 @@ interface AdminStats {
   total_artists: number;
 }
 
+// Each tab pages through its own server-side list
+type TrackList = 'pending' | 'all';
+
+interface TrackPage {
+  tracks: Track[];
+  next: string | null;
+}
+
+const TRACK_LISTS = { pending: getPendingTracks, all: getAllTracks };
+const EMPTY_PAGE: TrackPage = { tracks: [], next: null };
+
 const AdminDashboard = () => {
   const { user, logout } = useAuthStore();
-  const [tracks, setTracks] = useState<Track[]>([]);
+  const [lists, setLists] = useState<Record<TrackList, TrackPage>>({ pending: EMPTY_PAGE, all: EMPTY_PAGE });
   const [stats, setStats] = useState<AdminStats | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [activeTab, setActiveTab] = useState('overview');
   const [selectedTrack, setSelectedTrack] = useState<Track | null>(null);
   const [updateForm, setUpdateForm] = useState({
@@ -47,11 +60,15 @@ const AdminDashboard = () => {
   const loadData = async () => {
     try {
       setLoading(true);
-      const [tracksResponse, statsResponse] = await Promise.all([
+      const [pendingResponse, allResponse, statsResponse] = await Promise.all([
         getPendingTracks(),
+        getAllTracks(),
         getAdminStats(),
       ]);
-      setTracks(tracksResponse.data);
+      setLists({
+        pending: { tracks: pendingResponse.data.results, next: pendingResponse.data.next },
+        all: { tracks: allResponse.data.results, next: allResponse.data.next },
+      });
       setStats(statsResponse.data);
     } catch (error) {
       console.error('Failed to load data:', error);
@@ -60,6 +77,23 @@ const AdminDashboard = () => {
     }
   };
 
+  const loadMore = async (list: TrackList) => {
+    const next = lists[list].next;
+    if (!next) return;
+    try {
+      setLoadingMore(true);
+      const response = await TRACK_LISTS[list](next);
+      setLists((current) => ({
+        ...current,
+        [list]: { tracks: [...current[list].tracks, ...response.data.results], next: response.data.next },
+      }));
+    } catch (error) {
+      console.error('Failed to load more tracks:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleStatusUpdate = async (trackId: string) => {
     try {
       await updateTrackStatus(trackId, updateForm);
@@ -240,50 +274,49 @@ const AdminDashboard = () => {
           <div className="bg-glass-white backdrop-blur-md rounded-xl p-8 border border-white/20">
             <h2 className="text-2xl font-bold text-white mb-6">Tracks Pending Review</h2>
             
-            {tracks.filter(track => track.status === 'pending').length === 0 ? (
+            {lists.pending.tracks.length === 0 ? (
               <div className="text-center py-12">
                 <CheckCircle className="w-16 h-16 text-green-400/30 mx-auto mb-4" />
                 <p className="text-white/70">No tracks pending review. All caught up!</p>
               </div>
             ) : (
               <div className="space-y-4">
-                {tracks
-                  .filter(track => track.status === 'pending')
-                  .map((track) => (
-                    <div key={track.id} className="bg-white/5 rounded-lg p-6 border border-white/10">
-                      <div className="flex items-center justify-between">
-                        <div className="flex-1">
-                          <h3 className="text-lg font-semibold text-white mb-2">{track.title}</h3>
-                          <p className="text-white/70 mb-2">Artist: {track.artist}</p>
-                          <p className="text-white/70 mb-2">Email: {track.artist_email}</p>
-                          <div className="flex items-center space-x-4 text-sm">
-                            <span className="text-white/60">Genre: {track.genre}</span>
-                            <span className="text-white/60">Release: {track.release_date}</span>
-                            <span className="text-white/60">Uploaded: {new Date(track.upload_date).toLocaleDateString()}</span>
-                          </div>
-                          {track.lyrics && (
-                            <div className="mt-3">
-                              <p className="text-white/60 text-sm mb-1">Lyrics Preview:</p>
-                              <p className="text-white/80 text-sm line-clamp-2">{track.lyrics}</p>
-                            </div>
-                          )}
-                        </div>
-                        <div className="flex flex-col items-end space-y-2">
-                          <span className={`px-3 py-1 rounded-full text-xs font-medium ${getStatusColor(track.status)}`}>
-                            {getStatusText(track.status)}
-                          </span>
-                          <button
-                            onClick={() => openUpdateModal(track)}
-                            className="bg-gradient-to-r from-primary-500 to-secondary-500 text-white px-4 py-2 rounded-lg hover:from-primary-600 hover:to-secondary-600 transition-all duration-200"
-                          >
-                            Review Track
-                          </button>
+                {lists.pending.tracks.map((track) => (
+                  <div key={track.id} className="bg-white/5 rounded-lg p-6 border border-white/10">
+                    <div className="flex items-center justify-between">
+                      <div className="flex-1">
+                        <h3 className="text-lg font-semibold text-white mb-2">{track.title}</h3>
+                        <p className="text-white/70 mb-2">Artist: {track.artist}</p>
+                        <p className="text-white/70 mb-2">Email: {track.artist_email}</p>
+                        <div className="flex items-center space-x-4 text-sm">
+                          <span className="text-white/60">Genre: {track.genre}</span>
+                          <span className="text-white/60">Release: {track.release_date}</span>
+                          <span className="text-white/60">Uploaded: {new Date(track.upload_date).toLocaleDateString()}</span>
                         </div>
+                        {track.lyrics && (
+                          <div className="mt-3">
+                            <p className="text-white/60 text-sm mb-1">Lyrics Preview:</p>
+                            <p className="text-white/80 text-sm line-clamp-2">{track.lyrics}</p>
+                          </div>
+                        )}
+                      </div>
+                      <div className="flex flex-col items-end space-y-2">
+                        <span className={`px-3 py-1 rounded-full text-xs font-medium ${getStatusColor(track.status)}`}>
+                          {getStatusText(track.status)}
+                        </span>
+                        <button
+                          onClick={() => openUpdateModal(track)}
+                          className="bg-gradient-to-r from-primary-500 to-secondary-500 text-white px-4 py-2 rounded-lg hover:from-primary-600 hover:to-secondary-600 transition-all duration-200"
+                        >
+                          Review Track
+                        </button>
                       </div>
                     </div>
-                  ))}
+                  </div>
+                ))}
               </div>
             )}
+            <LoadMoreButton next={lists.pending.next} loading={loadingMore} onClick={() => loadMore('pending')} />
           </div>
         )}
 
@@ -293,7 +326,7 @@ const AdminDashboard = () => {
             <h2 className="text-2xl font-bold text-white mb-6">All Tracks</h2>
             
             <div className="space-y-4">
-              {tracks.map((track) => (
+              {lists.all.tracks.map((track) => (
                 <div key={track.id} className="bg-white/5 rounded-lg p-6 border border-white/10">
                   <div className="flex items-center justify-between">
                     <div className="flex-1">
@@ -332,6 +365,7 @@ const AdminDashboard = () => {
                 </div>
               ))}
             </div>
+            <LoadMoreButton next={lists.all.next} loading={loadingMore} onClick={() => loadMore('all')} />
           </div>
         )}
       </div>
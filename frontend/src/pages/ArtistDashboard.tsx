@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react';
 import { useAuthStore } from '../store/authStore';
 import { uploadMusic, getArtistTracks } from '../services/api';
 import { Music, Upload, BarChart3, User, LogOut } from 'lucide-react';
+import LoadMoreButton from '../components/LoadMoreButton';
 
 interface Track {
   id: string;
@@ -17,6 +18,8 @@ interface Track {
 const ArtistDashboard = () => {
   const { user, logout } = useAuthStore();
   const [tracks, setTracks] = useState<Track[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [uploadForm, setUploadForm] = useState({
     title: '',
     artist: '',
@@ -35,12 +38,27 @@ const ArtistDashboard = () => {
   const loadTracks = async () => {
     try {
       const response = await getArtistTracks();
-      setTracks(response.data);
+      setTracks(response.data.results);
+      setNextPage(response.data.next);
     } catch (error) {
       console.error('Failed to load tracks:', error);
     }
   };
 
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      setLoadingMore(true);
+      const response = await getArtistTracks(nextPage);
+      setTracks((current) => [...current, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      console.error('Failed to load more tracks:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleFileSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files[0]) {
       setSelectedFile(e.target.files[0]);
@@ -364,6 +382,7 @@ const ArtistDashboard = () => {
                 ))}
               </div>
             )}
+            <LoadMoreButton next={nextPage} loading={loadingMore} onClick={loadMore} />
           </div>
         )}
       </div>
@@ -86,8 +86,14 @@ export const uploadMusic = (formData: FormData) =>
     },
   });
 
-export const getArtistTracks = () =>
-  api.get('/music/artist-tracks/');
+// Paginated lists return { results, next }: pass `next` back in to get the following page
+const LIST_PAGE_SIZE = 100;
+
+const getPage = (path: string, next?: string | null) =>
+  next ? api.get(next) : api.get(path, { params: { page_size: LIST_PAGE_SIZE } });
+
+export const getArtistTracks = (next?: string | null) =>
+  getPage('/music/artist-tracks/', next);
 
 export const getTrack = (trackId: string) =>
   api.get(`/music/tracks/${trackId}/`);
@@ -99,11 +105,11 @@ export const deleteTrack = (trackId: string) =>
   api.delete(`/music/tracks/${trackId}/`);
 
 // Admin endpoints
-export const getPendingTracks = () =>
-  api.get('/admin/pending-tracks/');
+export const getPendingTracks = (next?: string | null) =>
+  getPage('/admin/pending-tracks/', next);
 
-export const getAllTracks = () =>
-  api.get('/admin/all-tracks/');
+export const getAllTracks = (next?: string | null) =>
+  getPage('/admin/all-tracks/', next);
 
 export const updateTrackStatus = (trackId: string, statusData: {
   status: string;
@@ -2,7 +2,7 @@
 diff --git a/install.sh b/install.sh
 --- a/install.sh
 +++ b/install.sh
-@@ -0,0 +1,303 @@
+@@ -0,0 +1,324 @@
 +#!/bin/bash
 +
 +echo "🚀 شروع نصب Music Platform..."
@@ -227,7 +227,25 @@ diff --git a/install.sh b/install.sh
 +User=root
 +WorkingDirectory=/var/www/music-platform/backend
 +Environment=PATH=/var/www/music-platform/backend/venv/bin
-+ExecStart=/var/www/music-platform/backend/venv/bin/python manage.py runserver 0.0.0.0:8000
++ExecStart=/var/www/music-platform/backend/venv/bin/uvicorn core.asgi:application --host 0.0.0.0 --port 8000
++Restart=always
++RestartSec=5
++
++[Install]
++WantedBy=multi-user.target
++EOF
++
++cat > /etc/systemd/system/music-worker.service << 'EOF'
++[Unit]
++Description=Music Platform Background Worker
++After=network.target postgresql.service
++
++[Service]
++Type=simple
++User=root
++WorkingDirectory=/var/www/music-platform/backend
++Environment=PATH=/var/www/music-platform/backend/venv/bin
++ExecStart=/var/www/music-platform/backend/venv/bin/python manage.py run_worker
 +Restart=always
 +RestartSec=5
 +
@@ -255,6 +273,7 @@ diff --git a/install.sh b/install.sh
 +# فعال‌سازی سرویس‌ها
 +systemctl daemon-reload
 +systemctl enable music-backend
++systemctl enable music-worker
 +systemctl enable music-frontend
 +
 +print_success "سرویس‌های systemd ایجاد شدند"
@@ -264,6 +283,7 @@ diff --git a/install.sh b/install.sh
 +
 +# راه‌اندازی سرویس‌ها
 +systemctl start music-backend
++systemctl start music-worker
 +systemctl start music-frontend
 +
 +# صبر برای راه‌اندازی
@@ -294,6 +314,7 @@ diff --git a/install.sh b/install.sh
 +echo "📁 مسیر پروژه: /var/www/music-platform"
 +echo "🔧 مدیریت سرویس‌ها:"
 +echo "   systemctl status music-backend"
++echo "   systemctl status music-worker"
 +echo "   systemctl status music-frontend"
 +echo ""
 +echo "📝 نکات مهم:"
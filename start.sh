@@ -47,7 +47,7 @@ fi
 
 # Start backend server in background
 echo "🚀 Starting Django backend server..."
-python manage.py runserver 0.0.0.0:8000 &
+uvicorn core.asgi:application --host 0.0.0.0 --port 8000 &
 BACKEND_PID=$!
 
 # Wait for backend to start
@@ -63,6 +63,11 @@ else
     exit 1
 fi
 
+# Start the background worker (analyzes uploads and moves them to pending review)
+echo "⚙️  Starting background worker..."
+python manage.py run_worker &
+WORKER_PID=$!
+
 # Navigate to frontend directory
 cd frontend
 
@@ -87,6 +92,7 @@ if curl -s http://localhost:5173 > /dev/null; then
 else
     echo "❌ Frontend server failed to start"
     kill $FRONTEND_PID 2>/dev/null
+    kill $WORKER_PID 2>/dev/null
     kill $BACKEND_PID 2>/dev/null
     exit 1
 fi
@@ -105,6 +111,7 @@ cleanup() {
     echo ""
     echo "🛑 Stopping servers..."
     kill $FRONTEND_PID 2>/dev/null
+    kill $WORKER_PID 2>/dev/null
     kill $BACKEND_PID 2>/dev/null
     echo "✅ All servers stopped"
     exit 0